@@ -1,5 +1,8 @@
+from dataclasses import dataclass
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Mapping, Sequence, Tuple
+
+import numpy as np
 
 class SensorInput(BaseModel):
     """Datos provenientes de sensores o formulario (µg/m³, °C, %)"""
@@ -24,3 +27,124 @@ def to_fact_dict(inp: "SensorInput") -> Dict[str, Any]:
         "temp": inp.temp,
         "rh": inp.rh
     }
+
+
+# --- Validación columnar para cargas masivas -------------------------------
+# Aplica las mismas restricciones declaradas en SensorInput (ge/gt/le/lt) a
+# columnas completas de NumPy, sin construir un modelo por fila.
+
+SENSOR_FIELDS = tuple(SensorInput.model_fields)
+
+# Alias aceptados en los CSV para cada campo, en orden de preferencia.
+CSV_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "PM2_5_24h": ("PM2_5_24h", "pm25", "pm2_5"),
+    "PM10_24h": ("PM10_24h", "pm10"),
+    "NO2_24h": ("NO2_24h", "no2"),
+    "O3_8h": ("O3_8h", "o3"),
+    "SO2_24h": ("SO2_24h", "so2"),
+    "CO_24h": ("CO_24h", "co"),
+    "temp": ("temp", "temperatura"),
+    "rh": ("rh", "humedad"),
+}
+
+_BOUND_CHECKS = (
+    ("ge", np.greater_equal, "greater_than_equal", "greater than or equal to"),
+    ("gt", np.greater, "greater_than", "greater than"),
+    ("le", np.less_equal, "less_than_equal", "less than or equal to"),
+    ("lt", np.less, "less_than", "less than"),
+)
+
+
+def _field_constraints() -> Dict[str, List[Tuple[float, Any, str, str]]]:
+    out = {}
+    for name, field in SensorInput.model_fields.items():
+        checks = []
+        for meta in field.metadata:
+            for attr, op, err_type, text in _BOUND_CHECKS:
+                bound = getattr(meta, attr, None)
+                if bound is not None:
+                    checks.append((bound, op, err_type, f"Input should be {text} {bound}"))
+        out[name] = checks
+    return out
+
+
+SENSOR_CONSTRAINTS = _field_constraints()
+
+
+@dataclass(frozen=True)
+class RowError:
+    """Error de validación de una fila (índice dentro del lote)."""
+    row: int
+    field: str
+    value: Any
+    type: str
+    message: str
+
+
+@dataclass
+class ColumnValidation:
+    """Resultado de validate_columns: columnas float64 (NaN = faltante),
+    máscara de filas válidas y errores por fila."""
+    columns: Dict[str, np.ndarray]
+    valid: np.ndarray
+    errors: List[RowError]
+
+
+def parse_float_column(values: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """Convierte textos a float64 como parse_float, fila a fila.
+
+    Devuelve (valores, presente): vacío o no numérico -> NaN y presente=False
+    (equivale a None); un "nan" literal queda presente y no pasa las
+    restricciones, igual que en SensorInput.
+    """
+    arr = np.asarray(values, dtype=object)
+    present = (arr != "") & np.not_equal(arr, None)
+    try:
+        out = np.where(present, arr, "nan").astype(float)
+    except (ValueError, TypeError):
+        out = np.full(len(arr), np.nan)
+        for i in np.flatnonzero(present):
+            try:
+                out[i] = float(arr[i])
+            except (ValueError, TypeError):
+                present[i] = False
+    return out, present
+
+
+def validate_columns(
+    columns: Mapping[str, Any],
+    present: Optional[Mapping[str, np.ndarray]] = None,
+) -> ColumnValidation:
+    """Valida columnas de SensorInput con operaciones vectorizadas.
+
+    - columns: un arreglo por campo (faltan columnas -> todo None)
+    - present: máscara opcional por campo de valores informados; si no se
+      da, NaN se interpreta como faltante
+    """
+    n = None
+    cols: Dict[str, np.ndarray] = {}
+    for name in SENSOR_FIELDS:
+        if name in columns and columns[name] is not None:
+            col = np.asarray(columns[name], dtype=float).reshape(-1)
+            if n is not None and len(col) != n:
+                raise ValueError(f"La columna {name} tiene {len(col)} valores; se esperaban {n}.")
+            n = len(col)
+            cols[name] = col
+    n = n or 0
+
+    valid = np.ones(n, dtype=bool)
+    errors: List[RowError] = []
+    for name in SENSOR_FIELDS:
+        col = cols.get(name)
+        if col is None:
+            cols[name] = np.full(n, np.nan)
+            continue
+        has = present[name] if present is not None and name in present else ~np.isnan(col)
+        for bound, op, err_type, message in SENSOR_CONSTRAINTS[name]:
+            with np.errstate(invalid="ignore"):
+                bad = has & ~op(col, bound)
+            if bad.any():
+                valid &= ~bad
+                errors.extend(RowError(int(i), name, float(col[i]), err_type, message) for i in np.flatnonzero(bad))
+    errors.sort(key=lambda e: e.row)
+    return ColumnValidation(columns=cols, valid=valid, errors=errors)
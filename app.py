@@ -1,20 +1,113 @@
-from flask import Flask, render_template, request, redirect, url_for
+from flask import (
+    Blueprint, Flask, Response, abort, current_app, has_app_context, jsonify, make_response,
+    redirect, render_template, request, stream_with_context, url_for,
+)
+from markupsafe import Markup
 from inference_engine import AirExpertEngine, Fact
-from acquisition_module import SensorInput, to_fact_dict
+from acquisition_module import SensorInput, to_fact_dict, CSV_ALIASES
+from ingest import read_csv_chunks, evaluate_rows
 from database import (
     init_db,
     save_measurement,
     save_condition,
     save_context,
     save_full_record,
+    save_full_records,
     fetch_recent_context,
+    query_context,
+    fetch_rollups,
+    rebuild_rollups,
+    CONTEXT_COLUMNS,
 )
 
+from write_behind import WriteBehindQueue
+import database
+import history_log
+import metrics
+from history_export import FORMATS as EXPORT_FORMATS, export_history, iter_export
+from live_feed import BroadcastHub, HubFull
+
 from pathlib import Path
 from datetime import datetime
+import atexit
 import csv
+import functools
+import logging
+import queue
+import threading
+import time
+import uuid
+import weakref
+from contextlib import nullcontext
+
+import click
 
-app = Flask(__name__)
+CSV_IN = Path("data/initial_data.csv")
+CSV_OUT = Path("data/history.csv")
+HISTORY_LOG = Path("data/history_log")
+
+DEFAULT_CONFIG = dict(
+    # Persistencia diferida del POST /: la respuesta no espera a SQLite ni al CSV.
+    WRITE_BEHIND=False,
+    WRITE_BEHIND_MAX_QUEUE=10000,
+    WRITE_BEHIND_BATCH_SIZE=500,
+    WRITE_BEHIND_FLUSH_MS=50,
+    # Espera máxima con la cola llena antes de guardar de forma síncrona.
+    WRITE_BEHIND_PUT_TIMEOUT=1.0,
+    # Reintentos de un lote que falla; agotados, el lote va al archivo de
+    # spill y se vuelve a guardar al arrancar el escritor.
+    WRITE_BEHIND_RETRIES=3,
+    WRITE_BEHIND_SPILL_PATH=Path("data/write_behind.spill"),
+    # Métricas por etapa y endpoint /metrics de esta app; metrics.set_enabled(False)
+    # las apaga en todo el proceso.
+    METRICS=True,
+    # Carga inicial en segundo plano de SEED_CSV_PATH (otra vez si el archivo
+    # cambió; las filas ya guardadas se omiten).
+    SEED_CSV=True,
+    SEED_CSV_PATH=CSV_IN,
+    # Opciones del motor de esta app; se crea en su primera evaluación.
+    ENGINE_RULES_PATH=None,
+    ENGINE_CACHE_SIZE=0,
+    # Historial de GET / cacheado y revalidado con ETag; se invalida con
+    # cada escritura en la base, de este u otro proceso (database.write_version()).
+    HISTORY_CACHE=True,
+    HISTORY_SIZE=10,
+    # Feed en vivo GET /api/stream: máximo de clientes, eventos pendientes
+    # por cliente antes de descartarlo y segundos entre comentarios keepalive.
+    STREAM_MAX_SUBSCRIBERS=1000,
+    STREAM_QUEUE_SIZE=100,
+    STREAM_KEEPALIVE=15.0,
+)
+log = logging.getLogger(__name__)
+bp = Blueprint("air", __name__, cli_group=None)
+
+EVALUATIONS = metrics.REGISTRY.counter("air_evaluations_total", "Evaluaciones por nivel de calidad.")
+HISTORY_CACHE = metrics.REGISTRY.counter("air_history_cache_total", "Usos del historial cacheado de GET / por resultado.")
+REQUESTS = metrics.REGISTRY.counter("air_http_requests_total", "Peticiones HTTP por endpoint, método y estado.")
+# Feeds en vivo de todas las apps del proceso, para air_stream_subscribers.
+_hubs = weakref.WeakSet()
+metrics.REGISTRY.gauge(
+    "air_stream_subscribers", "Clientes conectados al feed en vivo.", lambda: sum(len(hub) for hub in _hubs)
+)
+metrics.REGISTRY.gauge("air_db_connections", "Conexiones SQLite abiertas en el pool.", database.pool_size)
+# Escritores diferidos de todas las apps del proceso, para air_write_behind_*.
+_writers = weakref.WeakSet()
+metrics.REGISTRY.gauge(
+    "air_write_behind_pending", "Registros en la cola de escritura diferida.",
+    lambda: sum(w.pending for w in _writers),
+)
+metrics.REGISTRY.gauge(
+    "air_write_behind_written", "Registros persistidos por el escritor diferido.",
+    lambda: sum(w.written for w in _writers),
+)
+metrics.REGISTRY.gauge(
+    "air_write_behind_failed", "Registros que el escritor diferido no pudo persistir.",
+    lambda: sum(w.failed for w in _writers),
+)
+metrics.REGISTRY.gauge(
+    "air_write_behind_spilled", "Registros que agotaron los reintentos y esperan en el archivo de spill.",
+    lambda: sum(w.spilled for w in _writers),
+)
 
 
 def parse_float(v):
@@ -24,34 +117,79 @@ def parse_float(v):
         return None
 
 
-engine = AirExpertEngine()
-init_db()
+class _LazyEngine:
+    """Crea el AirExpertEngine (lee air_rules.json) en el primer uso."""
 
-CSV_IN = Path("data/initial_data.csv")
-CSV_OUT = Path("data/history.csv")
-CSV_OUT_HEADERS = [
-    "timestamp",
-    "zona",
-    "evento_biomasa",
-    "quality_level",
-    "pm2_5",
-    "pm10",
-    "no2",
-    "o3",
-    "so2",
-    "co",
-    "temp",
-    "rh",
-    "v_viento",
-]
-
-
-def append_to_csv(medida: dict, condicion: dict, contexto: dict, quality_label: str):
-    """Anexa cada evaluación a data/history.csv."""
-    CSV_OUT.parent.mkdir(parents=True, exist_ok=True)
-    now = datetime.now().isoformat(timespec="seconds")
-    row = {
-        "timestamp": now,
+    def __init__(self, **options):
+        self._engine = None
+        self._options = options
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._engine is not None
+
+    def get(self) -> AirExpertEngine:
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = AirExpertEngine(**self._options)
+        return self._engine
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+class _AppEngine:
+    """Motor de la app activa (app.extensions["air_engine"], con sus
+    ENGINE_*); fuera de una app, uno con las opciones por defecto."""
+
+    def __init__(self):
+        self._default = _LazyEngine()
+
+    def _current(self) -> _LazyEngine:
+        if has_app_context():
+            return current_app.extensions["air_engine"]
+        return self._default
+
+    @property
+    def loaded(self) -> bool:
+        return self._current().loaded
+
+    def get(self) -> AirExpertEngine:
+        return self._current().get()
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+engine = _AppEngine()
+
+
+def stage(name: str):
+    """metrics.stage() si la app activa tiene METRICS."""
+    return metrics.stage(name) if current_app.config["METRICS"] else nullcontext()
+
+_db_ready = False
+_db_lock = threading.Lock()
+
+
+def ensure_db() -> None:
+    """Ejecuta init_db() una sola vez por proceso, en el primer uso."""
+    global _db_ready
+    if not _db_ready:
+        with _db_lock:
+            if not _db_ready:
+                init_db()
+                _db_ready = True
+
+
+CSV_OUT_HEADERS = history_log.CSV_HEADERS
+
+
+def _history_row(medida: dict, condicion: dict, contexto: dict, quality_label: str, timestamp: str = None) -> dict:
+    return {
+        "timestamp": timestamp or datetime.now().isoformat(timespec="seconds"),
         "zona": contexto.get("zona"),
         "evento_biomasa": contexto.get("evento_biomasa"),
         "quality_level": quality_label,
@@ -65,113 +203,510 @@ def append_to_csv(medida: dict, condicion: dict, contexto: dict, quality_label:
         "rh": condicion.get("humedad"),
         "v_viento": condicion.get("v_viento"),
     }
-    write_header = not CSV_OUT.exists()
-    with open(CSV_OUT, "a", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=CSV_OUT_HEADERS)
-        if write_header:
-            w.writeheader()
-        w.writerow({k: ("" if v is None else v) for k, v in row.items()})
 
 
-def load_csv_to_db(path: Path = CSV_IN) -> int:
-    """Carga data/initial_data.csv → evalúa con el motor → guarda en SQLite."""
+_history_log = None
+_history_log_lock = threading.Lock()
+
+
+def get_history_log() -> history_log.HistoryLog:
+    """Escritor del log binario HISTORY_LOG, abierto en el primer uso."""
+    global _history_log
+    with _history_log_lock:
+        if _history_log is None:
+            _history_log = history_log.HistoryLog(HISTORY_LOG)
+            atexit.register(_history_log.close)
+        return _history_log
+
+
+def append_rows_to_history(rows) -> None:
+    """Anexa varias filas (ver _history_row) al log binario del historial."""
+    get_history_log().append(rows)
+
+
+def append_to_history(medida: dict, condicion: dict, contexto: dict, quality_label: str):
+    """Anexa cada evaluación al log binario del historial (data/history_log)."""
+    append_rows_to_history([_history_row(medida, condicion, contexto, quality_label)])
+
+
+def persist_records(records, path: Path = None) -> None:
+    """Guarda un lote de (medida, condicion, contexto) en SQLite (en `path`,
+    por defecto la base activa) y en el log del historial. Las lecturas
+    que ya estaban guardadas (reintentos) no se vuelven a anexar."""
+    def history(saved):
+        append_rows_to_history(
+            _history_row(m, c, x, x.get("quality_level"), x.get("hora")) for m, c, x in saved
+        )
+
+    save_full_records(records, chunk_size=max(len(records), 1), path=path, on_saved=history)
+
+
+def _new_writer(config) -> WriteBehindQueue:
+    """Cola de escritura diferida con las opciones WRITE_BEHIND_* de una app.
+    Guarda en la base activa al crearla; el hilo arranca con el primer
+    registro y se vacía al cerrar el proceso."""
+    writer = WriteBehindQueue(
+        functools.partial(persist_records, path=database._DB_PATH),
+        max_size=config["WRITE_BEHIND_MAX_QUEUE"],
+        batch_size=config["WRITE_BEHIND_BATCH_SIZE"],
+        flush_interval=config["WRITE_BEHIND_FLUSH_MS"] / 1000,
+        retries=config["WRITE_BEHIND_RETRIES"],
+        spill_path=config["WRITE_BEHIND_SPILL_PATH"],
+    )
+    _writers.add(writer)
+    atexit.register(writer.close)
+    return writer
+
+
+def get_writer() -> WriteBehindQueue:
+    """Cola de escritura diferida de la app activa (app.extensions["air_writer"])."""
+    return current_app.extensions["air_writer"]
+
+
+def _sensor_input_from_row(row: dict) -> SensorInput:
+    """Construye SensorInput aceptando los alias de columnas del CSV."""
+    values = {}
+    for field, aliases in CSV_ALIASES.items():
+        raw = None
+        for name in aliases:
+            raw = row.get(name)
+            if raw:
+                break
+        values[field] = parse_float(raw)
+    return SensorInput(**values)
+
+
+def _record_from_row(row: dict):
+    """Valida y evalúa una fila del CSV → (medida, condicion, contexto)."""
+    data = _sensor_input_from_row(row)
+    fact = Fact(**to_fact_dict(data))
+    res = engine.evaluate(fact)
+
+    medida = {
+        "pm2_5": data.PM2_5_24h,
+        "pm10": data.PM10_24h,
+        "no2": data.NO2_24h,
+        "co": data.CO_24h,
+        "o3": data.O3_8h,
+        "so2": data.SO2_24h,
+    }
+    condicion = {
+        "temperatura": data.temp,
+        "humedad": data.rh,
+        "v_viento": None,
+    }
+    contexto = {
+        "zona": (row.get("zona") or None),
+        "hora": (row.get("hora") or None),
+        "evento_biomasa": int(row.get("evento_biomasa") or 0),
+        "quality_level": res.label,
+    }
+    return medida, condicion, contexto
+
+
+def load_csv_to_db(path: Path = CSV_IN, bulk: bool = False, chunk_size: int = 5000,
+                   errors: list = None, on_chunk=None) -> int:
+    """Carga data/initial_data.csv → evalúa con el motor → guarda en SQLite.
+
+    Con bulk=True lee el CSV en streaming por bloques de `chunk_size` filas,
+    los valida y evalúa en forma columnar (ingest.evaluate_rows) y los
+    guarda con una transacción por bloque sobre una sola conexión. Las filas
+    inválidas se omiten; sus errores se registran en el log y, si se pasa
+    una lista en `errors`, se agregan a ella (RowError). `on_chunk` recibe
+    el total de filas guardadas tras cada bloque.
+
+    Las filas sin hora se identifican por su número de fila en el archivo
+    (ver _row_key), así que volver a cargar el mismo CSV no las duplica.
+    """
     if not path.exists():
         return 0
+    if bulk:
+        return _load_csv_bulk(path, chunk_size, errors, on_chunk)
     count = 0
     with open(path, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
-        for row in reader:
-            data = SensorInput(
-                PM2_5_24h=parse_float(row.get("PM2_5_24h") or row.get("pm25") or row.get("pm2_5")),
-                PM10_24h=parse_float(row.get("PM10_24h") or row.get("pm10")),
-                NO2_24h=parse_float(row.get("NO2_24h") or row.get("no2")),
-                O3_8h=parse_float(row.get("O3_8h") or row.get("o3")),
-                SO2_24h=parse_float(row.get("SO2_24h") or row.get("so2")),
-                CO_24h=parse_float(row.get("CO_24h") or row.get("co")),
-                temp=parse_float(row.get("temp") or row.get("temperatura")),
-                rh=parse_float(row.get("rh") or row.get("humedad")),
-            )
-            fact = Fact(**to_fact_dict(data))
-            res = engine.evaluate(fact)
-
-            medida = {
-                "pm2_5": data.PM2_5_24h,
-                "pm10": data.PM10_24h,
-                "no2": data.NO2_24h,
-                "co": data.CO_24h,
-                "o3": data.O3_8h,
-                "so2": data.SO2_24h,
-            }
-            condicion = {
-                "temperatura": data.temp,
-                "humedad": data.rh,
-                "v_viento": None,
-            }
-            contexto = {
-                "zona": (row.get("zona") or None),
-                "evento_biomasa": int(row.get("evento_biomasa") or 0),
-                "quality_level": res.label,
-            }
+        for i, row in enumerate(reader):
+            medida, condicion, contexto = _record_from_row(row)
+            if not contexto["hora"]:
+                contexto["idempotency_key"] = _row_key(path, i)
             save_full_record(medida, condicion, contexto)
             count += 1
     return count
 
 
+def _row_key(path: Path, row: int) -> str:
+    """Clave de idempotencia de una fila sin hora de un CSV cargado."""
+    return f"carga:{path.resolve()}:{row}"
+
+
+def _load_csv_bulk(path: Path, chunk_size: int, errors: list = None, on_chunk=None) -> int:
+    start = time.perf_counter()
+
+    def report(total):
+        elapsed = time.perf_counter() - start
+        log.info("%s: %d filas (%.0f filas/s)", path, total, total / elapsed if elapsed else 0.0)
+        if on_chunk is not None:
+            on_chunk(total)
+
+    def records():
+        offset = 0
+        for rows in read_csv_chunks(path, chunk_size):
+            recs, errs = evaluate_rows(rows, engine, offset)
+            for e in errs:
+                log.warning("%s fila %d: %s=%r %s", path, e.row, e.field, e.value, e.message)
+            if errors is not None:
+                errors.extend(errs)
+            bad = {e.row for e in errs}
+            valid = (i for i in range(offset, offset + len(rows)) if i not in bad)
+            for (_, _, contexto), i in zip(recs, valid):
+                if not contexto["hora"]:
+                    contexto["idempotency_key"] = _row_key(path, i)
+            offset += len(rows)
+            yield from recs
+
+    return save_full_records(records(), chunk_size=chunk_size, on_chunk=report)
+
+
 def export_history_to_csv(path: Path = CSV_OUT, limit: int = 1000) -> int:
     """Exporta el join reciente (SQLite) a CSV_OUT."""
-    rows = fetch_recent_context(limit)
-    headers = [
-        "id",
-        "zona",
-        "hora",
-        "evento_biomasa",
-        "quality_level",
-        "pm2_5",
-        "pm10",
-        "no2",
-        "co",
-        "o3",
-        "so2",
-        "temperatura",
-        "humedad",
-        "v_viento",
-    ]
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(headers)
-        for r in rows:
-            w.writerow(r)
-    return len(rows)
-
-try:
-    if not fetch_recent_context(1) and CSV_IN.exists():
-        load_csv_to_db(CSV_IN)
-except Exception:
-    pass
-
-
-@app.route("/", methods=["GET", "POST"])
-def index():
-    result = None
+    return export_history(path, "csv", limit=limit)
+
+class SeedTask:
+    """Carga inicial de un CSV en segundo plano.
+
+    Se repite solo si el archivo cambió desde la última carga (huella de
+    nombre, tamaño y fecha en db_meta); la deduplicación de
+    save_full_records omite las filas que ya estaban guardadas. Una base
+    con lecturas y sin huella (creada antes de ella) no se vuelve a sembrar.
+
+    estado: pendiente → cargando → listo | error. `filas` avanza con cada
+    bloque guardado; las filas inválidas se omiten y se cuentan.
+    """
+
+    META_KEY = "seed_csv"
+
+    def __init__(self, path: Path = None):
+        self.path = path
+        self.app = None
+        self.state = "pendiente"
+        self.rows = 0
+        self.errors = []
+        self.error = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "listo"
+
+    def start(self) -> "SeedTask":
+        with self._lock:
+            if self._thread is None:
+                if has_app_context():  # evalúa con el motor de la app
+                    self.app = current_app._get_current_object()
+                self._thread = threading.Thread(target=self._run, name="air-seed", daemon=True)
+                self._thread.start()
+        return self
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _progress(self, total: int) -> None:
+        self.rows = total
+
+    def _run(self) -> None:
+        if self.app is None:
+            return self._load()
+        with self.app.app_context():
+            self._load()
 
+    def _load(self) -> None:
+        self.state = "cargando"
+        try:
+            ensure_db()
+            fingerprint = self._fingerprint()
+            stored = database.get_meta(self.META_KEY)
+            if fingerprint is not None and stored is None and fetch_recent_context(1):
+                # Base anterior a la huella: ya se sembró con la regla de
+                # entonces (solo si estaba vacía) y no se vuelve a cargar.
+                database.set_meta(self.META_KEY, fingerprint)
+            elif fingerprint is not None and stored != fingerprint:
+                log.info("Carga inicial de %s en segundo plano", self.path)
+                self.rows = load_csv_to_db(self.path, bulk=True, errors=self.errors, on_chunk=self._progress)
+                database.set_meta(self.META_KEY, fingerprint)
+                log.info("Carga inicial terminada: %d filas nuevas, %d inválidas", self.rows, len(self.errors))
+            self.state = "listo"
+        except Exception as e:
+            log.exception("Falló la carga inicial de %s", self.path)
+            self.error = f"{type(e).__name__}: {e}"
+            self.state = "error"
+        finally:
+            self._done.set()
+
+    def _fingerprint(self):
+        if self.path is None or not self.path.exists():
+            return None
+        st = self.path.stat()
+        return f"{self.path.name}:{st.st_size}:{st.st_mtime_ns}"
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "estado": self.state,
+            "filas": self.rows,
+            "filas_invalidas": len(self.errors),
+            "error": self.error,
+        }
+
+
+class HistoryCache:
+    """Fragmento HTML del historial de GET / (templates/_history.html).
+
+    Se vuelve a consultar y renderizar solo cuando cambió
+    database.write_version(): cambia con cada commit en la base, también
+    los de otros procesos (pasarela, follow-csv, CLI, otros workers), que
+    se detectan con PRAGMA data_version. El ETag lleva esa versión y un
+    token por proceso, porque data_version solo se puede comparar dentro
+    de una misma conexión.
+    """
+
+    def __init__(self, size: int = 10, enabled: bool = True):
+        self.size = size
+        self.enabled = enabled
+        self.token = uuid.uuid4().hex[:12]
+        self._entry = None  # (versión, fragmento)
+
+    def etag(self, version: tuple) -> str:
+        return f"{self.token}-{'.'.join(map(str, version))}"
+
+    def fragment(self, version: tuple) -> Markup:
+        entry = self._entry
+        if self.enabled and entry is not None and entry[0] == version:
+            if current_app.config["METRICS"]:
+                HISTORY_CACHE.inc(result="hit")
+            return entry[1]
+        if current_app.config["METRICS"]:
+            HISTORY_CACHE.inc(result="miss")
+        # `version` se leyó antes de consultar: si una escritura se cuela
+        # entre ambas, la entrada queda con una versión vieja y se renueva
+        # en la petición siguiente, nunca al revés.
+        with stage("fetch_history"):
+            history = fetch_recent_context(self.size)
+        with stage("render"):
+            html = Markup(render_template("_history.html", history=history))
+        self._entry = (version, html)
+        return html
+
+
+def create_app(config: dict = None) -> Flask:
+    """Crea la aplicación sin tocar el motor ni la base de datos.
+
+    El motor se crea en la primera evaluación y init_db() corre en la
+    primera petición, que además lanza la carga inicial en segundo plano
+    (ver GET /ready).
+    """
+    flask_app = Flask(__name__)
+    flask_app.config.update(DEFAULT_CONFIG)
+    if config:
+        flask_app.config.update(config)
+    # Todo lo que depende de la configuración queda en la app: crear otra
+    # no cambia las que ya existen.
+    flask_app.extensions["air_engine"] = _LazyEngine(
+        rules_path=flask_app.config["ENGINE_RULES_PATH"],
+        cache_size=flask_app.config["ENGINE_CACHE_SIZE"],
+    )
+    seed_path = flask_app.config["SEED_CSV_PATH"] if flask_app.config["SEED_CSV"] else None
+    flask_app.extensions["air_seed"] = SeedTask(Path(seed_path) if seed_path else None)
+    flask_app.extensions["air_history"] = HistoryCache(
+        flask_app.config["HISTORY_SIZE"], flask_app.config["HISTORY_CACHE"]
+    )
+    hub = flask_app.extensions["air_stream"] = BroadcastHub(
+        flask_app.config["STREAM_MAX_SUBSCRIBERS"], flask_app.config["STREAM_QUEUE_SIZE"]
+    )
+    _hubs.add(hub)
+    flask_app.extensions["air_writer"] = _new_writer(flask_app.config)
+    flask_app.register_blueprint(bp)
+    return flask_app
+
+
+@bp.before_app_request
+def _startup():
+    ensure_db()
+    current_app.extensions["air_seed"].start()
+
+
+@bp.cli.command("load-csv")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option("--chunk-size", default=5000, show_default=True, help="Filas por transacción.")
+def load_csv_command(path: Path, chunk_size: int):
+    """Carga masiva de un CSV de mediciones en SQLite."""
+    ensure_db()
+    start = time.perf_counter()
+    total = load_csv_to_db(path, bulk=True, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed else 0.0
+    click.echo(f"{total} filas cargadas en {elapsed:.2f} s ({rate:.0f} filas/s)")
+
+
+@bp.cli.command("ingest")
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option("--workers", type=int, default=None, help="Procesos evaluadores (por defecto, núcleos de la CPU).")
+@click.option("--block-mb", default=8.0, show_default=True, help="Tamaño de cada rango de bytes por tarea.")
+@click.option("--chunk-size", default=5000, show_default=True, help="Filas por transacción.")
+def ingest_command(paths, workers, block_mb, chunk_size):
+    """Carga paralela de uno o más CSV históricos en SQLite."""
+    from parallel_ingest import ingest_files
+
+    ensure_db()
+
+    def progress(stats):
+        click.echo(f"  {stats.rows} filas, {stats.saved} guardadas ({stats.rate:.0f} filas/s)")
+
+    stats = ingest_files(
+        paths, workers=workers, block_bytes=int(block_mb * (1 << 20)), chunk_size=chunk_size,
+        rules_path=engine.rules_path, on_progress=progress,
+    )
+    for pid, rate in sorted(stats.worker_rates().items()):
+        click.echo(f"  proceso {pid}: {stats.workers[pid][0]} filas ({rate:.0f} filas/s)")
+    click.echo(
+        f"{stats.saved} filas cargadas, {len(stats.errors)} inválidas, en {stats.elapsed:.2f} s "
+        f"({stats.rate:.0f} filas/s)"
+    )
+
+
+@bp.cli.command("follow-csv")
+@click.argument("paths", nargs=-1, required=True, type=click.Path(dir_okay=False, path_type=Path))
+@click.option("--interval", default=1.0, show_default=True, help="Segundos entre pasadas.")
+@click.option("--chunk-size", default=5000, show_default=True, help="Filas por transacción.")
+@click.option("--once", is_flag=True, help="Una sola pasada y termina.")
+def follow_csv_command(paths, interval, chunk_size, once):
+    """Sigue CSV que crecen y guarda solo las filas anexadas (se puede retomar)."""
+    from follow import follow, follow_once
+
+    ensure_db()
+
+    def report(path, stats):
+        if stats.rows or stats.truncations or stats.rotations:
+            click.echo(f"{path}: {stats.rows} filas nuevas, {stats.saved} guardadas, "
+                       f"{len(stats.errors)} inválidas")
+
+    if once:
+        for path in paths:
+            report(path, follow_once(path, engine.get(), chunk_size))
+        return
+    try:
+        follow(paths, engine.get(), interval=interval, chunk_size=chunk_size, on_pass=report)
+    except KeyboardInterrupt:
+        pass
+
+
+@bp.cli.command("retention")
+@click.option("--archive-after-days", type=int, default=90, show_default=True,
+              help="Mueve a archivos mensuales los meses completos más antiguos.")
+@click.option("--raw-retention-days", type=int, default=None,
+              help="Borra las filas crudas más antiguas (se conservan los agregados).")
+@click.option("--vacuum-pages", type=int, default=None, help="Páginas a liberar por archivo (por defecto, todas).")
+@click.option("--enable-incremental-vacuum", is_flag=True,
+              help="Convierte bases creadas sin auto_vacuum incremental (ejecuta VACUUM completo).")
+def retention_command(archive_after_days, raw_retention_days, vacuum_pages, enable_incremental_vacuum):
+    """Aplica la política de retención: archivado mensual, downsampling y vacuum."""
+    from retention import RetentionPolicy, apply_retention
+
+    ensure_db()
+    if enable_incremental_vacuum:
+        for path in database.enable_incremental_vacuum():
+            click.echo(f"{path}: auto_vacuum incremental activado")
+    report = apply_retention(RetentionPolicy(archive_after_days, raw_retention_days, vacuum_pages))
+    for mes, rows in report.archived.items():
+        click.echo(f"{mes}: {rows} filas archivadas")
+    click.echo(f"{report.downsampled} filas crudas borradas, {report.freed_pages} páginas liberadas")
+
+
+@bp.cli.command("rescore")
+@click.option("--chunk-size", default=5000, show_default=True, help="Lecturas por bloque (y por transacción).")
+@click.option("--restart", is_flag=True, help="Ignora el punto de control y empieza desde el principio.")
+def rescore_command(chunk_size, restart):
+    """Reevalúa las lecturas guardadas con las reglas actuales (se puede retomar)."""
+    from rescore import rescore
+
+    ensure_db()
+    start = time.perf_counter()
+    report = rescore(engine.get(), chunk_size=chunk_size, restart=restart)
+    if report.resumed:
+        click.echo("Retomado desde el último punto de control")
+    for (old, new), n in sorted(report.transitions.items(), key=lambda t: -t[1]):
+        click.echo(f"{old or '—'} → {new}: {n}")
+    click.echo(f"{report.scanned} lecturas reevaluadas, {report.changed} etiquetas cambiadas "
+               f"en {time.perf_counter() - start:.2f} s")
+
+
+@bp.cli.command("migrate-layout")
+@click.argument("layout", type=click.Choice(database.LAYOUTS))
+@click.option("--without-rowid", is_flag=True,
+              help="Formato ancho agrupado por id con índice cubriente (zona, hora).")
+def migrate_layout_command(layout, without_rowid):
+    """Convierte la base y sus archivos mensuales al formato normalizado o ancho."""
+    ensure_db()
+    start = time.perf_counter()
+    converted = database.migrate_layout(layout, without_rowid)
+    freed = database.incremental_vacuum()
+    click.echo(f"{converted} archivos convertidos a {layout} en {time.perf_counter() - start:.2f} s "
+               f"({freed} páginas liberadas)")
+
+
+@bp.cli.command("history-csv")
+@click.argument("out", default=str(CSV_OUT), type=click.Path(dir_okay=False, path_type=Path))
+def history_csv_command(out: Path):
+    """Convierte el log binario del historial al formato de history.csv."""
+    out.parent.mkdir(parents=True, exist_ok=True)
+    rows = history_log.to_csv(HISTORY_LOG, out)
+    click.echo(f"{rows} filas escritas en {out}")
+
+
+@bp.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Recalcula las tablas de agregados horarios/diarios desde cero."""
+    ensure_db()
+    start = time.perf_counter()
+    rebuild_rollups()
+    click.echo(f"Agregados recalculados en {time.perf_counter() - start:.2f} s")
+
+
+def _form_sensor_input(form) -> SensorInput:
+    return SensorInput(
+        PM2_5_24h=(parse_float(form.get("pm25"))
+                   or parse_float(form.get("pm2_5"))
+                   or parse_float(form.get("pm2_5_24h"))),
+        PM10_24h=(parse_float(form.get("pm10"))
+                  or parse_float(form.get("pm_10"))),
+        NO2_24h=parse_float(form.get("no2")),
+        O3_8h=parse_float(form.get("o3")),
+        SO2_24h=parse_float(form.get("so2")),
+        CO_24h=parse_float(form.get("co")),
+        temp=parse_float(form.get("temp")),
+        rh=parse_float(form.get("rh")),
+    )
+
+
+@bp.after_app_request
+def _count_request(response):
+    if current_app.config["METRICS"]:
+        REQUESTS.inc(endpoint=request.endpoint or "", method=request.method, status=str(response.status_code))
+    return response
+
+
+@bp.route("/", methods=["GET", "POST"])
+def index():
     if request.method == "POST":
-        data = SensorInput(
-            PM2_5_24h=(parse_float(request.form.get("pm25"))
-                       or parse_float(request.form.get("pm2_5"))
-                       or parse_float(request.form.get("pm2_5_24h"))),
-            PM10_24h=(parse_float(request.form.get("pm10"))
-                      or parse_float(request.form.get("pm_10"))),
-            NO2_24h=parse_float(request.form.get("no2")),
-            O3_8h=parse_float(request.form.get("o3")),
-            SO2_24h=parse_float(request.form.get("so2")),
-            CO_24h=parse_float(request.form.get("co")),
-            temp=parse_float(request.form.get("temp")),
-            rh=parse_float(request.form.get("rh")),
-        )
+        with stage("validate"):
+            data = _form_sensor_input(request.form)
 
-        fact = Fact(**to_fact_dict(data))
-        result = engine.evaluate(fact)
+        with stage("evaluate"):
+            fact = Fact(**to_fact_dict(data))
+            result = engine.evaluate(fact)
+        if current_app.config["METRICS"]:
+            EVALUATIONS.inc(level=result.label)
 
         zona = request.form.get("zona") or None
         evento = request.form.get("evento_biomasa")
@@ -200,15 +735,189 @@ def index():
             "evento_biomasa": evento_val,
             "quality_level": result.label,
         }
+        # Un reintento con la misma clave no guarda la lectura dos veces. Sin
+        # clave cada POST es una lectura nueva, aunque repita los valores:
+        # la hora la pone el servidor y no cuenta para deduplicar.
+        idem_key = request.headers.get("Idempotency-Key") or request.form.get("idempotency_key")
+        if idem_key:
+            contexto_extra["idempotency_key"] = idem_key
+
+        if current_app.config["WRITE_BEHIND"]:
+            contexto_extra["hora"] = datetime.now().isoformat(timespec="seconds")
+            # Con hora ya puesta la clave saldría de la lectura: una propia
+            # por petición mantiene la regla anterior y evita duplicar si el
+            # escritor reintenta el lote.
+            contexto_extra.setdefault("idempotency_key", f"post:{uuid.uuid4().hex}")
+            try:
+                get_writer().submit(
+                    (medida, condicion, contexto_extra),
+                    timeout=current_app.config["WRITE_BEHIND_PUT_TIMEOUT"],
+                )
+            except queue.Full:
+                log.warning("Cola de escritura llena; guardando de forma síncrona")
+                _save_sync(medida, condicion, contexto_extra, result.label)
+        else:
+            _save_sync(medida, condicion, contexto_extra, result.label)
 
+        current_app.extensions["air_stream"].publish(
+            _live_event(result, medida, condicion, contexto_extra)
+        )
+        return redirect(url_for(".index"))
+
+    cache = current_app.extensions["air_history"]
+    version = database.write_version()
+    etag = cache.etag(version)
+    if cache.enabled and etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        history_html = cache.fragment(version)
+        with stage("render"):
+            response = make_response(render_template("index.html", result=None, history_html=history_html))
+    if cache.enabled:
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _save_sync(medida, condicion, contexto_extra, label):
+    with stage("save"):
         save_full_record(medida, condicion, contexto_extra)
-        append_to_csv(medida, condicion, contexto_extra, result.label)
+    with stage("history"):
+        append_to_history(medida, condicion, contexto_extra, label)
+
+
+def _live_event(result, medida, condicion, contexto) -> dict:
+    return {
+        "hora": contexto.get("hora"),
+        "zona": contexto.get("zona"),
+        "evento_biomasa": contexto.get("evento_biomasa"),
+        "quality_level": result.label,
+        "color": result.color,
+        "aqi_value": result.aqi_value,
+        "explanation": result.explanation,
+        "alerts": list(result.alerts),
+        "recommendations": list(result.recommendations),
+        "medidas": medida,
+        "condiciones": condicion,
+    }
+
 
-        return redirect(url_for("index"))
+@bp.route("/ready")
+def ready():
+    """Estado de la carga inicial: 200 cuando terminó, 503 mientras carga o si falló."""
+    status = current_app.extensions["air_seed"].status()
+    return jsonify(status), (200 if status["ready"] else 503)
+
+
+@bp.route("/metrics")
+def metrics_endpoint():
+    if not (current_app.config["METRICS"] and metrics.enabled()):
+        abort(404)
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def _decode_cursor(value):
+    if not value:
+        return None
+    hora, _, row_id = value.rpartition("|")
+    try:
+        return hora, int(row_id)
+    except ValueError:
+        abort(400, description="cursor inválido")
+
+
+@bp.route("/api/contexto")
+def api_contexto():
+    """Consulta paginada: ?zona=&since=&until=&quality_level=&limit=&cursor="""
+    args = request.args
+    rows, next_cursor = query_context(
+        zona=args.get("zona") or None,
+        since=args.get("since") or None,
+        until=args.get("until") or None,
+        quality_level=args.getlist("quality_level") or None,
+        cursor=_decode_cursor(args.get("cursor")),
+        limit=max(1, min(args.get("limit", 100, type=int), 1000)),
+    )
+    return jsonify(
+        rows=[dict(zip(CONTEXT_COLUMNS, r)) for r in rows],
+        next_cursor=f"{next_cursor[0]}|{next_cursor[1]}" if next_cursor else None,
+    )
+
+
+@bp.route("/api/stats")
+def api_stats():
+    """Estadísticas por zona desde los agregados: ?periodo=hora|dia&zona=&since=&until=&medida="""
+    args = request.args
+    periodo = args.get("periodo", "dia")
+    try:
+        metric_rows, quality_rows = fetch_rollups(
+            periodo=periodo,
+            zona=args.get("zona") or None,
+            since=args.get("since") or None,
+            until=args.get("until") or None,
+            medida=args.get("medida") or None,
+        )
+    except ValueError as e:
+        abort(400, description=str(e))
+    return jsonify(
+        periodo=periodo,
+        medidas=[
+            {"bucket": b, "zona": z, "medida": m, "n": n, "media": suma / n,
+             "min": vmin, "max": vmax}
+            for b, z, m, n, suma, vmin, vmax in metric_rows
+        ],
+        calidad=[
+            {"bucket": b, "zona": z, "quality_level": q, "n": n}
+            for b, z, q, n in quality_rows
+        ],
+    )
+
+
+@bp.route("/api/stream")
+def api_stream():
+    """Evaluaciones nuevas en vivo (Server-Sent Events): ?zona=&min_level="""
+    hub = current_app.extensions["air_stream"]
+    try:
+        sub = hub.subscribe(
+            zona=request.args.get("zona") or None,
+            min_level=request.args.get("min_level") or None,
+        )
+    except ValueError as e:
+        abort(400, description=str(e))
+    except HubFull as e:
+        abort(503, description=str(e))
+    return Response(
+        hub.stream(sub, keepalive=current_app.config["STREAM_KEEPALIVE"]),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.route("/export")
+def export():
+    """Descarga en streaming del historial: ?format=csv|csv.gz|npz|arrow&limit=&chunk=
+
+    Todo se valida antes de responder: un error dentro del generador
+    cortaría la descarga con el 200 ya enviado."""
+    fmt = request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        abort(400, description=f"formato desconocido: {fmt}")
+    try:
+        limit = request.args.get("limit")
+        limit = int(limit) if limit not in (None, "") else None
+        chunk = int(request.args.get("chunk") or 5000)
+        body = iter_export(fmt, chunk_size=chunk, limit=limit)
+    except ValueError as e:
+        abort(400, description=str(e))
+    mimetype, suffix = EXPORT_FORMATS[fmt]
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=historial{suffix}"},
+    )
 
-    history = fetch_recent_context(10)
-    return render_template("index.html", result=result, history=history)
 
+app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
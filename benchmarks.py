@@ -0,0 +1,228 @@
+"""Micro-benchmarks de los caminos calientes: inferencia, validación y almacenamiento.
+
+Uso:
+    python benchmarks.py run --rows 5000 --out bench.json
+    python benchmarks.py run --rows 5000 --baseline baseline.json --threshold 0.15
+    python benchmarks.py compare bench.json baseline.json --threshold 0.15
+
+Cada benchmark informa throughput (ops/s) y latencias p50/p95/p99 en µs.
+Con --baseline (o el subcomando compare) termina con código 1 si algún
+camino es más lento que la línea base por encima del umbral.
+"""
+import argparse
+import json
+import math
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+import app
+import database
+from acquisition_module import SENSOR_FIELDS, SensorInput, to_fact_dict, validate_columns
+from inference_engine import AirExpertEngine, Fact
+from synthetic import DISTRIBUTIONS, ZONES, generate_rows, write_csv
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not sorted_values:
+        return 0.0
+    k = math.ceil(q / 100 * len(sorted_values)) - 1
+    return sorted_values[max(0, min(len(sorted_values) - 1, k))]
+
+
+def _summarize(latencies_ns: List[int], ops_per_call: int = 1) -> Dict[str, float]:
+    lat = sorted(latencies_ns)
+    total_s = sum(lat) / 1e9
+    ops = len(lat) * ops_per_call
+    return {
+        "calls": len(lat),
+        "ops": ops,
+        "throughput": ops / total_s if total_s else 0.0,
+        "p50_us": percentile(lat, 50) / 1e3,
+        "p95_us": percentile(lat, 95) / 1e3,
+        "p99_us": percentile(lat, 99) / 1e3,
+        "max_us": lat[-1] / 1e3 if lat else 0.0,
+    }
+
+
+def _time_each(fn: Callable, items: Iterable) -> List[int]:
+    out = []
+    clock = time.perf_counter_ns
+    for item in items:
+        t0 = clock()
+        fn(item)
+        out.append(clock() - t0)
+    return out
+
+
+def _sensor_kwargs(row: Dict[str, str]) -> Dict[str, Optional[float]]:
+    return {k: (float(row[k]) if row[k] != "" else None)
+            for k in ("PM2_5_24h", "PM10_24h", "NO2_24h", "O3_8h", "SO2_24h", "CO_24h", "temp", "rh")}
+
+
+def _record(row: Dict[str, str], label: str):
+    v = _sensor_kwargs(row)
+    return (
+        {"pm2_5": v["PM2_5_24h"], "pm10": v["PM10_24h"], "no2": v["NO2_24h"],
+         "co": v["CO_24h"], "o3": v["O3_8h"], "so2": v["SO2_24h"]},
+        {"temperatura": v["temp"], "humedad": v["rh"], "v_viento": None},
+        {"zona": row["zona"], "hora": row["hora"],
+         "evento_biomasa": int(row["evento_biomasa"]), "quality_level": label},
+    )
+
+
+class _TempDatabase:
+    """Apunta database.py a una base temporal mientras dura el bloque."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __enter__(self):
+        self._saved = database._DB_PATH
+        database._DB_PATH = self.path
+        database.init_db()
+        return self
+
+    def __exit__(self, *exc):
+        database.close_connections()
+        database._DB_PATH = self._saved
+
+
+def run(
+    rows: int = 2000,
+    zones: int = len(ZONES),
+    distribution: str = "lognormal",
+    missing_rate: float = 0.0,
+    seed: int = 0,
+    load_repeats: int = 3,
+    workdir: Optional[Path] = None,
+) -> Dict:
+    """Ejecuta todos los benchmarks y devuelve el resultado serializable."""
+    zone_names = [ZONES[i] if i < len(ZONES) else f"Zona{i}" for i in range(zones)]
+    data = list(generate_rows(rows, zone_names, distribution, missing_rate, seed=seed))
+    kwargs = [_sensor_kwargs(r) for r in data]
+    engine = AirExpertEngine(reload_interval=None)
+    facts = [Fact(**to_fact_dict(SensorInput(**k))) for k in kwargs]
+    results: Dict[str, Dict[str, float]] = {}
+
+    results["SensorInput"] = _summarize(_time_each(lambda k: SensorInput(**k), kwargs))
+    columns = {name: [k[name] for k in kwargs] for name in SENSOR_FIELDS}
+    results["validate_columns"] = _summarize(_time_each(validate_columns, [columns] * 20), ops_per_call=rows)
+    results["evaluate"] = _summarize(_time_each(engine.evaluate, facts))
+
+    labels = [engine.evaluate(f).label for f in facts]
+    records = [_record(r, label) for r, label in zip(data, labels)]
+
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        tmp = Path(tmp)
+        with _TempDatabase(tmp / "save.db"):
+            results["save_full_record"] = _summarize(
+                _time_each(lambda rec: database.save_full_record(*rec), records)
+            )
+            results["fetch_recent_context"] = _summarize(
+                _time_each(lambda n: database.fetch_recent_context(n), [10] * min(rows, 1000))
+            )
+
+        csv_path = tmp / "input.csv"
+        write_csv(csv_path, data)
+        for name, bulk in (("load_csv_to_db", False), ("load_csv_to_db_bulk", True)):
+            latencies = []
+            for i in range(load_repeats):
+                with _TempDatabase(tmp / f"{name}_{i}.db"):
+                    t0 = time.perf_counter_ns()
+                    app.load_csv_to_db(csv_path, bulk=bulk)
+                    latencies.append(time.perf_counter_ns() - t0)
+            results[name] = _summarize(latencies, ops_per_call=rows)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "rows": rows,
+            "zones": zones,
+            "distribution": distribution,
+            "missing_rate": missing_rate,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = 0.10) -> List[str]:
+    """Devuelve las regresiones: throughput menor o p95 mayor que la línea
+    base en más de `threshold` (fracción)."""
+    regressions = []
+    for name, base in baseline.get("results", {}).items():
+        cur = current.get("results", {}).get(name)
+        if cur is None:
+            continue
+        if base["throughput"] and cur["throughput"] < base["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{name}: throughput {cur['throughput']:.0f} ops/s < {base['throughput']:.0f} ops/s"
+            )
+        if base["p95_us"] and cur["p95_us"] > base["p95_us"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {cur['p95_us']:.1f} µs > {base['p95_us']:.1f} µs")
+    return regressions
+
+
+def format_table(result: Dict) -> str:
+    lines = [f"{'benchmark':<22}{'ops/s':>12}{'p50 µs':>10}{'p95 µs':>10}{'p99 µs':>10}"]
+    for name, r in result["results"].items():
+        lines.append(
+            f"{name:<22}{r['throughput']:>12.0f}{r['p50_us']:>10.1f}{r['p95_us']:>10.1f}{r['p99_us']:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def _report_regressions(current: Dict, baseline_path: Path, threshold: float) -> int:
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    regressions = compare(current, baseline, threshold)
+    for r in regressions:
+        print(f"REGRESIÓN {r}")
+    if not regressions:
+        print(f"Sin regresiones respecto a {baseline_path} (umbral {threshold:.0%})")
+    return 1 if regressions else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="ejecuta los benchmarks")
+    p_run.add_argument("--rows", type=int, default=2000)
+    p_run.add_argument("--zones", type=int, default=len(ZONES))
+    p_run.add_argument("--distribution", choices=DISTRIBUTIONS, default="lognormal")
+    p_run.add_argument("--missing-rate", type=float, default=0.0)
+    p_run.add_argument("--seed", type=int, default=0)
+    p_run.add_argument("--load-repeats", type=int, default=3)
+    p_run.add_argument("--out", type=Path, help="guarda el resultado en JSON")
+    p_run.add_argument("--baseline", type=Path, help="JSON de referencia para comparar")
+    p_run.add_argument("--threshold", type=float, default=0.10)
+
+    p_cmp = sub.add_parser("compare", help="compara dos resultados JSON")
+    p_cmp.add_argument("current", type=Path)
+    p_cmp.add_argument("baseline", type=Path)
+    p_cmp.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        current = json.loads(args.current.read_text(encoding="utf-8"))
+        return _report_regressions(current, args.baseline, args.threshold)
+
+    result = run(args.rows, args.zones, args.distribution, args.missing_rate, args.seed, args.load_repeats)
+    print(format_table(result))
+    if args.out:
+        args.out.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    if args.baseline:
+        return _report_regressions(result, args.baseline, args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
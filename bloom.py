@@ -0,0 +1,56 @@
+"""Filtro de Bloom para claves de 16 bytes (digests), vectorizado con NumPy.
+
+Responde "seguro que no está" o "puede estar" (falsos positivos con
+probabilidad ~error_rate mientras no se supere `capacity`). Las k
+posiciones de cada clave salen de sus dos mitades de 64 bits (doble
+hashing), así que las claves deben ser ya un hash uniforme.
+"""
+import math
+import threading
+from typing import Sequence
+
+import numpy as np
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        bits = -self.capacity * math.log(error_rate) / math.log(2) ** 2
+        self.size = max(int(math.ceil(bits / 64)) * 64, 64)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = np.zeros(self.size // 8, dtype=np.uint8)
+        self._lock = threading.Lock()
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+    def _positions(self, keys: Sequence[bytes]) -> np.ndarray:
+        halves = np.frombuffer(b"".join(k[:16] for k in keys), dtype="<u8").reshape(-1, 2)
+        h1, h2 = halves[:, :1], halves[:, 1:] | np.uint64(1)
+        i = np.arange(self.hashes, dtype=np.uint64)
+        return (h1 + i * h2) % np.uint64(self.size)  # aritmética módulo 2**64
+
+    def add_many(self, keys: Sequence[bytes]) -> None:
+        if not keys:
+            return
+        pos = self._positions(keys).ravel()
+        with self._lock:
+            np.bitwise_or.at(self._bits, pos >> np.uint64(3), np.left_shift(1, pos & np.uint64(7)).astype(np.uint8))
+            self.count += len(keys)
+
+    def contains_many(self, keys: Sequence[bytes]) -> np.ndarray:
+        """Máscara booleana: True si la clave puede estar."""
+        if not keys:
+            return np.zeros(0, dtype=bool)
+        pos = self._positions(keys)
+        bits = (self._bits[pos >> np.uint64(3)] >> (pos & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+    def add(self, key: bytes) -> None:
+        self.add_many([key])
+
+    def __contains__(self, key: bytes) -> bool:
+        return bool(self.contains_many([key])[0])
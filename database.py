@@ -1,75 +1,523 @@
+import hashlib
+import heapq
+import os
 import sqlite3
+import threading
+import weakref
 from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, Iterable, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 from datetime import datetime
 
+from bloom import BloomFilter
+
 _DB_PATH = Path("data/air_data.db")
 
+# Connection settings, see configure().
+_JOURNAL_MODE = "WAL"
+_SYNCHRONOUS = "NORMAL"
+_CACHED_STATEMENTS = 256
+_BUSY_TIMEOUT = 5.0
 
-@contextmanager
-def _conn():
-    """Context manager that ensures the database directory exists,
-    enables foreign keys and yields a sqlite3.Connection.
+_SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+_local = threading.local()
+_pool = weakref.WeakSet()
+_pool_lock = threading.Lock()
+
+
+class _PooledConnection(sqlite3.Connection):
+    """sqlite3.Connection subclass so the pool can hold weak references
+    (and remember which file it is connected to and its storage layout)."""
+
+    path = ""
+    layout = None
+
+
+def configure(
+    synchronous: Optional[str] = None,
+    journal_mode: Optional[str] = None,
+    cached_statements: Optional[int] = None,
+    busy_timeout: Optional[float] = None,
+) -> None:
+    """Change the connection settings and drop pooled connections so the
+    next call on every thread reconnects with them.
+
+    - synchronous: OFF, NORMAL (default, safe with WAL), FULL or EXTRA
+    - journal_mode: WAL by default; any SQLite journal mode is accepted
+    - cached_statements: size of each connection's prepared statement cache
+    - busy_timeout: seconds a writer waits on a locked database
     """
-    _DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(_DB_PATH)
+    global _SYNCHRONOUS, _JOURNAL_MODE, _CACHED_STATEMENTS, _BUSY_TIMEOUT
+    if synchronous is not None:
+        if synchronous.upper() not in _SYNCHRONOUS_LEVELS:
+            raise ValueError(f"synchronous must be one of {_SYNCHRONOUS_LEVELS}")
+        _SYNCHRONOUS = synchronous.upper()
+    if journal_mode is not None:
+        _JOURNAL_MODE = journal_mode.upper()
+    if cached_statements is not None:
+        _CACHED_STATEMENTS = cached_statements
+    if busy_timeout is not None:
+        _BUSY_TIMEOUT = busy_timeout
+    close_connections()
+
+
+def close_connections() -> None:
+    """Close every pooled connection (all threads)."""
+    with _pool_lock:
+        conns = list(_pool)
+        _pool.clear()
+    for conn in conns:
+        conn.close()
+    _local.__dict__.clear()
+
+
+def pool_size() -> int:
+    """Number of open pooled connections."""
+    return len(_pool)
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    new = not path.exists() or path.stat().st_size == 0
+    conn = sqlite3.connect(
+        path,
+        timeout=_BUSY_TIMEOUT,
+        cached_statements=_CACHED_STATEMENTS,
+        check_same_thread=False,
+        factory=_PooledConnection,
+    )
+    conn.path = str(path)
     # Ensure foreign key constraints are enforced
     conn.execute("PRAGMA foreign_keys = ON")
+    if new:
+        # Must precede the journal mode change; existing files are
+        # converted explicitly with enable_incremental_vacuum().
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute(f"PRAGMA journal_mode = {_JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {_SYNCHRONOUS}")
+    with _pool_lock:
+        _pool.add(conn)
+    return conn
+
+
+def _close_path(path: Path) -> None:
+    """Close the pooled connections (all threads) to one database file."""
+    with _pool_lock:
+        conns = [conn for conn in _pool if conn.path == str(path)]
+        for conn in conns:
+            _pool.discard(conn)
+    for conn in conns:
+        conn.close()
+
+
+def _get_conn(path: Optional[Path] = None) -> sqlite3.Connection:
+    """Return this thread's connection to `path` (default _DB_PATH),
+    opening it on first use.
+
+    Connections are never shared between threads; check_same_thread is
+    disabled only so close_connections() can close them from any thread.
+    """
+    path = _DB_PATH if path is None else path
+    conns = _local.__dict__.setdefault("conns", {})
+    key = str(path)
+    conn = conns.get(key)
+    if conn is None or conn not in _pool:
+        conn = conns[key] = _connect(path)
+    return conn
+
+
+# Incremented after every commit that changes what the read functions
+# return, so callers can cache results and compare versions instead of
+# querying. Writes from other processes (or from connections that bypass
+# _writing) are caught by PRAGMA data_version on a watcher connection
+# that never writes: its value changes on every commit to the file by any
+# other connection. data_version is only comparable within a connection,
+# so each new watcher gets a new generation number.
+_write_version = 0
+_write_version_lock = threading.Lock()
+_watchers: Dict[str, Tuple[int, sqlite3.Connection]] = {}
+_watcher_generation = 0
+
+
+def write_version() -> Tuple[int, int, int]:
+    """Version of the live database contents: (writes by this process,
+    watcher generation, PRAGMA data_version). Equal versions mean no
+    commit happened in between, from this process or any other."""
+    global _watcher_generation
+    key = str(_DB_PATH)
+    with _write_version_lock:
+        local = _write_version
+        entry = _watchers.get(key)
+        if entry is None or entry[1] not in _pool:
+            _watcher_generation += 1
+            entry = _watchers[key] = (_watcher_generation, _connect(_DB_PATH))
+        return local, entry[0], entry[1].execute("PRAGMA data_version").fetchone()[0]
+
+
+def _bump_write_version() -> None:
+    global _write_version
+    with _write_version_lock:
+        _write_version += 1
+
+
+@contextmanager
+def _conn(path: Optional[Path] = None):
+    """Context manager that yields this thread's pooled sqlite3.Connection
+    (to _DB_PATH, or to an archive partition), committing on success and
+    rolling back on error. The connection stays open for the next call.
+    """
+    conn = _get_conn(path)
     try:
         yield conn
-    finally:
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
         conn.commit()
-        conn.close()
 
 
-def init_db() -> None:
-    """Create the normalized schema: medidas, condiciones, contexto."""
-    with _conn() as c:
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS medidas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            pm2_5 REAL,
-            pm10 REAL,
-            no2 REAL,
-            co REAL,
-            o3 REAL,
-            so2 REAL
-        )
-        """)
+@contextmanager
+def _writing(path: Optional[Path] = None):
+    """_conn() for writes: bumps write_version() once the commit is done."""
+    with _conn(path) as conn:
+        yield conn
+    _bump_write_version()
 
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS condiciones (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            temperatura REAL,
-            humedad REAL,
-            v_viento REAL
-        )
-        """)
 
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS contexto (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            zona TEXT,
-            hora DATETIME,
-            evento_biomasa INTEGER NOT NULL DEFAULT 0,
-            quality_level TEXT,
+# Schema migrations applied by init_db() on top of the base tables, in
+# order; PRAGMA user_version records how many have been applied. A step is
+# an SQL statement or a callable receiving the connection.
+_MIGRATIONS = [
+    # 1: indexes for zone / time range / quality level queries (query_context)
+    (
+        "CREATE INDEX IF NOT EXISTS idx_contexto_hora ON contexto (hora)",
+        "CREATE INDEX IF NOT EXISTS idx_contexto_zona_hora ON contexto (zona, hora)",
+        "CREATE INDEX IF NOT EXISTS idx_contexto_quality_hora ON contexto (quality_level, hora)",
+        "CREATE INDEX IF NOT EXISTS idx_contexto_zona_quality_hora ON contexto (zona, quality_level, hora)",
+    ),
+    # 2: hourly/daily rollups per zone, maintained by the save functions
+    (
+        """
+        CREATE TABLE IF NOT EXISTS rollup_medidas (
+            periodo TEXT NOT NULL,
+            zona TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            medida TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            suma REAL NOT NULL,
+            minimo REAL,
+            maximo REAL,
+            PRIMARY KEY (periodo, zona, bucket, medida)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rollup_calidad (
+            periodo TEXT NOT NULL,
+            zona TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            quality_level TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            PRIMARY KEY (periodo, zona, bucket, quality_level)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_rollup_medidas_bucket ON rollup_medidas (periodo, bucket)",
+        "CREATE INDEX IF NOT EXISTS idx_rollup_calidad_bucket ON rollup_calidad (periodo, bucket)",
+        lambda c: _rebuild_rollups(c),
+    ),
+    # 3: catalog of monthly archive partitions and key/value metadata
+    (
+        """
+        CREATE TABLE IF NOT EXISTS particiones (
+            mes TEXT PRIMARY KEY,
+            archivo TEXT NOT NULL,
+            filas INTEGER NOT NULL,
+            min_id INTEGER,
+            max_id INTEGER,
+            max_medida_id INTEGER,
+            min_hora TEXT,
+            max_hora TEXT
+        )
+        """,
+        "CREATE TABLE IF NOT EXISTS db_meta (clave TEXT PRIMARY KEY, valor TEXT)",
+    ),
+    # 4: idempotency keys of the stored readings (see idempotency_key)
+    (
+        """
+        CREATE TABLE IF NOT EXISTS claves_idempotencia (
+            clave BLOB PRIMARY KEY,
             medida_id INTEGER,
             condicion_id INTEGER,
-            FOREIGN KEY (medida_id) REFERENCES medidas(id) ON DELETE CASCADE,
-            FOREIGN KEY (condicion_id) REFERENCES condiciones(id) ON DELETE CASCADE
+            contexto_id INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """,
+        lambda c: _backfill_keys(c),
+    ),
+    # 5: read position of each CSV feed ingested in follow mode
+    (
+        """
+        CREATE TABLE IF NOT EXISTS seguimiento_csv (
+            archivo TEXT PRIMARY KEY,
+            inodo INTEGER,
+            generacion INTEGER NOT NULL,
+            posicion INTEGER NOT NULL,
+            cabecera TEXT,
+            actualizado TEXT
         )
+        """,
+    ),
+]
+
+
+def _migrate(c: sqlite3.Connection) -> None:
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(_MIGRATIONS[version:], start=version + 1):
+        for step in statements:
+            if callable(step):
+                step(c)
+            else:
+                c.execute(step)
+        c.execute(f"PRAGMA user_version = {number}")
+
+
+def _create_base_tables(c: sqlite3.Connection) -> None:
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS medidas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        pm2_5 REAL,
+        pm10 REAL,
+        no2 REAL,
+        co REAL,
+        o3 REAL,
+        so2 REAL
+    )
+    """)
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS condiciones (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        temperatura REAL,
+        humedad REAL,
+        v_viento REAL
+    )
+    """)
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS contexto (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        zona TEXT,
+        hora DATETIME,
+        evento_biomasa INTEGER NOT NULL DEFAULT 0,
+        quality_level TEXT,
+        medida_id INTEGER,
+        condicion_id INTEGER,
+        FOREIGN KEY (medida_id) REFERENCES medidas(id) ON DELETE CASCADE,
+        FOREIGN KEY (condicion_id) REFERENCES condiciones(id) ON DELETE CASCADE
+    )
+    """)
+
+
+# Storage layouts. NORMALIZED keeps one row per reading in each of medidas,
+# condiciones and contexto; WIDE keeps a single `lecturas` row per reading
+# (same id, columns of the three tables). Every function in this module
+# works with either; migrate_layout() converts a database in place.
+NORMALIZED = "normalized"
+WIDE = "wide"
+LAYOUTS = (NORMALIZED, WIDE)
+
+_WIDE_COLUMNS = (
+    "zona", "hora", "evento_biomasa", "quality_level",
+    "pm2_5", "pm10", "no2", "co", "o3", "so2",
+    "temperatura", "humedad", "v_viento",
+)
+
+# FROM clause of one reading and the aliases owning the measurement and
+# condition columns; `ctx` always holds id, zona, hora, evento_biomasa
+# and quality_level.
+_READING_SOURCE = {
+    NORMALIZED: (
+        "contexto ctx LEFT JOIN medidas m ON ctx.medida_id = m.id "
+        "LEFT JOIN condiciones cond ON ctx.condicion_id = cond.id",
+        "m", "cond",
+    ),
+    WIDE: ("lecturas ctx", "ctx", "ctx"),
+}
+_READING_TABLE = {NORMALIZED: "contexto", WIDE: "lecturas"}
+_MEASUREMENT_TABLE = {NORMALIZED: "medidas", WIDE: "lecturas"}
+
+
+def _layout(c: sqlite3.Connection) -> str:
+    """Storage layout of the database behind `c` (cached per connection)."""
+    layout = getattr(c, "layout", None)
+    if layout not in LAYOUTS:
+        found = c.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'lecturas'"
+        ).fetchone()
+        layout = WIDE if found == (1,) else NORMALIZED
+        if isinstance(c, _PooledConnection):
+            c.layout = layout
+    return layout
+
+
+def _create_wide_table(c: sqlite3.Connection, without_rowid: bool = False, name: str = "lecturas") -> None:
+    """Create the wide table and its indexes.
+
+    With without_rowid the table is clustered on id (no AUTOINCREMENT, ids
+    are always assigned explicitly) and the (zona, hora) index covers every
+    column, so zone/time range queries never touch the table.
+    """
+    if without_rowid:
+        id_column, suffix = "id INTEGER NOT NULL PRIMARY KEY", " WITHOUT ROWID"
+    else:
+        id_column, suffix = "id INTEGER PRIMARY KEY AUTOINCREMENT", ""
+    c.execute(f"""
+    CREATE TABLE IF NOT EXISTS {name} (
+        {id_column},
+        zona TEXT,
+        hora DATETIME,
+        evento_biomasa INTEGER NOT NULL DEFAULT 0,
+        quality_level TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        pm2_5 REAL,
+        pm10 REAL,
+        no2 REAL,
+        co REAL,
+        o3 REAL,
+        so2 REAL,
+        temperatura REAL,
+        humedad REAL,
+        v_viento REAL
+    ){suffix}
+    """)
+    if name != "lecturas":
+        return
+    zona_hora = "zona, hora"
+    if without_rowid:
+        zona_hora += ", " + ", ".join(_WIDE_COLUMNS[2:] + ("timestamp",))
+    for index, columns in (
+        ("idx_lecturas_hora", "hora"),
+        ("idx_lecturas_zona_hora", zona_hora),
+        ("idx_lecturas_quality_hora", "quality_level, hora"),
+        ("idx_lecturas_zona_quality_hora", "zona, quality_level, hora"),
+    ):
+        c.execute(f"CREATE INDEX IF NOT EXISTS {index} ON lecturas ({columns})")
+
+
+def _is_without_rowid(c: sqlite3.Connection) -> bool:
+    row = c.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'lecturas'").fetchone()
+    return bool(row) and "WITHOUT ROWID" in row[0].upper()
+
+
+def _convert_layout(c: sqlite3.Connection, layout: str, without_rowid: bool = False) -> None:
+    """Rewrite the readings of one database file into `layout` (runs in the
+    caller's transaction). Medidas/condiciones rows not linked to any
+    contexto row are not readings and are dropped when leaving NORMALIZED."""
+    current = _layout(c)
+    if current == WIDE and layout == WIDE:
+        c.execute("ALTER TABLE lecturas RENAME TO lecturas_old")
+        for (index,) in c.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'lecturas_old' AND sql IS NOT NULL").fetchall():
+            c.execute(f"DROP INDEX {index}")
+        _create_wide_table(c, without_rowid)
+        c.execute("INSERT INTO lecturas SELECT * FROM lecturas_old")
+        c.execute("DROP TABLE lecturas_old")
+    elif layout == WIDE:
+        _create_wide_table(c, without_rowid)
+        c.execute(f"""
+            INSERT INTO lecturas (id, timestamp, {", ".join(_WIDE_COLUMNS)})
+            SELECT ctx.id, m.timestamp, ctx.zona, ctx.hora, ctx.evento_biomasa, ctx.quality_level,
+                   m.pm2_5, m.pm10, m.no2, m.co, m.o3, m.so2,
+                   cond.temperatura, cond.humedad, cond.v_viento
+            FROM {_READING_SOURCE[NORMALIZED][0]}
         """)
+        for table in ("contexto", "medidas", "condiciones"):
+            c.execute(f"DROP TABLE {table}")
+        if c.execute("SELECT 1 FROM sqlite_master WHERE name = 'claves_idempotencia'").fetchone():
+            c.execute("UPDATE claves_idempotencia SET medida_id = contexto_id, condicion_id = contexto_id")
+    else:
+        _create_base_tables(c)
+        c.execute("""
+            INSERT INTO medidas (id, timestamp, pm2_5, pm10, no2, co, o3, so2)
+            SELECT id, timestamp, pm2_5, pm10, no2, co, o3, so2 FROM lecturas
+        """)
+        c.execute("""
+            INSERT INTO condiciones (id, temperatura, humedad, v_viento)
+            SELECT id, temperatura, humedad, v_viento FROM lecturas
+        """)
+        c.execute("""
+            INSERT INTO contexto (id, zona, hora, evento_biomasa, quality_level, medida_id, condicion_id)
+            SELECT id, zona, hora, evento_biomasa, quality_level, id, id FROM lecturas
+        """)
+        c.execute("DROP TABLE lecturas")
+        for step in _MIGRATIONS[0]:
+            c.execute(step)
+    c.layout = layout
+
+
+def init_db(layout: Optional[str] = None, without_rowid: bool = False) -> None:
+    """Create the normalized schema: medidas, condiciones, contexto,
+    and apply pending migrations (indexes, auxiliary tables).
+
+    `layout` (NORMALIZED or WIDE) only applies to a database without
+    readings; existing databases keep theirs (see migrate_layout).
+    """
+    if layout is not None and layout not in LAYOUTS:
+        raise ValueError(f"layout must be one of {LAYOUTS}")
+    with _conn() as c:
+        if _layout(c) == NORMALIZED:
+            _create_base_tables(c)
+        # Migrations after 3 must handle both layouts.
+        _migrate(c)
+        empty = c.execute(f"SELECT COUNT(*) FROM {_READING_TABLE[_layout(c)]}").fetchone()[0] == 0
+        if layout is not None and empty and (layout != _layout(c) or (layout == WIDE and without_rowid != _is_without_rowid(c))):
+            if not c.in_transaction:
+                c.execute("BEGIN IMMEDIATE")
+            _convert_layout(c, layout, without_rowid)
+
+
+def storage_layout() -> str:
+    """Layout of the live database: NORMALIZED or WIDE."""
+    with _conn() as c:
+        return _layout(c)
+
+
+def migrate_layout(layout: str, without_rowid: bool = False) -> int:
+    """Convert the live database and its archives to `layout`, one
+    transaction per file. Run it with no other process writing.
+    Returns the number of files converted.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"layout must be one of {LAYOUTS}")
+    converted = 0
+    for path in _database_paths():
+        with _conn(path) as c:
+            current = _layout(c)
+            if current == layout and (layout == NORMALIZED or _is_without_rowid(c) == without_rowid):
+                continue
+            if not c.in_transaction:
+                c.execute("BEGIN IMMEDIATE")
+            _convert_layout(c, layout, without_rowid)
+        converted += 1
+    close_connections()
+    return converted
+
+
+def _require_normalized(c: sqlite3.Connection) -> None:
+    if _layout(c) != NORMALIZED:
+        raise sqlite3.OperationalError(
+            "the wide layout stores whole readings; use save_full_record"
+        )
 
 
 def save_measurement(data: Dict[str, Any]) -> int:
     """Insert a row into `medidas`.
 
     Expects keys: pm2_5, pm10, no2, co, o3, so2
-    Returns the inserted row id.
+    Returns the inserted row id. NORMALIZED layout only.
     """
-    with _conn() as c:
+    with _writing() as c:
+        _require_normalized(c)
         cur = c.cursor()
         cur.execute(
             """
@@ -85,9 +533,10 @@ def save_condition(data: Dict[str, Any]) -> int:
     """Insert a row into `condiciones`.
 
     Expects keys: temperatura, humedad, v_viento
-    Returns the inserted row id.
+    Returns the inserted row id. NORMALIZED layout only.
     """
-    with _conn() as c:
+    with _writing() as c:
+        _require_normalized(c)
         cur = c.cursor()
         cur.execute(
             """
@@ -103,9 +552,10 @@ def save_context(data: Dict[str, Any]) -> int:
     """Insert a row into `contexto` linking medidas and condiciones if provided.
 
     Expects keys: zona, hora, evento_biomasa, quality_level, medida_id, condicion_id
-    Returns the inserted row id.
+    Returns the inserted row id. NORMALIZED layout only.
     """
-    with _conn() as c:
+    with _writing() as c:
+        _require_normalized(c)
         cur = c.cursor()
         cur.execute(
             """
@@ -126,79 +576,1160 @@ def save_full_record(
 
     - measurement: dict with keys pm2_5, pm10, no2, co, o3, so2
     - condition: dict with keys temperatura, humedad, v_viento
-    - context_extra: optional dict with keys zona, hora, evento_biomasa, quality_level
+    - context_extra: optional dict with keys zona, hora, evento_biomasa,
+      quality_level and idempotency_key
 
-    Returns a tuple (medida_id, condicion_id, contexto_id).
+    Returns a tuple (medida_id, condicion_id, contexto_id); in the WIDE
+    layout the three are the id of the single `lecturas` row. A record
+    whose idempotency_key() was already saved is not inserted again; the
+    ids of the stored one are returned instead. A record with neither hora
+    nor idempotency_key gets the current time and is always inserted.
     """
     context_extra = context_extra or {}
 
+    if context_extra.get('hora'):
+        context_extra['hora'] = _normalize_hora(context_extra['hora'])
+    key = idempotency_key(measurement, condition, context_extra)
     if not context_extra.get('hora'):
         context_extra['hora'] = datetime.now().isoformat(timespec='seconds')
 
-    with _conn() as c:
+    with _writing() as c:
         cur = c.cursor()
+        if key is None:
+            return _insert_record(cur, measurement, condition, context_extra)
+        seen = _seen_keys(c)
+        if key in seen:
+            ids = _stored_ids(cur, key)
+            if ids is not None:
+                return ids
+        ids = _insert_record(cur, measurement, condition, context_extra)
+        try:
+            cur.execute(_INSERT_KEY, (key,) + ids)
+        except sqlite3.IntegrityError:
+            # Saved by another process since the filter was loaded.
+            c.rollback()
+            return _stored_ids(cur, key)
+        seen.add(key)
+        return ids
 
-        cur.execute(
-            """
-            INSERT INTO medidas (pm2_5, pm10, no2, co, o3, so2)
-            VALUES (:pm2_5, :pm10, :no2, :co, :o3, :so2)
-            """,
-            measurement,
-        )
-        medida_id = cur.lastrowid
 
-        cur.execute(
-            """
-            INSERT INTO condiciones (temperatura, humedad, v_viento)
-            VALUES (:temperatura, :humedad, :v_viento)
+def _insert_record(
+    cur: sqlite3.Cursor, measurement: Dict[str, Any], condition: Dict[str, Any], context_extra: Dict[str, Any]
+) -> Tuple[int, int, int]:
+    if _layout(cur.connection) == WIDE:
+        row = _wide_row(measurement, condition, context_extra)
+        reading_id = cur.execute(
+            f"""
+            INSERT INTO lecturas (id, {", ".join(_WIDE_COLUMNS)})
+            VALUES (({_NEXT_READING_ID}), {", ".join("?" * len(_WIDE_COLUMNS))})
+            RETURNING id
             """,
-            condition,
-        )
-        condicion_id = cur.lastrowid
+            row,
+        ).fetchone()[0]
+        _update_rollups(cur, [(row[0], row[1], row[3], measurement)])
+        return reading_id, reading_id, reading_id
 
-        ctx = {
-            'zona': context_extra.get('zona'),
-            'hora': context_extra.get('hora'),
-            'evento_biomasa': context_extra.get('evento_biomasa', 0),
-            'quality_level': context_extra.get('quality_level'),
-            'medida_id': medida_id,
-            'condicion_id': condicion_id,
-        }
+    cur.execute(
+        """
+        INSERT INTO medidas (pm2_5, pm10, no2, co, o3, so2)
+        VALUES (:pm2_5, :pm10, :no2, :co, :o3, :so2)
+        """,
+        measurement,
+    )
+    medida_id = cur.lastrowid
 
-        cur.execute(
-            """
-            INSERT INTO contexto (zona, hora, evento_biomasa, quality_level, medida_id, condicion_id)
-            VALUES (:zona, :hora, :evento_biomasa, :quality_level, :medida_id, :condicion_id)
+    cur.execute(
+        """
+        INSERT INTO condiciones (temperatura, humedad, v_viento)
+        VALUES (:temperatura, :humedad, :v_viento)
+        """,
+        condition,
+    )
+    condicion_id = cur.lastrowid
+
+    ctx = {
+        'zona': context_extra.get('zona'),
+        'hora': context_extra.get('hora'),
+        'evento_biomasa': context_extra.get('evento_biomasa', 0),
+        'quality_level': context_extra.get('quality_level'),
+        'medida_id': medida_id,
+        'condicion_id': condicion_id,
+    }
+
+    cur.execute(
+        """
+        INSERT INTO contexto (zona, hora, evento_biomasa, quality_level, medida_id, condicion_id)
+        VALUES (:zona, :hora, :evento_biomasa, :quality_level, :medida_id, :condicion_id)
+        """,
+        ctx,
+    )
+    contexto_id = cur.lastrowid
+
+    _update_rollups(cur, [(ctx['zona'], ctx['hora'], ctx['quality_level'], measurement)])
+
+    return medida_id, condicion_id, contexto_id
+
+
+# Idempotency keys: 16-byte digests in claves_idempotencia (live database
+# only, shared by both layouts). Keys outlive their rows when these are
+# archived or downsampled, so re-running an old load never brings them
+# back. A per-process Bloom filter of the stored keys lets the common
+# "new record" case skip the lookup; the primary key of the table still
+# catches keys written by other processes.
+_INSERT_KEY = "INSERT INTO claves_idempotencia (clave, medida_id, condicion_id, contexto_id) VALUES (?, ?, ?, ?)"
+_KEY_ERROR_RATE = 0.01
+_seen: Dict[str, BloomFilter] = {}
+_seen_lock = threading.Lock()
+
+
+_KEY_CONDITIONS = ("temperatura", "humedad", "v_viento")
+
+
+def _key_value(value: Any) -> Any:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def idempotency_key(
+    measurement: Dict[str, Any], condition: Dict[str, Any], context: Optional[Dict[str, Any]]
+) -> Optional[bytes]:
+    """Identity of a record: the caller's context['idempotency_key'] when
+    given, otherwise the reading itself: zona, hora (already normalized),
+    evento_biomasa, pollutants and conditions. quality_level is left out
+    because it depends on the rules, so a reload after the rules change
+    or a rescore still finds the stored copy.
+
+    Returns None for a record with neither a key nor its own hora: the
+    time the save functions fill in is not part of the reading, so such
+    records are never deduplicated (two identical ones are both stored)."""
+    context = context or {}
+    explicit = context.get('idempotency_key')
+    if explicit:
+        raw = f"k|{explicit}"
+    elif not context.get('hora'):
+        return None
+    else:
+        values = [context.get('zona'), context.get('hora'), _key_value(context.get('evento_biomasa', 0))]
+        values += [_key_value(measurement.get(k)) for k in ROLLUP_METRICS]
+        values += [_key_value(condition.get(k)) for k in _KEY_CONDITIONS]
+        raw = "d|" + "|".join(map(repr, values))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+
+
+def _seen_keys(c: sqlite3.Connection) -> BloomFilter:
+    """Bloom filter of the keys stored in the database of `c`, loaded on
+    first use and reloaded with twice the capacity when it fills up."""
+    with _seen_lock:
+        seen = _seen.get(c.path)
+        if seen is not None and not seen.full:
+            return seen
+        count = c.execute("SELECT COUNT(*) FROM claves_idempotencia").fetchone()[0]
+        seen = BloomFilter(max(2 * count, 2 * seen.capacity if seen else 0, 100_000), _KEY_ERROR_RATE)
+        cur = c.execute("SELECT clave FROM claves_idempotencia")
+        while True:
+            rows = cur.fetchmany(50_000)
+            if not rows:
+                break
+            seen.add_many([r[0] for r in rows])
+        _seen[c.path] = seen
+        return seen
+
+
+def _stored_ids(cur: sqlite3.Cursor, key: bytes) -> Optional[Tuple[int, int, int]]:
+    row = cur.execute(
+        "SELECT medida_id, condicion_id, contexto_id FROM claves_idempotencia WHERE clave = ?", (key,)
+    ).fetchone()
+    return tuple(row) if row else None
+
+
+def _unseen(cur: sqlite3.Cursor, keys: List[bytes], seen: Optional[BloomFilter]) -> List[int]:
+    """Indexes of the keys that are neither stored nor repeated earlier in
+    `keys`. Only the keys the filter cannot rule out (all of them when
+    `seen` is None) are looked up, in batches."""
+    keyed = [i for i, key in enumerate(keys) if key is not None]
+    if seen is None:
+        maybe = keyed
+    else:
+        hits = seen.contains_many([keys[i] for i in keyed]) if keyed else []
+        maybe = [i for i, hit in zip(keyed, hits) if hit]
+    stored = set()
+    for i in range(0, len(maybe), 500):
+        batch = [keys[j] for j in maybe[i:i + 500]]
+        stored.update(r[0] for r in cur.execute(
+            f"SELECT clave FROM claves_idempotencia WHERE clave IN ({', '.join('?' * len(batch))})", batch
+        ))
+    fresh, taken = [], set()
+    for i, key in enumerate(keys):
+        if key is None:
+            fresh.append(i)
+        elif key not in stored and key not in taken:
+            taken.add(key)
+            fresh.append(i)
+    return fresh
+
+
+def _reading_keys(conn: sqlite3.Connection) -> List[Tuple]:
+    """(key, medida_id, condicion_id, contexto_id) of every reading with a
+    key (see idempotency_key) in the file of `conn`."""
+    layout = _layout(conn)
+    source, m, cond = _READING_SOURCE[layout]
+    links = "ctx.medida_id, ctx.condicion_id" if layout == NORMALIZED else "ctx.id, ctx.id"
+    values = [f"{m}.{k}" for k in ROLLUP_METRICS] + [f"{cond}.{k}" for k in _KEY_CONDITIONS]
+    rows = conn.execute(
+        f"SELECT ctx.zona, ctx.hora, ctx.evento_biomasa, {', '.join(values)}, {links}, ctx.id "
+        f"FROM {source}"
+    ).fetchall()
+    n = len(ROLLUP_METRICS)
+    keys = [
+        (idempotency_key(
+            dict(zip(ROLLUP_METRICS, r[3:3 + n])),
+            dict(zip(_KEY_CONDITIONS, r[3 + n:6 + n])),
+            {'zona': r[0], 'hora': r[1], 'evento_biomasa': r[2]},
+        ),) + r[6 + n:]
+        for r in rows
+    ]
+    return [k for k in keys if k[0] is not None]
+
+
+def _backfill_keys(c: sqlite3.Connection) -> None:
+    """Migration 4: derived keys of the readings stored before it, live and
+    archived. Earlier duplicates keep the key of their first copy."""
+    insert = _INSERT_KEY.replace("INSERT", "INSERT OR IGNORE", 1)
+    c.executemany(insert, _reading_keys(c))
+    for p in _archived_partitions(c):
+        with _conn(p.path) as a:
+            keys = _reading_keys(a)
+        c.executemany(insert, keys)
+
+
+Record = Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]
+
+
+def _normalize_hora(value: Any) -> Any:
+    """Store `hora` as ISO 8601 with seconds ('YYYY-MM-DDTHH:MM:SS') so
+    text comparisons and range queries order correctly. Values that do not
+    parse are stored unchanged."""
+    if isinstance(value, datetime):
+        return value.isoformat(timespec='seconds')
+    try:
+        return datetime.fromisoformat(value).isoformat(timespec='seconds')
+    except (TypeError, ValueError):
+        return value
+
+
+# Rollups: count, sum, min and max of every pollutant plus a quality level
+# histogram, per zone and per hour / day. Buckets are prefixes of the
+# normalized `hora` and rows without zone are grouped under ''.
+ROLLUP_PERIODS = {"hora": 13, "dia": 10}
+ROLLUP_METRICS = ("pm2_5", "pm10", "no2", "co", "o3", "so2")
+
+
+def _update_rollups(cur: sqlite3.Cursor, rows: Iterable[Tuple[Any, Any, Any, Dict[str, Any]]]) -> None:
+    """Fold (zona, hora, quality_level, measurement) rows into the rollup
+    tables. Rows are pre-aggregated in memory so each chunk costs one upsert
+    per touched (period, zone, bucket) key."""
+    metrics: Dict[Tuple, list] = {}
+    levels: Dict[Tuple, int] = {}
+    for zona, hora, quality_level, measurement in rows:
+        zona = zona or ''
+        hora = str(hora or '')
+        for periodo, width in ROLLUP_PERIODS.items():
+            bucket = hora[:width]
+            key = (periodo, zona, bucket, quality_level or '')
+            levels[key] = levels.get(key, 0) + 1
+            for name in ROLLUP_METRICS:
+                v = measurement.get(name)
+                if v is None:
+                    continue
+                agg = metrics.get((periodo, zona, bucket, name))
+                if agg is None:
+                    metrics[(periodo, zona, bucket, name)] = [1, v, v, v]
+                else:
+                    agg[0] += 1
+                    agg[1] += v
+                    agg[2] = min(agg[2], v)
+                    agg[3] = max(agg[3], v)
+    cur.executemany(_UPSERT_ROLLUP_MEDIDAS, [key + tuple(agg) for key, agg in metrics.items()])
+    cur.executemany(_UPSERT_ROLLUP_CALIDAD, [key + (n,) for key, n in levels.items()])
+
+
+_UPSERT_ROLLUP_MEDIDAS = """
+    INSERT INTO rollup_medidas (periodo, zona, bucket, medida, n, suma, minimo, maximo)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (periodo, zona, bucket, medida) DO UPDATE SET
+        n = n + excluded.n,
+        suma = suma + excluded.suma,
+        minimo = min(minimo, excluded.minimo),
+        maximo = max(maximo, excluded.maximo)
+"""
+_UPSERT_ROLLUP_CALIDAD = """
+    INSERT INTO rollup_calidad (periodo, zona, bucket, quality_level, n)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (periodo, zona, bucket, quality_level) DO UPDATE SET n = n + excluded.n
+"""
+
+
+def rebuild_rollups() -> None:
+    """Recompute the rollup tables from the raw rows (live and archived).
+
+    Buckets older than the downsampling watermark (see drop_raw_before)
+    no longer have raw rows and are kept as they are.
+    """
+    with _conn() as c:
+        _rebuild_rollups(c)
+
+
+def _raw_rollup_queries(layout: str, since: Optional[str]) -> Iterator[Tuple[str, str, tuple]]:
+    """(target, SELECT, params) producing rollup rows from one database's
+    raw tables, limited to hora >= since when given."""
+    source, m, _ = _READING_SOURCE[layout]
+    raw = "1" if since is None else "(ctx.hora IS NULL OR ctx.hora = '' OR ctx.hora >= ?)"
+    extra = () if since is None else (since,)
+    for periodo, width in ROLLUP_PERIODS.items():
+        for name in ROLLUP_METRICS:
+            yield "medidas", f"""
+                SELECT ?, COALESCE(ctx.zona, ''), substr(COALESCE(ctx.hora, ''), 1, ?), ?,
+                       COUNT({m}.{name}), TOTAL({m}.{name}), MIN({m}.{name}), MAX({m}.{name})
+                FROM {source}
+                WHERE {m}.{name} IS NOT NULL AND {raw}
+                GROUP BY 2, 3
+                """, (periodo, width, name) + extra
+        yield "calidad", f"""
+            SELECT ?, COALESCE(ctx.zona, ''), substr(COALESCE(ctx.hora, ''), 1, ?),
+                   COALESCE(ctx.quality_level, ''), COUNT(*)
+            FROM {_READING_TABLE[layout]} ctx
+            WHERE {raw}
+            GROUP BY 2, 3, 4
+            """, (periodo, width) + extra
+
+
+def _rebuild_rollups(c: sqlite3.Connection) -> None:
+    since = _meta_get(c, "downsampled_before")
+    if since is None:
+        c.execute("DELETE FROM rollup_medidas")
+        c.execute("DELETE FROM rollup_calidad")
+    else:
+        for periodo, width in ROLLUP_PERIODS.items():
+            for table in ("rollup_medidas", "rollup_calidad"):
+                c.execute(
+                    f"DELETE FROM {table} WHERE periodo = ? AND (bucket = '' OR bucket >= ?)",
+                    (periodo, since[:width]),
+                )
+    columns = {
+        "medidas": "rollup_medidas (periodo, zona, bucket, medida, n, suma, minimo, maximo)",
+        "calidad": "rollup_calidad (periodo, zona, bucket, quality_level, n)",
+    }
+    for target, sql, params in _raw_rollup_queries(_layout(c), since):
+        c.execute(f"INSERT INTO {columns[target]} {sql}", params)
+    # Archived partitions are separate files: fold their aggregates in.
+    upsert = {"medidas": _UPSERT_ROLLUP_MEDIDAS, "calidad": _UPSERT_ROLLUP_CALIDAD}
+    for partition in _archived_partitions(c):
+        source = _get_conn(partition.path)
+        for target, sql, params in _raw_rollup_queries(_layout(source), since):
+            c.executemany(upsert[target], source.execute(sql, params).fetchall())
+
+
+def _bucket_range(periodo: str, since: Any, until: Any) -> Tuple[list, list]:
+    """SQL conditions selecting buckets that overlap [since, until)."""
+    width = ROLLUP_PERIODS[periodo]
+    where, params = [], []
+    if since is not None:
+        where.append("bucket >= ?")
+        params.append(str(_normalize_hora(since))[:width])
+    if until is not None:
+        until = str(_normalize_hora(until))
+        key = until[:width]
+        # A bucket starting exactly at `until` is excluded; a partially
+        # covered one is included.
+        on_boundary = until[width:].strip(':T0') == ''
+        where.append("bucket < ?" if on_boundary else "bucket <= ?")
+        params.append(key)
+    return where, params
+
+
+def fetch_rollups(
+    periodo: str = "dia",
+    zona: Optional[str] = None,
+    since: Any = None,
+    until: Any = None,
+    medida: Optional[str] = None,
+) -> Tuple[list, list]:
+    """Read aggregated statistics from the rollup tables only.
+
+    Returns (metric_rows, quality_rows):
+    - metric_rows: (bucket, zona, medida, n, suma, minimo, maximo)
+    - quality_rows: (bucket, zona, quality_level, n)
+    """
+    if periodo not in ROLLUP_PERIODS:
+        raise ValueError(f"periodo must be one of {tuple(ROLLUP_PERIODS)}")
+    where, params = _bucket_range(periodo, since, until)
+    where.insert(0, "periodo = ?")
+    params.insert(0, periodo)
+    if zona is not None:
+        where.append("zona = ?")
+        params.append(zona)
+    cond = " AND ".join(where)
+    with _conn() as c:
+        metric_where, metric_params = cond, list(params)
+        if medida is not None:
+            metric_where += " AND medida = ?"
+            metric_params.append(medida)
+        metric_rows = c.execute(
+            f"""
+            SELECT bucket, zona, medida, n, suma, minimo, maximo FROM rollup_medidas
+            WHERE {metric_where} ORDER BY bucket, zona, medida
+            """,
+            metric_params,
+        ).fetchall()
+        quality_rows = c.execute(
+            f"""
+            SELECT bucket, zona, quality_level, n FROM rollup_calidad
+            WHERE {cond} ORDER BY bucket, zona, quality_level
             """,
-            ctx,
+            params,
+        ).fetchall()
+    return metric_rows, quality_rows
+
+
+def _next_id(cur: sqlite3.Cursor, table: str) -> int:
+    """Next AUTOINCREMENT id for `table` (must run inside a write transaction)."""
+    row = cur.execute(
+        f"""
+        SELECT MAX(
+            COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0),
+            COALESCE((SELECT MAX(id) FROM {table}), 0)
         )
-        contexto_id = cur.lastrowid
+        """,
+        (table,),
+    ).fetchone()
+    return row[0] + 1
+
+
+# Next id of the wide table. Archived months may hold the highest ids, and
+# a WITHOUT ROWID table has no sqlite_sequence entry, so both are consulted.
+_NEXT_READING_ID = """
+    SELECT MAX(
+        COALESCE((SELECT MAX(id) FROM lecturas), 0),
+        COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'lecturas'), 0),
+        COALESCE((SELECT MAX(max_id) FROM particiones), 0)
+    ) + 1
+"""
+
+
+def _wide_row(m: Dict[str, Any], cond: Dict[str, Any], ctx: Dict[str, Any], now: Optional[str] = None) -> tuple:
+    """Values of one reading in _WIDE_COLUMNS order."""
+    ctx = ctx or {}
+    return (
+        ctx.get('zona'), _normalize_hora(ctx.get('hora')) or now, ctx.get('evento_biomasa', 0),
+        ctx.get('quality_level'),
+        m.get('pm2_5'), m.get('pm10'), m.get('no2'), m.get('co'), m.get('o3'), m.get('so2'),
+        cond.get('temperatura'), cond.get('humedad'), cond.get('v_viento'),
+    )
+
+
+def _insert_chunk_wide(cur: sqlite3.Cursor, chunk: list) -> List[Tuple[int, int, int]]:
+    first_id = cur.execute(_NEXT_READING_ID).fetchone()[0]
+    now = datetime.now().isoformat(timespec='seconds')
+    rows = [(first_id + i,) + _wide_row(m, cond, ctx, now) for i, (m, cond, ctx) in enumerate(chunk)]
+    cur.executemany(
+        f"""
+        INSERT INTO lecturas (id, {", ".join(_WIDE_COLUMNS)})
+        VALUES ({", ".join("?" * (len(_WIDE_COLUMNS) + 1))})
+        """,
+        rows,
+    )
+    _update_rollups(cur, [(r[1], r[2], r[4], m) for r, (m, _, _) in zip(rows, chunk)])
+    return [(r[0], r[0], r[0]) for r in rows]
+
 
-        return medida_id, condicion_id, contexto_id
+def _insert_chunk(cur: sqlite3.Cursor, chunk: list) -> List[Tuple[int, int, int]]:
+    """Insert a chunk of (measurement, condition, context) records with
+    one executemany per table. Ids are assigned explicitly so the contexto
+    rows can reference their medidas/condiciones without per-row lastrowid.
+    Returns the (medida_id, condicion_id, contexto_id) of each record.
+    """
+    medida_id = _next_id(cur, "medidas")
+    condicion_id = _next_id(cur, "condiciones")
+    contexto_id = _next_id(cur, "contexto")
+    now = datetime.now().isoformat(timespec='seconds')
+
+    medidas, condiciones, contextos = [], [], []
+    for i, (m, cond, ctx) in enumerate(chunk):
+        ctx = ctx or {}
+        medidas.append((
+            medida_id + i, m.get('pm2_5'), m.get('pm10'), m.get('no2'),
+            m.get('co'), m.get('o3'), m.get('so2'),
+        ))
+        condiciones.append((
+            condicion_id + i, cond.get('temperatura'), cond.get('humedad'), cond.get('v_viento'),
+        ))
+        contextos.append((
+            contexto_id + i, ctx.get('zona'), _normalize_hora(ctx.get('hora')) or now,
+            ctx.get('evento_biomasa', 0), ctx.get('quality_level'), medida_id + i, condicion_id + i,
+        ))
+
+    cur.executemany(
+        "INSERT INTO medidas (id, pm2_5, pm10, no2, co, o3, so2) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        medidas,
+    )
+    cur.executemany(
+        "INSERT INTO condiciones (id, temperatura, humedad, v_viento) VALUES (?, ?, ?, ?)",
+        condiciones,
+    )
+    cur.executemany(
+        """
+        INSERT INTO contexto (id, zona, hora, evento_biomasa, quality_level, medida_id, condicion_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        contextos,
+    )
+    _update_rollups(cur, [(x[1], x[2], x[4], m) for x, (m, _, _) in zip(contextos, chunk)])
+    return [(x[5], x[6], x[0]) for x in contextos]
+
+
+def save_full_records(
+    records: Iterable[Record],
+    chunk_size: int = 5000,
+    on_chunk: Optional[Callable[[int], None]] = None,
+    path: Optional[Path] = None,
+    on_saved: Optional[Callable[[List[Record]], None]] = None,
+) -> int:
+    """Bulk version of save_full_record for large loads.
+
+    - records: iterable of (measurement, condition, context_extra) dicts,
+      consumed lazily so it can stream from a file
+    - chunk_size: records read per transaction
+    - on_chunk: optional callback receiving the running total after each commit
+    - path: database file (default _DB_PATH)
+    - on_saved: optional callback receiving the records written by each
+      commit (skipped duplicates left out, hora filled in)
+
+    Uses a single connection and one transaction per chunk. Records whose
+    idempotency_key() is already stored, or repeated in the input, are
+    skipped, so a load can be re-run; records with neither hora nor
+    idempotency_key are always written. Returns the number of records
+    written.
+    """
+    total = 0
+    it = iter(records)
+    with _conn(path) as c:
+        while True:
+            chunk = list(islice(it, chunk_size))
+            if not chunk:
+                break
+            chunk = [(m, cond, dict(ctx or {}, hora=_normalize_hora((ctx or {}).get('hora'))))
+                     for m, cond, ctx in chunk]
+            keys = [idempotency_key(m, cond, ctx) for m, cond, ctx in chunk]
+            now = datetime.now().isoformat(timespec='seconds')
+            for _, _, ctx in chunk:
+                ctx['hora'] = ctx['hora'] or now
+            seen = _seen_keys(c)
+            for attempt in (seen, None):
+                c.execute("BEGIN IMMEDIATE")
+                try:
+                    cur = c.cursor()
+                    fresh = _unseen(cur, keys, attempt)
+                    todo = [chunk[i] for i in fresh]
+                    insert = _insert_chunk_wide if _layout(c) == WIDE else _insert_chunk
+                    ids = insert(cur, todo) if todo else []
+                    cur.executemany(
+                        _INSERT_KEY, [(keys[i],) + row for i, row in zip(fresh, ids) if keys[i] is not None]
+                    )
+                except sqlite3.IntegrityError as e:
+                    # Keys saved by another process: retry looking up every key.
+                    c.rollback()
+                    error = e
+                    continue
+                except Exception:
+                    c.rollback()
+                    raise
+                c.commit()
+                break
+            else:
+                # Still conflicting with every key looked up: nothing was written.
+                raise error
+            seen.add_many([keys[i] for i in fresh if keys[i] is not None])
+            _bump_write_version()
+            total += len(fresh)
+            if on_saved and todo:
+                on_saved(todo)
+            if on_chunk:
+                on_chunk(total)
+    return total
+
+
+def _measurements_select(c: sqlite3.Connection) -> str:
+    return f"""
+        SELECT id, timestamp, pm2_5, pm10, no2, co, o3, so2
+        FROM {_MEASUREMENT_TABLE[_layout(c)]} ORDER BY id DESC LIMIT ?
+    """
 
 
 def fetch_last_measurements(n: int = 20) -> Iterable[Tuple]:
     with _conn() as c:
-        return c.execute(
+        rows = c.execute(_measurements_select(c), (n,)).fetchall()
+        partitions = _archived_partitions(c)
+    for p in sorted(partitions, key=lambda p: p.max_medida_id or 0, reverse=True):
+        if len(rows) >= n and rows[n - 1][0] > (p.max_medida_id or 0):
+            break
+        with _conn(p.path) as a:
+            rows = _merge_top(rows, a.execute(_measurements_select(a), (n,)).fetchall(), lambda r: r[0], n)
+    return rows
+
+
+def _context_select(c: sqlite3.Connection) -> str:
+    """SELECT of one reading per row in CONTEXT_COLUMNS order, aliased `ctx`."""
+    source, m, cond = _READING_SOURCE[_layout(c)]
+    return f"""
+        SELECT ctx.id, ctx.zona, ctx.hora, ctx.evento_biomasa, ctx.quality_level,
+               {m}.pm2_5, {m}.pm10, {m}.no2, {m}.co, {m}.o3, {m}.so2,
+               {cond}.temperatura, {cond}.humedad, {cond}.v_viento
+        FROM {source}
+    """
+
+
+def fetch_recent_context(n: int = 20) -> Iterable[Tuple]:
+    tail = " ORDER BY ctx.id DESC LIMIT ?"
+    with _conn() as c:
+        rows = c.execute(_context_select(c) + tail, (n,)).fetchall()
+        partitions = _archived_partitions(c)
+    for p in sorted(partitions, key=lambda p: p.max_id or 0, reverse=True):
+        if len(rows) >= n and rows[n - 1][0] > (p.max_id or 0):
+            break
+        with _conn(p.path) as a:
+            rows = _merge_top(rows, a.execute(_context_select(a) + tail, (n,)).fetchall(), lambda r: r[0], n)
+    return rows
+
+
+CONTEXT_COLUMNS = (
+    "id", "zona", "hora", "evento_biomasa", "quality_level",
+    "pm2_5", "pm10", "no2", "co", "o3", "so2",
+    "temperatura", "humedad", "v_viento",
+)
+
+Cursor = Tuple[str, int]
+
+
+def _hora_key(row: Tuple) -> Tuple:
+    """Sort key matching ORDER BY ctx.hora, ctx.id (NULL hora sorts first)."""
+    return (row[2] is not None, row[2] or "", row[0])
+
+
+def query_context(
+    zona: Optional[str] = None,
+    since: Any = None,
+    until: Any = None,
+    quality_level: Any = None,
+    cursor: Optional[Cursor] = None,
+    limit: int = 100,
+) -> Tuple[list, Optional[Cursor]]:
+    """Filter contexto (joined like fetch_recent_context) by zone, time range
+    [since, until) and quality level, newest first.
+
+    - quality_level: a label or a list of labels
+    - cursor: (hora, id) of the last row of the previous page
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    Pagination is keyset-based on (hora, id), so every page is an index
+    range scan regardless of how deep it is. Archived months are only
+    read when they can contribute rows to the page.
+    """
+    where, params = [], []
+    if zona is not None:
+        where.append("ctx.zona = ?")
+        params.append(zona)
+    if quality_level is not None:
+        levels = [quality_level] if isinstance(quality_level, str) else list(quality_level)
+        where.append(f"ctx.quality_level IN ({', '.join('?' * len(levels))})")
+        params.extend(levels)
+    if since is not None:
+        since = _normalize_hora(since)
+        where.append("ctx.hora >= ?")
+        params.append(since)
+    if until is not None:
+        until = _normalize_hora(until)
+        where.append("ctx.hora < ?")
+        params.append(until)
+    if cursor is not None:
+        where.append("(ctx.hora, ctx.id) < (?, ?)")
+        params.extend(cursor)
+    tail = ""
+    if where:
+        tail += " WHERE " + " AND ".join(where)
+    tail += " ORDER BY ctx.hora DESC, ctx.id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    with _conn() as c:
+        rows = c.execute(_context_select(c) + tail, params).fetchall()
+        partitions = _archived_partitions(c)
+    for p in partitions:  # newest month first
+        if not p.filas:
+            continue
+        if len(rows) > limit and rows[limit][2] is not None and rows[limit][2] > p.max_hora:
+            break
+        if since is not None and p.max_hora < str(since):
+            break
+        if until is not None and p.min_hora >= str(until):
+            continue
+        if cursor is not None and p.min_hora > cursor[0]:
+            continue
+        with _conn(p.path) as a:
+            rows = _merge_top(rows, a.execute(_context_select(a) + tail, params).fetchall(), _hora_key, limit + 1)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, (last[2], last[0])
+    return rows, None
+
+
+def _iter_rows(path: Optional[Path], tail: str, params: tuple, chunk_size: int) -> Iterator[Tuple]:
+    with _conn(path) as c:
+        cur = c.execute(_context_select(c) + tail, params)
+        try:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cur.close()
+
+
+def iter_context_chunks(
+    chunk_size: int = 5000,
+    limit: Optional[int] = None,
+) -> Iterator[List[Tuple]]:
+    """Stream the fetch_recent_context join, newest first, as lists of at
+    most `chunk_size` rows, so callers can process the whole table in
+    constant memory. `limit` caps the total number of rows. Archived
+    partitions are merged in by id.
+    """
+    tail = " ORDER BY ctx.id DESC LIMIT ?"
+    params = (-1 if limit is None else limit,)
+    with _conn() as c:
+        partitions = _archived_partitions(c)
+    streams = [_iter_rows(None, tail, params, chunk_size)]
+    streams += [_iter_rows(p.path, tail, params, chunk_size) for p in partitions]
+    merged = heapq.merge(*streams, key=lambda r: r[0], reverse=True) if partitions else streams[0]
+    rows = []
+    for row in islice(_unique_ids(merged), limit):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+
+def _unique_ids(rows: Iterable[Tuple]) -> Iterator[Tuple]:
+    """Drop repeated ids from an id-ordered stream (a row can briefly exist
+    both live and archived, see archive_month)."""
+    last = None
+    for row in rows:
+        if row[0] != last:
+            yield row
+        last = row[0]
+
+
+def _merge_top(rows: list, more: list, key: Callable, n: int) -> list:
+    """Merge two result lists sorted by `key` descending, keep the first n,
+    and drop duplicate ids."""
+    unique = {r[0]: r for r in more}
+    unique.update((r[0], r) for r in rows)
+    return sorted(unique.values(), key=key, reverse=True)[:n]
+
+
+# Partitions: raw rows of cold months are moved to one SQLite file per
+# month next to the live database (<db stem>_archive/YYYY-MM.db). The live
+# database keeps the rollups and a catalog (particiones) with the id and
+# hora bounds of every archive, which the read functions above use to skip
+# archives that cannot contribute rows. Reads open each archive as its own
+# pooled connection, so the number of months is not limited by SQLite's
+# maximum of attached databases; archive_month() attaches it only to copy.
+
+class Partition(NamedTuple):
+    mes: str
+    path: Path
+    filas: int
+    min_id: Optional[int]
+    max_id: Optional[int]
+    max_medida_id: Optional[int]
+    min_hora: Optional[str]
+    max_hora: Optional[str]
+
+
+def _archive_dir() -> Path:
+    return _DB_PATH.parent / f"{_DB_PATH.stem}_archive"
+
+
+def _archived_partitions(c: sqlite3.Connection) -> List[Partition]:
+    """Catalog entries, newest month first ([] when nothing was archived)."""
+    if not _archive_dir().is_dir():
+        return []
+    try:
+        rows = c.execute(
             """
-            SELECT id, timestamp, pm2_5, pm10, no2, co, o3, so2
-            FROM medidas ORDER BY id DESC LIMIT ?
+            SELECT mes, archivo, filas, min_id, max_id, max_medida_id, min_hora, max_hora
+            FROM particiones ORDER BY mes DESC
+            """
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    return [Partition(r[0], _archive_dir() / r[1], *r[2:]) for r in rows]
+
+
+def archived_partitions() -> List[Partition]:
+    """Archived months known to the live database, newest first."""
+    with _conn() as c:
+        return _archived_partitions(c)
+
+
+def _meta_get(c: sqlite3.Connection, key: str) -> Optional[str]:
+    try:
+        row = c.execute("SELECT valor FROM db_meta WHERE clave = ?", (key,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def _meta_set(c: sqlite3.Connection, key: str, value: Any) -> None:
+    c.execute(
+        "INSERT INTO db_meta (clave, valor) VALUES (?, ?) ON CONFLICT (clave) DO UPDATE SET valor = excluded.valor",
+        (key, None if value is None else str(value)),
+    )
+
+
+def _month_bounds(mes: str) -> Tuple[str, str]:
+    """['YYYY-MM-01T00:00:00', first instant of the next month)."""
+    start = datetime.strptime(mes, "%Y-%m")
+    end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start.isoformat(timespec='seconds'), end.isoformat(timespec='seconds')
+
+
+def _delete_context_rows(cur: sqlite3.Cursor, schema: str, where: str, params: tuple, layout: str) -> int:
+    """Delete the readings matching `where` (contexto rows together with
+    their medidas and condiciones rows). Returns the number deleted."""
+    if layout == WIDE:
+        cur.execute(f"DELETE FROM {schema}.lecturas WHERE {where}", params)
+        return cur.rowcount
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS retiro (contexto_id INTEGER, medida_id INTEGER, condicion_id INTEGER)")
+    cur.execute("DELETE FROM temp.retiro")
+    cur.execute(
+        f"INSERT INTO temp.retiro SELECT id, medida_id, condicion_id FROM {schema}.contexto WHERE {where}",
+        params,
+    )
+    cur.execute(f"DELETE FROM {schema}.contexto WHERE id IN (SELECT contexto_id FROM temp.retiro)")
+    deleted = cur.rowcount
+    cur.execute(f"DELETE FROM {schema}.medidas WHERE id IN (SELECT medida_id FROM temp.retiro)")
+    cur.execute(f"DELETE FROM {schema}.condiciones WHERE id IN (SELECT condicion_id FROM temp.retiro)")
+    cur.execute("DELETE FROM temp.retiro")
+    return deleted
+
+
+def _refresh_partition(cur: sqlite3.Cursor, mes: str, schema: str, archivo: str, layout: str) -> None:
+    """Recompute the catalog entry of a partition from its attached tables."""
+    medida_id = "id" if layout == WIDE else "medida_id"
+    stats = cur.execute(
+        f"""
+        SELECT COUNT(*), MIN(id), MAX(id), MAX({medida_id}), MIN(hora), MAX(hora)
+        FROM {schema}.{_READING_TABLE[layout]}
+        """
+    ).fetchone()
+    cur.execute(
+        """
+        INSERT OR REPLACE INTO particiones (mes, archivo, filas, min_id, max_id, max_medida_id, min_hora, max_hora)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (mes, archivo) + tuple(stats),
+    )
+
+
+def unarchived_months(before: Any) -> List[str]:
+    """Months ('YYYY-MM') with live raw rows whose hora is before `before`."""
+    with _conn() as c:
+        rows = c.execute(
+            f"""
+            SELECT DISTINCT substr(hora, 1, 7) FROM {_READING_TABLE[_layout(c)]}
+            WHERE hora >= '0000' AND hora < ? ORDER BY 1
             """,
-            (n,),
+            (_normalize_hora(before),),
         ).fetchall()
+    return [r[0] for r in rows if len(r[0]) == 7]
 
 
-def fetch_recent_context(n: int = 20) -> Iterable[Tuple]:
+def archive_month(mes: str) -> int:
+    """Move the live raw rows whose hora falls in month `mes` ('YYYY-MM')
+    into its archive file and update the catalog. Rollups stay in the live
+    database. Returns the number of contexto rows moved.
+
+    The archive is attached to the live connection for the copy. SQLite
+    only commits attached WAL databases atomically per file, so the copy
+    is idempotent (INSERT OR IGNORE on the original ids) and the read
+    functions skip ids present in both places; re-running after a crash
+    finishes the move.
+    """
+    start, end = _month_bounds(mes)
+    archivo = f"{mes}.db"
+    path = _archive_dir() / archivo
     with _conn() as c:
-        return c.execute(
+        layout = _layout(c)
+        # The archive gets the live schema of the reading tables.
+        tables = ("lecturas",) if layout == WIDE else ("medidas", "condiciones", "contexto")
+        ddl = c.execute(
+            f"""
+            SELECT sql FROM sqlite_master
+            WHERE tbl_name IN ({", ".join("?" * len(tables))}) AND sql IS NOT NULL
+            ORDER BY type DESC
+            """,
+            tables,
+        ).fetchall()
+    with _conn(path) as a:
+        if _layout(a) != layout or not a.execute(
+            f"SELECT COUNT(*) FROM sqlite_master WHERE name = '{_READING_TABLE[layout]}'"
+        ).fetchone()[0]:
+            for (sql,) in ddl:
+                a.execute(sql)
+            a.layout = layout
+
+    with _conn() as c:
+        c.execute("ATTACH DATABASE ? AS arch", (str(path),))
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                cur = c.cursor()
+                in_month = "hora >= ? AND hora < ?"
+                if layout == NORMALIZED:
+                    cur.execute(
+                        f"""
+                        INSERT OR IGNORE INTO arch.medidas
+                        SELECT m.* FROM medidas m JOIN contexto ctx ON ctx.medida_id = m.id
+                        WHERE ctx.{in_month}
+                        """,
+                        (start, end),
+                    )
+                    cur.execute(
+                        f"""
+                        INSERT OR IGNORE INTO arch.condiciones
+                        SELECT k.* FROM condiciones k JOIN contexto ctx ON ctx.condicion_id = k.id
+                        WHERE ctx.{in_month}
+                        """,
+                        (start, end),
+                    )
+                table = _READING_TABLE[layout]
+                cur.execute(f"INSERT OR IGNORE INTO arch.{table} SELECT * FROM {table} WHERE {in_month}", (start, end))
+                moved = _delete_context_rows(cur, "main", in_month, (start, end), layout)
+                _refresh_partition(cur, mes, "arch", archivo, layout)
+            except Exception:
+                c.rollback()
+                raise
+            c.commit()
+        finally:
+            c.execute("DETACH DATABASE arch")
+    return moved
+
+
+def drop_raw_before(cutoff: Any) -> int:
+    """Downsample: delete raw rows (live and archived) whose hora is before
+    `cutoff`, truncated to midnight, keeping only their rollups. Archives
+    left empty are removed. Records the cutoff as the watermark that
+    rebuild_rollups() will not cross. Returns the number of contexto rows
+    deleted.
+    """
+    cutoff = str(_normalize_hora(cutoff))[:10] + "T00:00:00"
+    old = "hora >= '0000' AND hora < ?"
+    with _conn() as c:
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = _delete_context_rows(c.cursor(), "main", old, (cutoff,), _layout(c))
+            previous = _meta_get(c, "downsampled_before")
+            _meta_set(c, "downsampled_before", max(cutoff, previous or ""))
+        except Exception:
+            c.rollback()
+            raise
+        c.commit()
+        partitions = _archived_partitions(c)
+
+    for p in partitions:
+        if p.min_hora is None or p.min_hora >= cutoff:
+            continue
+        if p.max_hora < cutoff:
+            with _conn() as c:
+                c.execute("DELETE FROM particiones WHERE mes = ?", (p.mes,))
+            deleted += p.filas
+            _close_path(p.path)
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(f"{p.path}{suffix}")
+                except FileNotFoundError:
+                    pass
+            continue
+        with _conn(p.path) as a:
+            layout = _layout(a)
+            deleted += _delete_context_rows(a.cursor(), "main", old, (cutoff,), layout)
+        with _conn() as c:
+            c.execute("ATTACH DATABASE ? AS arch", (str(p.path),))
+            try:
+                _refresh_partition(c.cursor(), p.mes, "arch", p.path.name, layout)
+                c.commit()
+            finally:
+                c.execute("DETACH DATABASE arch")
+    _bump_write_version()
+    return deleted
+
+
+def _database_paths() -> List[Path]:
+    with _conn() as c:
+        return [_DB_PATH] + [p.path for p in _archived_partitions(c)]
+
+
+def database_files() -> List[Path]:
+    """The live database followed by its archive partitions."""
+    return _database_paths()
+
+
+def get_meta(key: str) -> Optional[str]:
+    """Value stored under `key` in db_meta, or None."""
+    with _conn() as c:
+        return _meta_get(c, key)
+
+
+def set_meta(key: str, value: Any) -> None:
+    """Store `value` under `key` in db_meta."""
+    with _writing() as c:
+        _meta_set(c, key, value)
+
+
+class FollowCheckpoint(NamedTuple):
+    """Read position of a followed CSV file. `generacion` grows each time
+    the file is truncated or rotated; `posicion` is the byte offset of the
+    first line not yet ingested and `cabecera` the header line."""
+    archivo: str
+    inodo: Optional[int]
+    generacion: int
+    posicion: int
+    cabecera: Optional[str]
+
+
+def get_follow_checkpoint(archivo: str) -> Optional[FollowCheckpoint]:
+    """Checkpoint stored for `archivo`, or None if it was never followed."""
+    with _conn() as c:
+        row = c.execute(
+            "SELECT archivo, inodo, generacion, posicion, cabecera FROM seguimiento_csv WHERE archivo = ?",
+            (archivo,),
+        ).fetchone()
+    return FollowCheckpoint(*row) if row else None
+
+
+def save_follow_checkpoint(checkpoint: FollowCheckpoint) -> None:
+    """Insert or replace the checkpoint of `checkpoint.archivo`."""
+    with _conn() as c:
+        c.execute(
             """
-            SELECT ctx.id, ctx.zona, ctx.hora, ctx.evento_biomasa, ctx.quality_level,
-                   m.pm2_5, m.pm10, m.no2, m.co, m.o3, m.so2,
-                   cond.temperatura, cond.humedad, cond.v_viento
-            FROM contexto ctx
-            LEFT JOIN medidas m ON ctx.medida_id = m.id
-            LEFT JOIN condiciones cond ON ctx.condicion_id = cond.id
-            ORDER BY ctx.id DESC LIMIT ?
+            INSERT INTO seguimiento_csv (archivo, inodo, generacion, posicion, cabecera, actualizado)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (archivo) DO UPDATE SET
+                inodo = excluded.inodo, generacion = excluded.generacion, posicion = excluded.posicion,
+                cabecera = excluded.cabecera, actualizado = excluded.actualizado
             """,
-            (n,),
+            tuple(checkpoint) + (datetime.now().isoformat(timespec='seconds'),),
+        )
+
+
+def fetch_readings_after(after_id: int, limit: int, path: Optional[Path] = None) -> List[Tuple]:
+    """Up to `limit` readings (CONTEXT_COLUMNS order) with id > after_id
+    from one database file (default _DB_PATH), by id. Keyset pagination
+    for jobs that walk a whole file in chunks."""
+    with _conn(path) as c:
+        return c.execute(
+            _context_select(c) + " WHERE ctx.id > ? ORDER BY ctx.id LIMIT ?", (after_id, limit)
         ).fetchall()
+
+
+def update_quality_levels(
+    changes: List[Tuple[int, Any, Any, Any, Any]],
+    path: Optional[Path] = None,
+    meta: Optional[Tuple[str, Any]] = None,
+) -> None:
+    """Relabel readings of one database file (default _DB_PATH).
+
+    - changes: (id, zona, hora, old quality_level, new quality_level)
+    - meta: optional (key, value) stored in db_meta in the same
+      transaction, e.g. a job checkpoint
+
+    rollup_calidad counts move from the old to the new level. For an
+    archive the file is attached to the live connection; as in
+    archive_month, SQLite commits each attached WAL file separately.
+    """
+    deltas: Dict[Tuple, int] = {}
+    for _, zona, hora, old, new in changes:
+        zona, hora = zona or '', str(hora or '')
+        for periodo, width in ROLLUP_PERIODS.items():
+            bucket = hora[:width]
+            deltas[(periodo, zona, bucket, old or '')] = deltas.get((periodo, zona, bucket, old or ''), 0) - 1
+            deltas[(periodo, zona, bucket, new or '')] = deltas.get((periodo, zona, bucket, new or ''), 0) + 1
+    archive = path is not None and Path(path) != _DB_PATH
+    if archive:
+        with _conn(path) as a:
+            layout = _layout(a)
+    with _conn() as c:
+        if archive:
+            c.execute("ATTACH DATABASE ? AS arch", (str(path),))
+        else:
+            layout = _layout(c)
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                cur = c.cursor()
+                cur.executemany(
+                    f"UPDATE {'arch' if archive else 'main'}.{_READING_TABLE[layout]} SET quality_level = ? WHERE id = ?",
+                    [(new, row_id) for row_id, _, _, _, new in changes],
+                )
+                cur.executemany(_UPSERT_ROLLUP_CALIDAD, [key + (n,) for key, n in deltas.items() if n])
+                cur.executemany(
+                    """
+                    DELETE FROM rollup_calidad
+                    WHERE periodo = ? AND zona = ? AND bucket = ? AND quality_level = ? AND n <= 0
+                    """,
+                    [key for key, n in deltas.items() if n < 0],
+                )
+                if meta is not None:
+                    _meta_set(c, *meta)
+            except Exception:
+                c.rollback()
+                raise
+            c.commit()
+        finally:
+            if archive:
+                c.execute("DETACH DATABASE arch")
+    if changes:
+        _bump_write_version()
+
+
+def incremental_vacuum(pages: Optional[int] = None) -> int:
+    """Return free pages of the live database and its archives to the file
+    system (PRAGMA incremental_vacuum). `pages` caps the pages per file;
+    None frees all of them. Returns the number of pages released."""
+    freed = 0
+    for path in _database_paths():
+        c = _get_conn(path)
+        before = c.execute("PRAGMA freelist_count").fetchone()[0]
+        arg = "" if pages is None else f"({int(pages)})"
+        c.execute(f"PRAGMA incremental_vacuum{arg}").fetchall()
+        freed += before - c.execute("PRAGMA freelist_count").fetchone()[0]
+    return freed
+
+
+def enable_incremental_vacuum() -> List[Path]:
+    """Switch files created without auto_vacuum=INCREMENTAL to it. This
+    needs a full VACUUM (rewrites the file), so it is explicit and one-off.
+    Returns the paths that were converted."""
+    converted = []
+    for path in _database_paths():
+        c = _get_conn(path)
+        if c.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            c.execute("VACUUM")
+            converted.append(path)
+    return converted
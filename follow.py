@@ -0,0 +1,180 @@
+"""Ingesta incremental de CSV que crecen (modo seguimiento, como `tail -f`).
+
+Las pasarelas de campo anexan filas a archivos con el formato de
+data/initial_data.csv. follow_once() guarda solo lo anexado desde la
+pasada anterior: el punto de control de cada archivo (tabla
+seguimiento_csv: inodo, generación, posición en bytes y cabecera) indica
+dónde seguir, así que nunca se relee lo ya cargado. Solo se consumen
+líneas completas; una línea a medio escribir espera a la pasada siguiente.
+
+- truncado (el archivo es más corto que la posición guardada o cambió la
+  cabecera): se lee desde el principio como una generación nueva
+- rotación (otro inodo en la misma ruta): se termina de leer el archivo
+  rotado si sigue en el mismo directorio (p. ej. `feed.csv.1`) y luego se
+  empieza el nuevo
+
+El punto de control se guarda tras cada bloque. Si el proceso se corta
+entre el bloque y su punto de control, esas filas se vuelven a leer y
+save_full_records las omite: las que traen hora por su contenido y las
+que no, por una clave de posición (archivo, generación, byte).
+
+Supone una fila por línea, sin saltos de línea dentro de comillas.
+
+Uso desde la terminal:
+
+    flask --app app follow-csv data/initial_data.csv --interval 1
+"""
+import csv
+import dataclasses
+import io
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Callable, List, Optional, Sequence, Tuple
+
+import database
+from acquisition_module import RowError
+from database import FollowCheckpoint
+from inference_engine import AirExpertEngine
+from ingest import evaluate_rows
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class FollowStats:
+    rows: int = 0
+    saved: int = 0
+    # RowError con la posición en bytes de la línea en `row`
+    errors: List[RowError] = field(default_factory=list)
+    truncations: int = 0
+    rotations: int = 0
+
+
+def _read_header(f: BinaryIO) -> Optional[str]:
+    """Primera línea del archivo si ya está completa."""
+    f.seek(0)
+    line = f.readline()
+    return line.decode("utf-8").rstrip("\r\n") if line.endswith(b"\n") else None
+
+
+def _read_lines(f: BinaryIO, start: int, max_lines: int) -> Tuple[List[Tuple[int, bytes]], int]:
+    """Hasta max_lines líneas completas desde `start`.
+
+    Devuelve ([(posición, línea)], posición de la primera línea no leída).
+    """
+    f.seek(start)
+    lines, pos = [], start
+    while len(lines) < max_lines:
+        line = f.readline()
+        if not line.endswith(b"\n"):
+            break
+        lines.append((pos, line))
+        pos += len(line)
+    return lines, pos
+
+
+def _drain(
+    f: BinaryIO, cp: FollowCheckpoint, engine: AirExpertEngine, chunk_size: int, stats: FollowStats
+) -> FollowCheckpoint:
+    """Guarda las líneas completas de `f` desde cp.posicion, un bloque por
+    transacción, y devuelve el punto de control final."""
+    if cp.cabecera is None:
+        header = _read_header(f)
+        if header is None:
+            return cp
+        cp = cp._replace(cabecera=header, posicion=f.tell())
+    fieldnames = next(csv.reader([cp.cabecera]), [])
+    while True:
+        lines, end = _read_lines(f, cp.posicion, chunk_size)
+        if not lines:
+            return cp
+        lines = [(pos, line) for pos, line in lines if line.strip()]
+        if lines:
+            text = b"".join(line for _, line in lines).decode("utf-8")
+            rows = list(csv.DictReader(io.StringIO(text, newline=""), fieldnames=fieldnames))
+            records, errors = evaluate_rows(rows, engine)
+            bad = {e.row for e in errors}
+            positions = [pos for i, (pos, _) in enumerate(lines) if i not in bad]
+            for (_, _, contexto), pos in zip(records, positions):
+                if not contexto["hora"]:
+                    contexto["idempotency_key"] = f"csv:{cp.archivo}:{cp.generacion}:{pos}"
+            for e in errors:
+                e = dataclasses.replace(e, row=lines[e.row][0])
+                log.warning("%s byte %d: %s=%r %s", cp.archivo, e.row, e.field, e.value, e.message)
+                stats.errors.append(e)
+            stats.rows += len(rows)
+            stats.saved += database.save_full_records(records, chunk_size=len(records) + 1)
+        cp = cp._replace(posicion=end)
+        database.save_follow_checkpoint(cp)
+
+
+def _rotated(path: Path, inode: int) -> Optional[Path]:
+    """Archivo del mismo directorio con el inodo anterior de `path`."""
+    for candidate in sorted(path.parent.glob(f"{path.name}?*")):
+        try:
+            if candidate.stat().st_ino == inode:
+                return candidate
+        except OSError:
+            continue
+    return None
+
+
+def follow_once(path: Path, engine: Optional[AirExpertEngine] = None, chunk_size: int = 5000) -> FollowStats:
+    """Guarda las filas anexadas a `path` desde la última pasada."""
+    engine = engine or AirExpertEngine()
+    path = Path(path)
+    archivo = str(path.resolve())
+    cp = database.get_follow_checkpoint(archivo) or FollowCheckpoint(archivo, None, 0, 0, None)
+    stats = FollowStats()
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return stats  # rotado y todavía sin recrear
+    with f:
+        st = os.fstat(f.fileno())
+        if cp.inodo is not None and st.st_ino != cp.inodo:
+            old = _rotated(path, cp.inodo)
+            if old is not None:
+                with open(old, "rb") as rotated:
+                    cp = _drain(rotated, cp, engine, chunk_size, stats)
+            log.info("%s: rotado, se sigue con el archivo nuevo", archivo)
+            stats.rotations += 1
+            cp = FollowCheckpoint(archivo, st.st_ino, cp.generacion + 1, 0, None)
+        elif st.st_size < cp.posicion or (cp.cabecera is not None and _read_header(f) != cp.cabecera):
+            log.info("%s: truncado, se lee desde el principio", archivo)
+            stats.truncations += 1
+            cp = FollowCheckpoint(archivo, st.st_ino, cp.generacion + 1, 0, None)
+        cp = _drain(f, cp._replace(inodo=st.st_ino), engine, chunk_size, stats)
+    database.save_follow_checkpoint(cp)
+    return stats
+
+
+def follow(
+    paths: Sequence[Path],
+    engine: Optional[AirExpertEngine] = None,
+    interval: float = 1.0,
+    chunk_size: int = 5000,
+    stop: Optional[threading.Event] = None,
+    on_pass: Optional[Callable[[Path, FollowStats], None]] = None,
+) -> None:
+    """Repite follow_once() sobre cada archivo cada `interval` segundos
+    hasta que se activa `stop`. Un error en un archivo se registra y no
+    detiene a los demás."""
+    engine = engine or AirExpertEngine()
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        for path in paths:
+            try:
+                stats = follow_once(path, engine, chunk_size)
+            except Exception:
+                log.exception("Falló el seguimiento de %s", path)
+                continue
+            if stats.saved or stats.errors:
+                log.info("%s: %d filas nuevas, %d guardadas, %d inválidas",
+                         path, stats.rows, stats.saved, len(stats.errors))
+            if on_pass is not None:
+                on_pass(Path(path), stats)
+        stop.wait(interval)
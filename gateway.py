@@ -0,0 +1,388 @@
+"""Pasarela asyncio de ingesta para muchos sensores (TCP y UDP).
+
+Pensada para miles de sensores de bajo consumo que envían una lectura por
+minuto, sin pasar por el formulario de Flask. Cada línea es una lectura:
+
+- JSON:           {"zona": "Centro", "pm25": 12.5, "temp": 22}
+- línea de texto: zona=Centro pm25=12.5 temp=22   (valores con espacios
+  entre comillas: zona="San Miguel")
+
+Los campos son los del CSV de entrada (CSV_ALIASES: pm25 o PM2_5_24h,
+temp o temperatura, ...), más hora, evento_biomasa e idempotency_key
+opcionales. Las lecturas se acumulan en microlotes (hasta `batch_size` o
+`max_delay` segundos), se validan y evalúan por columnas
+(ingest.evaluate_rows) en un hilo y pasan a un único escritor que las
+guarda en otro con app.persist_records (SQLite y el log binario del
+historial, como el POST /); el bucle solo reparte líneas y respuestas.
+
+Por TCP cada línea recibe respuesta, en orden y una vez guardada:
+`ok <nivel>` o `error <campo>: <mensaje>` (un objeto JSON si la línea era
+JSON). Contrapresión: cada conexión tiene como mucho `max_inflight`
+lecturas sin responder y la cola común `max_pending`; al llegar al límite
+se deja de leer el socket y TCP frena al cliente. Por UDP no hay
+respuesta: con la cola llena el datagrama se descarta y se cuenta.
+
+El feed en vivo (GET /api/stream) vive en la memoria de cada proceso web,
+así que no ve las lecturas de la pasarela; el historial de GET / sí, porque
+sale de SQLite. Para decenas de miles de conexiones hace falta un límite
+de descriptores alto (main() sube el propio hasta el máximo permitido).
+
+Uso:
+
+    python gateway.py --port 7070 --udp-port 7070
+"""
+import argparse
+import asyncio
+import json
+import logging
+import shlex
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import database
+import metrics
+from inference_engine import AirExpertEngine
+from ingest import evaluate_rows
+
+log = logging.getLogger(__name__)
+
+LINES = metrics.REGISTRY.counter("air_gateway_lines_total", "Lecturas recibidas por la pasarela por resultado.")
+
+_STOP = object()
+# (aceptada, nivel o mensaje de error)
+Result = Tuple[bool, str]
+
+
+@dataclass
+class GatewayStats:
+    connections: int = 0
+    lines: int = 0
+    saved: int = 0
+    invalid: int = 0
+    dropped: int = 0
+    failed: int = 0
+
+
+def parse_line(line: bytes) -> Dict[str, str]:
+    """Convierte una línea (JSON o clave=valor) en una fila como las del CSV.
+
+    Lanza ValueError si la línea no tiene ninguno de los dos formatos.
+    """
+    text = line.decode("utf-8").strip()
+    if text.startswith("{"):
+        obj = json.loads(text)
+        if not isinstance(obj, dict):
+            raise ValueError("se esperaba un objeto JSON")
+        return {str(k): "" if v is None else str(v) for k, v in obj.items()}
+    row = {}
+    for token in shlex.split(text):
+        key, sep, value = token.partition("=")
+        if not sep or not key:
+            raise ValueError(f"se esperaba clave=valor: {token!r}")
+        row[key] = value
+    return row
+
+
+def _reply(result: Result, as_json: bool) -> bytes:
+    ok, text = result
+    if as_json:
+        body = {"ok": True, "quality_level": text} if ok else {"ok": False, "error": text}
+        return json.dumps(body, ensure_ascii=False).encode("utf-8") + b"\n"
+    return f"{'ok' if ok else 'error'} {text}\n".encode("utf-8")
+
+
+class _Datagrams(asyncio.DatagramProtocol):
+    def __init__(self, gateway: "Gateway"):
+        self.gateway = gateway
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        for line in data.splitlines():
+            if line.strip():
+                self.gateway._offer(line)
+
+
+class Gateway:
+    """Servidor de la pasarela; start() dentro de un bucle asyncio.
+
+    - batch_size / max_delay: tamaño y espera máxima de cada microlote
+    - max_pending: lecturas en cola para el evaluador (todas las conexiones)
+    - max_inflight: lecturas sin responder por conexión TCP
+    - idle_timeout: segundos sin recibir nada antes de cerrar una conexión
+    - max_line: bytes máximos por línea
+    - save: función que guarda una lista de registros (por defecto
+      app.persist_records)
+    """
+
+    def __init__(
+        self,
+        engine: Optional[AirExpertEngine] = None,
+        batch_size: int = 500,
+        max_delay: float = 0.02,
+        max_pending: int = 10_000,
+        max_inflight: int = 32,
+        idle_timeout: float = 300.0,
+        max_line: int = 4096,
+        save: Optional[Callable[[List[tuple]], object]] = None,
+    ):
+        self.engine = engine or AirExpertEngine()
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_inflight = max_inflight
+        self.idle_timeout = idle_timeout
+        self.max_line = max_line
+        self._save = save or _persist
+        self.stats = GatewayStats()
+        self.tcp_port: Optional[int] = None
+        self.udp_port: Optional[int] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._batches: Optional[asyncio.Queue] = None
+        self._evaluator = ThreadPoolExecutor(max_workers=1, thread_name_prefix="air-gateway-eval")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="air-gateway-writer")
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._udp: Optional[asyncio.DatagramTransport] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._handlers: Set[asyncio.Task] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._closing = False
+
+    async def start(self, host: str = "127.0.0.1", port: int = 7070, udp_port: Optional[int] = None) -> "Gateway":
+        """Abre el puerto TCP (y el UDP si se indica; 0 elige uno libre)."""
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.max_pending)
+        self._batches = asyncio.Queue(2)  # un lote guardándose y otro listo
+        self._tasks = [loop.create_task(self._batcher()), loop.create_task(self._writer())]
+        self._server = await asyncio.start_server(self._handle, host, port, limit=self.max_line, backlog=4096)
+        self.tcp_port = self._server.sockets[0].getsockname()[1]
+        if udp_port is not None:
+            self._udp, _ = await loop.create_datagram_endpoint(lambda: _Datagrams(self), local_addr=(host, udp_port))
+            self.udp_port = self._udp.get_extra_info("sockname")[1]
+        log.info("Pasarela escuchando en %s tcp=%s udp=%s", host, self.tcp_port, self.udp_port)
+        return self
+
+    async def close(self) -> None:
+        """Deja de aceptar lecturas, guarda las pendientes y cierra."""
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+        if self._udp is not None:
+            self._udp.close()
+        for writer in list(self._writers):
+            writer.close()
+        # Las conexiones terminan de responder lo ya recibido.
+        await asyncio.gather(*self._handlers)
+        await self._queue.put(_STOP)
+        await asyncio.gather(*self._tasks)
+        self._evaluator.shutdown()
+        self._executor.shutdown()
+
+    # -- entrada -----------------------------------------------------------
+
+    def _parse(self, line: bytes) -> Tuple[Optional[Dict[str, str]], Optional[Result]]:
+        self.stats.lines += 1
+        try:
+            return parse_line(line), None
+        except (ValueError, UnicodeDecodeError) as e:
+            self.stats.invalid += 1
+            LINES.inc(result="invalid")
+            return None, (False, f"formato: {e}")
+
+    def _offer(self, line: bytes) -> None:
+        """Lectura UDP: se encola sin esperar o se descarta."""
+        if self._closing:
+            return
+        row, _ = self._parse(line)
+        if row is None:
+            return
+        try:
+            self._queue.put_nowait((row, None))
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+            LINES.inc(result="dropped")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        inflight: asyncio.Queue = asyncio.Queue(self.max_inflight)
+        responder = loop.create_task(self._respond(writer, inflight))
+        self._writers.add(writer)
+        self._handlers.add(asyncio.current_task())
+        self.stats.connections += 1
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except ValueError:  # línea más larga que max_line
+                    await inflight.put((_done(loop, (False, f"línea de más de {self.max_line} bytes")), False))
+                    break
+                except (asyncio.TimeoutError, ConnectionError):
+                    break
+                if not line or self._closing:
+                    break
+                if not line.strip():
+                    continue
+                as_json = line.lstrip().startswith(b"{")
+                row, error = self._parse(line)
+                if row is None:
+                    future = _done(loop, error)
+                else:
+                    future = loop.create_future()
+                    await self._queue.put((row, future))
+                await inflight.put((future, as_json))
+        finally:
+            await inflight.put(None)
+            await responder
+            self.stats.connections -= 1
+            self._writers.discard(writer)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, inflight: asyncio.Queue) -> None:
+        """Escribe las respuestas de una conexión en el orden de llegada."""
+        while True:
+            item = await inflight.get()
+            if item is None:
+                return
+            future, as_json = item
+            result = await future
+            if writer.is_closing():
+                continue
+            writer.write(_reply(result, as_json))
+            try:
+                await writer.drain()
+            except ConnectionError:
+                writer.close()
+
+    # -- evaluación y escritura ----------------------------------------------
+
+    async def _batcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            if self._queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.max_delay)
+            while len(batch) < self.batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            accepted, failed = await loop.run_in_executor(self._evaluator, self._evaluate, batch)
+            # Los futuros y las estadísticas son del bucle: se tocan aquí.
+            for future, message in failed:
+                _resolve(future, (False, message))
+            self.stats.invalid += len(failed)
+            if failed:
+                LINES.inc(len(failed), result="invalid")
+            await self._batches.put(accepted)
+        await self._batches.put(_STOP)
+
+    def _evaluate(self, batch: List[tuple]) -> Tuple[List[tuple], List[Tuple[Optional[asyncio.Future], str]]]:
+        """Valida y evalúa un microlote (en el hilo de evaluación).
+
+        Devuelve ([(registro, futuro)] de las filas válidas,
+        [(futuro, mensaje)] de las inválidas)."""
+        rows = [row for row, _ in batch]
+        records, errors = evaluate_rows(rows, self.engine)
+        failed: Dict[int, str] = {}
+        for e in errors:
+            failed.setdefault(e.row, f"{e.field}: {e.message}")
+        accepted = []
+        valid = (i for i in range(len(batch)) if i not in failed)
+        for record, i in zip(records, valid):
+            row, future = batch[i]
+            if row.get("idempotency_key"):
+                record[2]["idempotency_key"] = row["idempotency_key"]
+            accepted.append((record, future))
+        return accepted, [(batch[i][1], message) for i, message in failed.items()]
+
+    async def _writer(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._batches.get()
+            if batch is _STOP:
+                return
+            if not batch:
+                continue
+            try:
+                await loop.run_in_executor(self._executor, self._save, [record for record, _ in batch])
+            except Exception:
+                log.exception("No se pudo guardar un lote de %d lecturas", len(batch))
+                self.stats.failed += len(batch)
+                LINES.inc(len(batch), result="failed")
+                for _, future in batch:
+                    _resolve(future, (False, "no se pudo guardar"))
+                continue
+            self.stats.saved += len(batch)
+            LINES.inc(len(batch), result="saved")
+            for record, future in batch:
+                _resolve(future, (True, record[2]["quality_level"]))
+
+
+def _persist(records: List[tuple]) -> None:
+    import app  # carga Flask solo si se usa el guardado por defecto
+
+    app.persist_records(records)
+
+
+def _done(loop: asyncio.AbstractEventLoop, result: Result) -> asyncio.Future:
+    future = loop.create_future()
+    future.set_result(result)
+    return future
+
+
+def _resolve(future: Optional[asyncio.Future], result: Result) -> None:
+    if future is not None and not future.done():
+        future.set_result(result)
+
+
+def _raise_fd_limit() -> None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    gateway = Gateway(
+        batch_size=args.batch_size, max_delay=args.max_delay_ms / 1000,
+        max_pending=args.max_pending, max_inflight=args.max_inflight,
+    )
+    await gateway.start(args.host, args.port, args.udp_port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await gateway.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7070, help="puerto TCP")
+    parser.add_argument("--udp-port", type=int, default=None, help="puerto UDP (por defecto, sin UDP)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--max-delay-ms", type=float, default=20.0)
+    parser.add_argument("--max-pending", type=int, default=10_000)
+    parser.add_argument("--max-inflight", type=int, default=32)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    _raise_fd_limit()
+    database.init_db()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
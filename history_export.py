@@ -0,0 +1,188 @@
+"""Exportación en streaming del historial (join de contexto, medidas y condiciones).
+
+Formatos:
+- csv:    texto, mismas columnas que database.CONTEXT_COLUMNS
+- csv.gz: el mismo CSV comprimido con gzip
+- npz:    columnar NumPy; cada bloque se guarda como `<columna>.<n>.npy`
+          dentro del zip (ver load_npz para reconstruir las columnas)
+- arrow:  Arrow IPC stream, un record batch por bloque (requiere pyarrow)
+
+Todos los formatos se generan bloque a bloque, con memoria constante.
+"""
+import csv
+import io
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from database import CONTEXT_COLUMNS, iter_context_chunks
+
+FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "csv.gz": ("application/gzip", ".csv.gz"),
+    "npz": ("application/zip", ".npz"),
+    "arrow": ("application/vnd.apache.arrow.stream", ".arrow"),
+}
+
+_INT_COLUMNS = {"id", "evento_biomasa"}
+_TEXT_COLUMNS = {"zona", "hora", "quality_level"}
+
+
+class _Sink:
+    """Destino de escritura no posicionable que acumula bytes para el generador."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _columns(rows: List[Tuple]) -> Dict[str, np.ndarray]:
+    """Convierte un bloque de filas en arreglos por columna (None -> NaN / "")."""
+    out = {}
+    for i, name in enumerate(CONTEXT_COLUMNS):
+        values = [r[i] for r in rows]
+        if name in _TEXT_COLUMNS:
+            out[name] = np.array(["" if v is None else str(v) for v in values], dtype=str)
+        elif name in _INT_COLUMNS:
+            out[name] = np.array([0 if v is None else v for v in values], dtype=np.int64)
+        else:
+            out[name] = np.array(values, dtype=float)
+    return out
+
+
+def _iter_csv(chunks: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(CONTEXT_COLUMNS)
+    for rows in chunks:
+        w.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def _gzip(parts: Iterable[bytes]) -> Iterator[bytes]:
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for part in parts:
+        data = z.compress(part)
+        if data:
+            yield data
+    yield z.flush()
+
+
+def _iter_npz(chunks: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+        for n, rows in enumerate(chunks):
+            for name, arr in _columns(rows).items():
+                with zf.open(f"{name}.{n:06d}.npy", "w", force_zip64=True) as f:
+                    np.lib.format.write_array(f, arr, allow_pickle=False)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _iter_arrow(chunks: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    schema = pa.schema([
+        (name, pa.string() if name in _TEXT_COLUMNS else pa.int64() if name in _INT_COLUMNS else pa.float64())
+        for name in CONTEXT_COLUMNS
+    ])
+    sink = _Sink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for rows in chunks:
+            writer.write_batch(pa.RecordBatch.from_pydict(dict(zip(CONTEXT_COLUMNS, zip(*rows))), schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _check_format(fmt: str) -> None:
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato desconocido: {fmt} (opciones: {', '.join(FORMATS)})")
+    if fmt == "arrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ValueError("El formato arrow requiere pyarrow instalado.") from e
+
+
+def _check_sizes(chunk_size: int, limit: Optional[int]) -> None:
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size debe ser un entero positivo: {chunk_size}")
+    if limit is not None and limit < 0:
+        raise ValueError(f"limit no puede ser negativo: {limit}")
+
+
+def _encode(fmt: str, chunks: Iterable[List[Tuple]]) -> Iterator[bytes]:
+    if fmt == "csv":
+        return _iter_csv(chunks)
+    if fmt == "csv.gz":
+        return _gzip(_iter_csv(chunks))
+    if fmt == "npz":
+        return _iter_npz(chunks)
+    return _iter_arrow(chunks)
+
+
+def iter_export(fmt: str = "csv", chunk_size: int = 5000, limit: Optional[int] = None) -> Iterator[bytes]:
+    """Genera el historial en `fmt` como una secuencia de bloques de bytes."""
+    _check_format(fmt)
+    _check_sizes(chunk_size, limit)
+    return _encode(fmt, iter_context_chunks(chunk_size=chunk_size, limit=limit))
+
+
+def format_for_path(path: Path) -> str:
+    """Deduce el formato por la extensión del archivo (por defecto csv)."""
+    name = path.name.lower()
+    for fmt, (_, suffix) in FORMATS.items():
+        if fmt != "csv" and name.endswith(suffix):
+            return fmt
+    return "csv"
+
+
+def export_history(path: Path, fmt: Optional[str] = None, chunk_size: int = 5000,
+                   limit: Optional[int] = None) -> int:
+    """Escribe el historial en `path` en streaming. Devuelve el número de filas."""
+    fmt = fmt or format_for_path(path)
+    _check_format(fmt)
+    _check_sizes(chunk_size, limit)
+    count = 0
+
+    def counted():
+        nonlocal count
+        for rows in iter_context_chunks(chunk_size=chunk_size, limit=limit):
+            count += len(rows)
+            yield rows
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        for part in _encode(fmt, counted()):
+            f.write(part)
+    return count
+
+
+def load_npz(path) -> Dict[str, np.ndarray]:
+    """Lee un export npz y concatena los bloques de cada columna."""
+    parts: Dict[str, list] = {}
+    with np.load(path, allow_pickle=False) as data:
+        for key in sorted(data.files):
+            name = key.rsplit(".", 1)[0]
+            parts.setdefault(name, []).append(data[key])
+    return {name: np.concatenate(arrs) for name, arrs in parts.items()}
@@ -0,0 +1,263 @@
+"""Historial de evaluaciones como log binario de solo anexado.
+
+Reemplaza a data/history.csv. Cada evaluación es un registro de tamaño fijo
+(RECORD) en el segmento actual `seg-NNNNNN.airlog` del directorio del log:
+
+- cabecera de HEADER_SIZE bytes: firma, versión, tamaño de registro,
+  número de segmento y fecha de creación
+- registros RECORD uno tras otro; al llegar a `segment_records` se abre
+  el segmento siguiente
+
+Las zonas se guardan como id (0 = sin zona) según la tabla `zonas.json`
+del mismo directorio, y quality_level como índice en LEVELS (-1 = sin
+nivel). Varios procesos pueden escribir el mismo directorio: cada
+append() toma un bloqueo exclusivo sobre `.lock` y, con él tomado, relee
+zonas.json y sigue en el último segmento, sea quien sea quien lo abrió.
+
+Lectura: read_segments() mapea cada segmento en memoria como arreglo
+estructurado de NumPy (sin copiar) y to_csv() regenera el formato de
+history.csv cuando se necesita.
+"""
+import csv
+import json
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from inference_engine import LEVELS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MAGIC = b"AIRLOG01"
+VERSION = 1
+HEADER_SIZE = 32
+_HEADER = struct.Struct("<8sHHIq")  # firma, versión, tamaño de registro, segmento, creado (epoch s)
+
+FLOAT_FIELDS = ("pm2_5", "pm10", "no2", "o3", "so2", "co", "temp", "rh", "v_viento")
+RECORD = np.dtype([
+    ("timestamp", "<M8[s]"),
+    ("zona", "<u2"),
+    ("quality_level", "i1"),
+    ("evento_biomasa", "i1"),
+] + [(name, "<f8") for name in FLOAT_FIELDS])
+
+# Columnas de data/history.csv, en su orden.
+CSV_HEADERS = [
+    "timestamp", "zona", "evento_biomasa", "quality_level",
+    "pm2_5", "pm10", "no2", "o3", "so2", "co", "temp", "rh", "v_viento",
+]
+
+_LEVEL_CODES = {label: i for i, label in enumerate(LEVELS)}
+MAX_ZONES = np.iinfo(RECORD["zona"]).max
+MAX_EVENTO = np.iinfo(RECORD["evento_biomasa"]).max
+
+
+def _segment_path(directory: Path, n: int) -> Path:
+    return directory / f"seg-{n:06d}.airlog"
+
+
+def segments(directory: Path) -> List[Path]:
+    """Segmentos del log en orden."""
+    return sorted(Path(directory).glob("seg-*.airlog"))
+
+
+def _read_zones(directory: Path) -> List[Optional[str]]:
+    try:
+        names = json.loads((directory / "zonas.json").read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        names = []
+    return [None] + names
+
+
+def _zones_stat(directory: Path) -> Optional[tuple]:
+    """Identifica la versión de zonas.json (se reemplaza, no se edita)."""
+    try:
+        st = (directory / "zonas.json").stat()
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _record_count(path: Path) -> int:
+    return max(0, (os.path.getsize(path) - HEADER_SIZE) // RECORD.itemsize)
+
+
+@contextmanager
+def _locked(f):
+    """Bloqueo exclusivo entre procesos sobre el archivo abierto `f`."""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+    try:
+        yield
+    finally:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class HistoryLog:
+    """Escritor del log: mantiene abierto el segmento actual."""
+
+    def __init__(self, directory: Path, segment_records: int = 100_000):
+        self.directory = Path(directory)
+        self.segment_records = segment_records
+        self._lock = threading.Lock()
+        self._lockfile = None
+        self._file = None
+        self._segment = 0
+        self._count = 0
+        self._zones: Dict[str, int] = {}
+        self._zones_stat = None
+
+    def _sync(self) -> None:
+        """Se pone al día con lo que escribieron otros procesos. Requiere
+        el bloqueo de `.lock`."""
+        key = _zones_stat(self.directory)
+        if key != self._zones_stat:
+            names = _read_zones(self.directory)
+            self._zones = {name: i for i, name in enumerate(names) if name is not None}
+            self._zones_stat = key
+        existing = segments(self.directory)
+        if not existing:
+            self._new_segment(1)
+            return
+        path = existing[-1]
+        segment = int(path.stem.split("-")[1])
+        if self._file is None or segment != self._segment:
+            if self._file is not None:
+                self._file.close()
+            self._segment = segment
+            self._file = open(path, "ab")
+        self._count = _record_count(path)
+        # Descarta un registro incompleto (escritura interrumpida).
+        os.truncate(path, HEADER_SIZE + self._count * RECORD.itemsize)
+
+    def _new_segment(self, n: int) -> None:
+        if self._file is not None:
+            self._file.close()
+        self._segment, self._count = n, 0
+        self._file = open(_segment_path(self.directory, n), "wb")
+        header = _HEADER.pack(MAGIC, VERSION, RECORD.itemsize, n, int(time.time()))
+        self._file.write(header.ljust(HEADER_SIZE, b"\0"))
+
+    def _zone_id(self, zona: Optional[str]) -> int:
+        if not zona:
+            return 0
+        zone_id = self._zones.get(zona)
+        if zone_id is None:
+            if len(self._zones) >= MAX_ZONES:
+                raise ValueError(f"zona {zona!r}: el log admite hasta {MAX_ZONES} zonas")
+            zone_id = self._zones[zona] = len(self._zones) + 1
+            tmp = self.directory / f"zonas.json.{os.getpid()}.tmp"
+            tmp.write_text(json.dumps(sorted(self._zones, key=self._zones.get), ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.directory / "zonas.json")
+            self._zones_stat = _zones_stat(self.directory)
+        return zone_id
+
+    def _encode(self, rows: List[dict]) -> np.ndarray:
+        for r in rows:
+            evento = r["evento_biomasa"]
+            if evento is not None and not 0 <= evento <= MAX_EVENTO:
+                raise ValueError(f"evento_biomasa={evento!r} fuera de rango (0-{MAX_EVENTO})")
+        out = np.zeros(len(rows), dtype=RECORD)
+        out["timestamp"] = [np.datetime64(r["timestamp"] or "NaT", "s") for r in rows]
+        out["zona"] = [self._zone_id(r["zona"]) for r in rows]
+        out["quality_level"] = [_LEVEL_CODES.get(r["quality_level"], -1) for r in rows]
+        out["evento_biomasa"] = [-1 if r["evento_biomasa"] is None else r["evento_biomasa"] for r in rows]
+        for name in FLOAT_FIELDS:
+            out[name] = [np.nan if r[name] is None else r[name] for r in rows]
+        return out
+
+    def append(self, rows: Iterable[dict]) -> int:
+        """Anexa filas con las claves de CSV_HEADERS. Devuelve cuántas.
+
+        Lanza ValueError, sin anexar ninguna fila, si una fila no cabe en RECORD
+        (evento_biomasa fuera de 0-127 o más de MAX_ZONES zonas)."""
+        rows = list(rows)
+        with self._lock:
+            if self._lockfile is None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._lockfile = open(self.directory / ".lock", "a+b")
+            with _locked(self._lockfile):
+                self._sync()
+                records = self._encode(rows)
+                start = 0
+                while start < len(records):
+                    if self._count >= self.segment_records:
+                        self._new_segment(self._segment + 1)
+                    n = min(len(records) - start, self.segment_records - self._count)
+                    self._file.write(records[start:start + n].tobytes())
+                    self._count += n
+                    start += n
+                self._file.flush()
+        return len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            for f in (self._file, self._lockfile):
+                if f is not None:
+                    f.close()
+            self._file = self._lockfile = None
+
+
+def read_segment(path: Path) -> np.memmap:
+    """Mapea un segmento como arreglo RECORD de solo lectura (sin copiar)."""
+    with open(path, "rb") as f:
+        magic, version, size, _, _ = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != MAGIC or size != RECORD.itemsize:
+        raise ValueError(f"{path}: no es un segmento de historial v{VERSION}")
+    n = _record_count(path)
+    if n == 0:
+        return np.zeros(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode="r", offset=HEADER_SIZE, shape=(n,))
+
+
+def read_segments(directory: Path) -> Iterator[np.ndarray]:
+    """Itera los segmentos del log como arreglos mapeados en memoria."""
+    for path in segments(directory):
+        yield read_segment(path)
+
+
+def zone_names(directory: Path) -> np.ndarray:
+    """Nombres por id de zona (índice 0: sin zona) para decodificar `zona`."""
+    return np.array(_read_zones(Path(directory)), dtype=object)
+
+
+def to_csv(directory: Path, out_path: Path) -> int:
+    """Escribe el log en el formato de history.csv. Devuelve el número de filas."""
+    zones = zone_names(directory)
+    levels = np.array(LEVELS + ("",), dtype=object)  # el código -1 cae en ""
+    total = 0
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(CSV_HEADERS)
+        for seg in read_segments(directory):
+            ts = seg["timestamp"].astype(str)
+            zona = zones[seg["zona"]]
+            level = levels[seg["quality_level"]]
+            evento = seg["evento_biomasa"].tolist()
+            floats = [seg[name].tolist() for name in FLOAT_FIELDS]
+            for i in range(len(seg)):
+                w.writerow([
+                    "" if ts[i] == "NaT" else ts[i], zona[i] or "",
+                    "" if evento[i] < 0 else evento[i], level[i],
+                    *("" if col[i] != col[i] else col[i] for col in floats),
+                ])
+            total += len(seg)
+    return total
@@ -1,9 +1,37 @@
-from dataclasses import dataclass
-from typing import List, Optional, Dict, Any
+from dataclasses import FrozenInstanceError, dataclass, fields
+from functools import lru_cache
+from operator import attrgetter
+from typing import Optional, Dict, Any, Mapping, Tuple, Union
+import copy
 import json
+import logging
+import os
+import sys
+import threading
+import time
 from pathlib import Path
 
-_RULES_PATH = Path("data/air_rules.json")
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+_RULES_PATH = Path(__file__).resolve().parent / "data" / "air_rules.json"
+
+# Niveles en orden de severidad; el índice es el código usado por evaluate_batch.
+LEVELS = ("Buena", "Moderada", "Riesgo moderado", "Riesgo alto")
+LEVEL_COLORS = ("green", "yellow", "orange", "red")
+
+# Valor de AQI en los arreglos de evaluate_batch cuando no hay PM2.5.
+AQI_MISSING = -1
+
+# Tramos por defecto si air_rules.json no define "breakpoints_AQI_PM2_5".
+_AQI_BREAKPOINTS_PM25 = (
+    (0, 9, 0, 50),
+    (9.1, 35.4, 51, 100),
+    (35.5, 55.4, 101, 150),
+    (55.5, 125.4, 151, 200)
+)
+_AQI_ABOVE_RANGE = 201
 
 @dataclass
 class Fact:
@@ -16,73 +44,424 @@ class Fact:
     temp: Optional[float] = None
     rh: Optional[float] = None
 
-@dataclass
+_HEAT_ALERT = "Condiciones calurosas con alta concentración de partículas."
+_HEAT_RECOMMENDATION = "Evite actividades al aire libre prolongadas."
+_ALL_CLEAR = "Todos los valores dentro de los rangos recomendados."
+
+
 class InferenceResult:
-    label: str
-    color: str
-    explanation: str
-    recommendations: List[str]
-    alerts: List[str]
-    aqi_value: Optional[int] = None
+    """Resultado inmutable de evaluate().
+
+    Guarda solo códigos: nivel (índice en LEVELS), AQI y máscara de alertas
+    (bit i = campo i de alert_fields de las reglas; el bit siguiente marca
+    calor con alta concentración de partículas, como en BatchResult). Los
+    textos en español (explanation, alerts, recommendations) se construyen
+    en el primer acceso y quedan guardados; quien solo lee `label` no los
+    paga. También se puede crear con los textos ya hechos, con los mismos
+    argumentos con nombre que antes.
+    """
+
+    __slots__ = ("level", "aqi_value", "alert_mask", "_pm25", "_values", "_rules", "_text")
+
+    def __init__(
+        self,
+        label: str,
+        color: str,
+        explanation: str,
+        recommendations: Tuple[str, ...],
+        alerts: Tuple[str, ...],
+        aqi_value: Optional[int] = None,
+    ):
+        init = object.__setattr__
+        init(self, "level", LEVELS.index(label) if label in LEVELS else 0)
+        init(self, "aqi_value", aqi_value)
+        init(self, "alert_mask", 0)
+        init(self, "_pm25", None)
+        init(self, "_values", None)
+        init(self, "_rules", None)  # sin reglas: textos dados, incluidos label y color
+        init(self, "_text", (explanation, recommendations, alerts, label, color))
+
+    @classmethod
+    def _compact(
+        cls, level: int, aqi_value: Optional[int], alert_mask: int,
+        pm25: Optional[float], values: Optional[tuple], rules: "CompiledRules",
+    ) -> "InferenceResult":
+        """Camino de evaluate(): sin textos; `values` son los valores de
+        rules.alert_fields (solo hacen falta si hay alertas de gases)."""
+        self = object.__new__(cls)
+        init = object.__setattr__
+        init(self, "level", level)
+        init(self, "aqi_value", aqi_value)
+        init(self, "alert_mask", alert_mask)
+        init(self, "_pm25", pm25)
+        init(self, "_values", values)
+        init(self, "_rules", rules)
+        init(self, "_text", None)
+        return self
+
+    def __setattr__(self, name, value):
+        raise FrozenInstanceError(f"cannot assign to field {name!r}")
+
+    def __delattr__(self, name):
+        raise FrozenInstanceError(f"cannot delete field {name!r}")
+
+    @property
+    def label(self) -> str:
+        return LEVELS[self.level] if self._rules is not None else self._text[3]
+
+    @property
+    def color(self) -> str:
+        return LEVEL_COLORS[self.level] if self._rules is not None else self._text[4]
+
+    @property
+    def explanation(self) -> str:
+        return self._texts()[0]
+
+    @property
+    def recommendations(self) -> Tuple[str, ...]:
+        return self._texts()[1]
+
+    @property
+    def alerts(self) -> Tuple[str, ...]:
+        return self._texts()[2]
+
+    def _texts(self) -> tuple:
+        text = self._text
+        if text is None:
+            text = self._render()
+            object.__setattr__(self, "_text", text)
+        return text
+
+    def _render(self) -> tuple:
+        rules, mask = self._rules, self.alert_mask
+        just, recs, alerts = [], [], []
+        if self.aqi_value is not None:
+            just.append(f"AQI PM2.5 = {self.aqi_value} basado en concentración de {self._pm25} µg/m³.")
+            recs.extend(rules.recommendations[self.level])
+        for bit, (gas, limit) in enumerate(zip(rules.alert_fields, rules.thresholds)):
+            if mask >> bit & 1:
+                msg = f"{gas} supera el umbral OMS ({self._values[bit]} > {limit})."
+                alerts.append(msg)
+                just.append(msg)
+        if mask >> len(rules.alert_fields) & 1:
+            alerts.append(_HEAT_ALERT)
+            recs.append(_HEAT_RECOMMENDATION)
+        explanation = " | ".join(just) if just else _ALL_CLEAR
+        return explanation, tuple(dict.fromkeys(recs)), tuple(alerts)
+
+    def _key(self) -> tuple:
+        return (self.label, self.color, self.explanation, tuple(self.recommendations), tuple(self.alerts),
+                self.aqi_value)
+
+    def __eq__(self, other):
+        if not isinstance(other, InferenceResult):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f"InferenceResult(label={self.label!r}, aqi_value={self.aqi_value!r}, alert_mask={self.alert_mask})"
+
+@dataclass
+class BatchResult:
+    """Resultado columnar de evaluate_batch (un elemento por lectura).
+
+    - levels: código de nivel (índice en LEVELS)
+    - aqi_values: AQI PM2.5, AQI_MISSING si la lectura no trae PM2.5
+    - alert_mask: bit i = campo i de alert_fields supera el umbral OMS;
+      el bit len(alert_fields) marca calor con alta concentración de partículas
+    """
+    levels: np.ndarray
+    aqi_values: np.ndarray
+    alert_mask: np.ndarray
+    alert_fields: tuple
+
+    @property
+    def labels(self) -> np.ndarray:
+        return np.array(LEVELS, dtype=object)[self.levels]
+
+    @property
+    def colors(self) -> np.ndarray:
+        return np.array(LEVEL_COLORS, dtype=object)[self.levels]
+
+    @property
+    def heat_alert_bit(self) -> int:
+        return 1 << len(self.alert_fields)
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+ColumnarInput = Union[Mapping[str, Any], np.ndarray]
+
+_FACT_FIELDS = tuple(f.name for f in fields(Fact))
+_fact_values = attrgetter(*_FACT_FIELDS)
+
+@dataclass(frozen=True, eq=False)
+class CompiledRules:
+    """air_rules.json precompilado para el camino caliente de evaluate().
+
+    - alert_fields / thresholds: umbrales OMS en orden, solo campos de Fact
+    - breakpoints: tramos (Cl, Ch, Il, Ih) del AQI PM2.5
+    - recommendations: tupla de recomendaciones (cadenas internadas) por nivel
+    """
+    raw: Dict[str, Any]
+    alert_fields: Tuple[str, ...]
+    thresholds: Tuple[float, ...]
+    threshold_array: np.ndarray
+    alert_values: Any
+    breakpoints: Tuple[Tuple[float, float, float, float], ...]
+    breakpoint_array: np.ndarray
+    aqi_above_range: int
+    recommendations: Tuple[Tuple[str, ...], ...]
+
+    @classmethod
+    def compile(cls, raw: Dict[str, Any]) -> "CompiledRules":
+        umbrales = {k: v for k, v in raw["umbrales_OMS"].items() if k in _FACT_FIELDS}
+        alert_fields = tuple(umbrales)
+        breakpoints = tuple(tuple(bp) for bp in raw.get("breakpoints_AQI_PM2_5", _AQI_BREAKPOINTS_PM25))
+        if any(a[1] >= b[0] for a, b in zip(breakpoints, breakpoints[1:])):
+            raise ValueError("breakpoints_AQI_PM2_5 debe estar ordenado y sin solapamientos")
+        recs = raw["recomendaciones"]
+        return cls(
+            raw=raw,
+            alert_fields=alert_fields,
+            thresholds=tuple(umbrales.values()),
+            threshold_array=np.array(list(umbrales.values()), dtype=float),
+            # attrgetter con un solo campo no devuelve tupla; se normaliza en evaluate
+            alert_values=attrgetter(*alert_fields) if alert_fields else (lambda fact: ()),
+            breakpoints=breakpoints,
+            breakpoint_array=np.array(breakpoints, dtype=float).reshape(-1, 4),
+            aqi_above_range=int(raw.get("aqi_fuera_de_rango", _AQI_ABOVE_RANGE)),
+            recommendations=tuple(
+                tuple(sys.intern(r) for r in recs.get(level, ())) for level in LEVELS
+            ),
+        )
 
 class AirExpertEngine:
-    def __init__(self):
-        with open(_RULES_PATH, "r", encoding="utf-8") as f:
-            self.rules = json.load(f)
+    """Motor de inferencia sobre air_rules.json.
+
+    Las reglas se compilan al cargar (CompiledRules) y se recargan de forma
+    atómica si cambia el mtime del archivo; el mtime se comprueba como mucho
+    una vez cada `reload_interval` segundos (None desactiva la recarga).
+
+    Con cache_size > 0, evaluate() memoiza resultados en un LRU acotado. La
+    clave es el Fact con cada valor redondeado a `cache_precision` decimales
+    y el resultado es el de evaluar ese Fact redondeado, así que no depende
+    del orden de llegada. La caché se vacía al recargar las reglas.
+    """
+
+    def __init__(
+        self,
+        rules_path: Optional[Path] = None,
+        reload_interval: Optional[float] = 1.0,
+        cache_size: int = 0,
+        cache_precision: int = 2,
+    ):
+        self.rules_path = Path(rules_path) if rules_path else _RULES_PATH
+        self.reload_interval = reload_interval
+        self.cache_precision = cache_precision
+        self._reload_lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self.compiled = self._load()
+        self._cache = lru_cache(maxsize=cache_size)(self._evaluate_cached) if cache_size else None
+
+    def cache_info(self):
+        """hits, misses, maxsize, currsize de la caché (None si está desactivada)."""
+        return self._cache.cache_info() if self._cache else None
+
+    def cache_clear(self) -> None:
+        if self._cache:
+            self._cache.cache_clear()
+
+    @property
+    def rules(self) -> Dict[str, Any]:
+        return self.compiled.raw
+
+    def _stat_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.rules_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self) -> CompiledRules:
+        # stat antes de leer: si el archivo cambia entre medio se recarga otra vez
+        mtime = self._stat_mtime()
+        with open(self.rules_path, "r", encoding="utf-8") as f:
+            compiled = CompiledRules.compile(json.load(f))
+        self._mtime = mtime
+        return compiled
+
+    def reload_if_changed(self) -> bool:
+        """Recarga las reglas si el archivo cambió. Devuelve True si recargó.
+
+        Un archivo inválido (p. ej. a medio escribir) se ignora y se mantienen
+        las reglas anteriores hasta el siguiente cambio.
+        """
+        mtime = self._stat_mtime()
+        if mtime is None or mtime == self._mtime:
+            return False
+        with self._reload_lock:
+            if mtime == self._mtime:
+                return False
+            try:
+                self.compiled = self._load()
+            except (OSError, ValueError, KeyError, TypeError):
+                self._mtime = mtime
+                log.warning("No se pudo recargar %s; se mantienen las reglas anteriores", self.rules_path, exc_info=True)
+                return False
+        self._on_rules_changed()
+        return True
+
+    def pinned(self) -> "AirExpertEngine":
+        """Copia que evalúa siempre con las reglas vigentes ahora (lee el
+        archivo si cambió), sin recarga ni caché. Para trabajos largos que
+        no deben mezclar dos versiones de las reglas."""
+        self.reload_if_changed()
+        clone = copy.copy(self)
+        clone.reload_interval = None
+        clone._cache = None
+        return clone
+
+    def _on_rules_changed(self) -> None:
+        """Invalida el estado derivado de las reglas anteriores."""
+        self.cache_clear()
 
-    def _calc_aqi_pm25(self, pm25: float) -> int:
+    def _current_rules(self) -> CompiledRules:
+        if self.reload_interval is not None:
+            now = time.monotonic()
+            if now >= self._next_check:
+                self._next_check = now + self.reload_interval
+                self.reload_if_changed()
+        return self.compiled
+
+    def _calc_aqi_pm25(self, pm25: float, rules: Optional[CompiledRules] = None) -> int:
         """Cálculo simplificado de AQI PM2.5 (EPA 2024)"""
-        bp = [
-            (0, 9, 0, 50),
-            (9.1, 35.4, 51, 100),
-            (35.5, 55.4, 101, 150),
-            (55.5, 125.4, 151, 200)
-        ]
-        for Cl, Ch, Il, Ih in bp:
+        rules = rules or self.compiled
+        for Cl, Ch, Il, Ih in rules.breakpoints:
             if Cl <= pm25 <= Ch:
                 return round(((Ih - Il) / (Ch - Cl)) * (pm25 - Cl) + Il)
-        return 201  
+        return rules.aqi_above_range
+
+    def _calc_aqi_pm25_array(self, pm25: np.ndarray, rules: Optional[CompiledRules] = None) -> np.ndarray:
+        """Versión vectorizada de _calc_aqi_pm25; NaN -> AQI_MISSING.
+
+        Los tramos están ordenados y no se solapan, así que basta un
+        searchsorted sobre los límites inferiores y comprobar el superior.
+        """
+        rules = rules or self.compiled
+        bp = rules.breakpoint_array
+        c_lo, c_hi, i_lo, i_hi = bp.T
+        idx = np.searchsorted(c_lo, pm25, side="right") - 1
+        safe = np.clip(idx, 0, max(len(bp) - 1, 0))
+        with np.errstate(invalid="ignore"):
+            if len(bp):
+                inside = (idx >= 0) & (pm25 <= c_hi[safe])
+                aqi = np.round(
+                    ((i_hi[safe] - i_lo[safe]) / (c_hi[safe] - c_lo[safe])) * (pm25 - c_lo[safe]) + i_lo[safe]
+                )
+            else:
+                inside = np.zeros(len(pm25), dtype=bool)
+                aqi = np.zeros(len(pm25))
+        out = np.where(inside, aqi, rules.aqi_above_range).astype(np.int64)
+        out[np.isnan(pm25)] = AQI_MISSING
+        return out
+
+    @staticmethod
+    def _column(columns: ColumnarInput, name: str) -> Optional[np.ndarray]:
+        """Extrae una columna como float64 (None -> NaN); None si no existe."""
+        if isinstance(columns, np.ndarray):
+            if columns.dtype.names is None or name not in columns.dtype.names:
+                return None
+            col = columns[name]
+        else:
+            if name not in columns or columns[name] is None:
+                return None
+            col = columns[name]
+        return np.asarray(col, dtype=float).reshape(-1)
+
+    def evaluate_batch(self, columns: ColumnarInput) -> BatchResult:
+        """Evalúa muchas lecturas a la vez con el mismo criterio que evaluate().
+
+        `columns` es un dict de arreglos (o un arreglo estructurado de NumPy)
+        con una columna por campo de Fact; las columnas ausentes se tratan
+        como None y los NaN como valores faltantes.
+        """
+        cols = {}
+        n = None
+        for name in _FACT_FIELDS:
+            col = self._column(columns, name)
+            if col is None:
+                continue
+            if n is not None and len(col) != n:
+                raise ValueError(f"La columna {name} tiene {len(col)} valores; se esperaban {n}.")
+            n = len(col)
+            cols[name] = col
+        if n is None:
+            n = 0
+        missing = np.full(n, np.nan)
+
+        rules = self._current_rules()
+        pm25 = cols.get("PM2_5_24h", missing)
+        aqi = self._calc_aqi_pm25_array(pm25, rules)
+        levels = np.searchsorted(np.array([50, 100, 150]), aqi, side="left").astype(np.int8)
+        levels[aqi == AQI_MISSING] = 0
+
+        alert_fields = rules.alert_fields
+        mask_dtype = np.uint64 if len(alert_fields) >= 31 else np.uint32
+        alert_mask = np.zeros(n, dtype=mask_dtype)
+        with np.errstate(invalid="ignore"):
+            for bit, (gas, limit) in enumerate(zip(alert_fields, rules.threshold_array)):
+                col = cols.get(gas)
+                if col is not None:
+                    alert_mask[col > limit] |= mask_dtype(1 << bit)
+            temp = cols.get("temp", missing)
+            heat = (temp > 30) & (pm25 > 35)
+        alert_mask[heat] |= mask_dtype(1 << len(alert_fields))
+
+        return BatchResult(levels=levels, aqi_values=aqi, alert_mask=alert_mask, alert_fields=alert_fields)
 
     def evaluate(self, fact: Fact) -> InferenceResult:
-        just = []
-        recs = []
-        alerts = []
-        color = "green"
-        label = "Buena"
-        aqi_value = None
+        rules = self._current_rules()
+        if self._cache is None:
+            return self._evaluate(fact, rules)
+        p = self.cache_precision
+        # Las reglas van en la clave (por identidad) para que un resultado
+        # calculado con reglas viejas nunca se sirva tras una recarga.
+        return self._cache(rules, tuple(
+            None if v is None else round(float(v), p) for v in _fact_values(fact)
+        ))
 
-        if fact.PM2_5_24h is not None:
-            aqi_value = self._calc_aqi_pm25(fact.PM2_5_24h)
-            just.append(f"AQI PM2.5 = {aqi_value} basado en concentración de {fact.PM2_5_24h} µg/m³.")
+    def _evaluate_cached(self, rules: CompiledRules, values: tuple) -> InferenceResult:
+        return self._evaluate(Fact(*values), rules)
 
+    def _evaluate(self, fact: Fact, rules: CompiledRules) -> InferenceResult:
+        pm25 = fact.PM2_5_24h
+        level = 0
+        aqi_value = None
+        if pm25 is not None:
+            aqi_value = self._calc_aqi_pm25(pm25, rules)
             if aqi_value <= 50:
-                label, color = "Buena", "green"
+                level = 0
             elif aqi_value <= 100:
-                label, color = "Moderada", "yellow"
+                level = 1
             elif aqi_value <= 150:
-                label, color = "Riesgo moderado", "orange"
+                level = 2
             else:
-                label, color = "Riesgo alto", "red"
-
-            recs.extend(self.rules["recomendaciones"][label])
+                level = 3
 
-        for gas, limit in self.rules["umbrales_OMS"].items():
-            val = getattr(fact, gas, None)
+        values = rules.alert_values(fact)
+        if len(rules.alert_fields) == 1:
+            values = (values,)
+        mask = 0
+        for bit, (limit, val) in enumerate(zip(rules.thresholds, values)):
             if val is not None and val > limit:
-                msg = f"{gas} supera el umbral OMS ({val} > {limit})."
-                alerts.append(msg)
-                just.append(msg)
+                mask |= 1 << bit
 
-        if fact.temp and fact.temp > 30 and fact.PM2_5_24h and fact.PM2_5_24h > 35:
-            alerts.append("Condiciones calurosas con alta concentración de partículas.")
-            recs.append("Evite actividades al aire libre prolongadas.")
-
-        explanation = " | ".join(just) if just else "Todos los valores dentro de los rangos recomendados."
-        return InferenceResult(
-            label=label,
-            color=color,
-            explanation=explanation,
-            recommendations=list(set(recs)),
-            alerts=alerts,
-            aqi_value=aqi_value
-        )
+        temp = fact.temp
+        if temp and temp > 30 and pm25 and pm25 > 35:
+            mask |= 1 << len(rules.alert_fields)
+
+        return InferenceResult._compact(level, aqi_value, mask, pm25, values if mask else None, rules)
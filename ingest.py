@@ -0,0 +1,103 @@
+"""Camino columnar para cargas masivas de CSV.
+
+Lee el CSV por bloques, resuelve los alias de columnas, valida con
+validate_columns, evalúa con engine.evaluate_batch y produce registros
+(medida, condicion, contexto) listos para database.save_full_records.
+"""
+import csv
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from acquisition_module import CSV_ALIASES, RowError, parse_float_column, validate_columns
+from inference_engine import LEVELS, AirExpertEngine
+
+
+def read_csv_chunks(path: Path, chunk_size: int = 5000) -> Iterator[List[Dict[str, str]]]:
+    """Itera el CSV como listas de a lo sumo `chunk_size` filas (dict)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        while True:
+            rows = list(islice(reader, chunk_size))
+            if not rows:
+                return
+            yield rows
+
+
+def _alias_column(rows: Sequence[Dict[str, str]], aliases: Sequence[str]) -> List[Optional[str]]:
+    """Primer alias con valor no vacío por fila (como `row.get(a) or row.get(b)`)."""
+    out = []
+    for row in rows:
+        value = None
+        for name in aliases:
+            value = row.get(name)
+            if value:
+                break
+        out.append(value or None)
+    return out
+
+
+def columns_from_rows(rows: Sequence[Dict[str, str]]) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Convierte filas de texto en (valores, presente) por campo de SensorInput."""
+    values, present = {}, {}
+    for field, aliases in CSV_ALIASES.items():
+        values[field], present[field] = parse_float_column(_alias_column(rows, aliases))
+    return values, present
+
+
+def _none_if_nan(values: np.ndarray) -> List[Optional[float]]:
+    return [None if v != v else v for v in values.tolist()]
+
+
+def evaluate_rows(
+    rows: Sequence[Dict[str, str]],
+    engine: AirExpertEngine,
+    offset: int = 0,
+) -> Tuple[list, List[RowError]]:
+    """Valida y evalúa un bloque de filas del CSV en forma columnar.
+
+    Devuelve (registros, errores). Las filas inválidas se omiten y se
+    informan en `errores` con su índice de fila de datos (offset + i).
+    """
+    values, present = columns_from_rows(rows)
+    check = validate_columns(values, present)
+    valid = check.valid
+    errors = [
+        RowError(e.row + offset, e.field, e.value, e.type, e.message) for e in check.errors
+    ]
+
+    eventos: List[int] = []
+    for i, row in enumerate(rows):
+        try:
+            eventos.append(int(row.get("evento_biomasa") or 0))
+        except ValueError:
+            eventos.append(0)
+            if valid[i]:
+                valid[i] = False
+                errors.append(RowError(i + offset, "evento_biomasa", row.get("evento_biomasa"),
+                                       "int_parsing", "Input should be a valid integer"))
+
+    idx = np.flatnonzero(valid)
+    cols = {k: v[idx] for k, v in check.columns.items()}
+    levels = engine.evaluate_batch(cols).levels.tolist()
+    pm25, pm10, no2, o3, so2, co, temp, rh = (
+        _none_if_nan(cols[k]) for k in ("PM2_5_24h", "PM10_24h", "NO2_24h", "O3_8h", "SO2_24h", "CO_24h", "temp", "rh")
+    )
+
+    records = []
+    for j, i in enumerate(idx.tolist()):
+        row = rows[i]
+        records.append((
+            {"pm2_5": pm25[j], "pm10": pm10[j], "no2": no2[j], "co": co[j], "o3": o3[j], "so2": so2[j]},
+            {"temperatura": temp[j], "humedad": rh[j], "v_viento": None},
+            {
+                "zona": (row.get("zona") or None),
+                "hora": (row.get("hora") or None),
+                "evento_biomasa": eventos[i],
+                "quality_level": LEVELS[levels[j]],
+            },
+        ))
+    errors.sort(key=lambda e: e.row)
+    return records, errors
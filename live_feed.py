@@ -0,0 +1,140 @@
+"""Difusión en memoria de las evaluaciones nuevas (GET /api/stream, SSE).
+
+El POST / de la app llama a BroadcastHub.publish() una vez por
+evaluación (solo las de ese proceso: la pasarela, la carga por CSV y
+follow-csv no publican): el evento se serializa una sola vez y se copia a la cola
+acotada de cada suscriptor cuyo filtro (zona, nivel mínimo) coincide.
+Ningún suscriptor consulta SQLite. Un cliente lento cuya cola se llena
+se desconecta (recibe `event: descartado` y EventSource reconecta) en
+vez de frenar al resto o acumular memoria.
+"""
+import json
+import queue
+import threading
+from typing import Dict, Iterator, List, Optional
+
+import metrics
+from inference_engine import LEVELS
+
+PUBLISHED = metrics.REGISTRY.counter("air_stream_events_total", "Eventos publicados en el feed en vivo.")
+DROPPED = metrics.REGISTRY.counter(
+    "air_stream_dropped_total", "Suscriptores desconectados por no consumir a tiempo."
+)
+
+_RANK = {label: i for i, label in enumerate(LEVELS)}
+_CLOSE = object()
+
+
+class HubFull(Exception):
+    """Se alcanzó el máximo de suscriptores del hub."""
+
+
+class Subscription:
+    """Cola de eventos SSE (ya formateados) de un cliente."""
+
+    def __init__(self, zona: Optional[str], min_rank: int, max_queue: int):
+        self.zona = zona
+        self.min_rank = min_rank
+        self.dropped = False
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+
+    def wants(self, zona: Optional[str], rank: int) -> bool:
+        return rank >= self.min_rank and (self.zona is None or self.zona == zona)
+
+    def offer(self, message: str) -> bool:
+        """Encola sin esperar; False si la cola está llena."""
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            return False
+
+    def get(self, timeout: float) -> Optional[str]:
+        """Siguiente evento, None si pasó `timeout` sin eventos."""
+        try:
+            item = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return None if item is _CLOSE else item
+
+    def _close(self) -> None:
+        self.dropped = True
+        # Vacía la cola para que el consumidor vea el cierre enseguida.
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            self._queue.put_nowait(_CLOSE)
+        except queue.Full:  # un publish concurrente llenó el hueco; basta con `dropped`
+            pass
+
+
+class BroadcastHub:
+    """Reparte cada evento a todos los suscriptores interesados.
+
+    - max_subscribers: subscribe() lanza HubFull al superarlo
+    - max_queue: eventos pendientes por cliente antes de descartarlo
+    """
+
+    def __init__(self, max_subscribers: int = 1000, max_queue: int = 100):
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self._subscribers: List[Subscription] = []
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, zona: Optional[str] = None, min_level: Optional[str] = None) -> Subscription:
+        if min_level is not None and min_level not in _RANK:
+            raise ValueError(f"nivel desconocido: {min_level}")
+        sub = Subscription(zona, _RANK.get(min_level, 0), self.max_queue)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise HubFull(f"máximo de {self.max_subscribers} suscriptores")
+            # Copia al escribir: publish() recorre la lista sin tomar el lock.
+            self._subscribers = self._subscribers + [sub]
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not sub]
+
+    def publish(self, event: Dict) -> int:
+        """Envía `event` (debe traer zona y quality_level) a los suscriptores
+        que lo piden. Devuelve a cuántos se entregó."""
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        rank = _RANK.get(event.get("quality_level"), 0)
+        message = f"id: {seq}\nevent: evaluacion\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        delivered, slow = 0, []
+        for sub in self._subscribers:
+            if not sub.wants(event.get("zona"), rank):
+                continue
+            if sub.offer(message):
+                delivered += 1
+            else:
+                slow.append(sub)
+        for sub in slow:
+            self.unsubscribe(sub)
+            sub._close()
+            DROPPED.inc()
+        PUBLISHED.inc()
+        return delivered
+
+    def stream(self, sub: Subscription, keepalive: float = 15.0) -> Iterator[str]:
+        """Cuerpo text/event-stream de un suscriptor; se desuscribe al cerrar."""
+        try:
+            yield ": conectado\n\n"
+            while True:
+                message = sub.get(keepalive)
+                if sub.dropped:
+                    yield "event: descartado\ndata: {}\n\n"
+                    return
+                yield message if message is not None else ": keepalive\n\n"
+        finally:
+            self.unsubscribe(sub)
@@ -0,0 +1,361 @@
+"""Generador de carga de extremo a extremo para la app Flask.
+
+Simula `--sensors` sensores concurrentes (un hilo cada uno) que envían
+lecturas sintéticas (synthetic.py) con POST / y consultan GET / según
+`--post-ratio`. Como un navegador, cada POST sigue la redirección con un
+GET / (desactivable con --no-follow).
+
+Destinos:
+- inprocess: la app en este proceso con el cliente de pruebas de Flask
+- serve:     la app en un servidor local (werkzeug, con hilos) en un puerto libre
+- --url:     un servidor ya iniciado (p. ej. http://127.0.0.1:5000)
+
+Con inprocess y serve la app usa una base y un log del historial
+temporales. Informa throughput, tasa de errores y latencias
+p50/p95/p99/máx en total y por ventana de `--interval` segundos.
+
+Los formularios se reutilizan, así que cada POST lleva su propia
+Idempotency-Key: ninguna lectura se funde con otra y todas cuentan como
+escrituras. Con inprocess y serve se informa además cuántas filas quedaron
+realmente en la base.
+
+Uso:
+    python loadgen.py --sensors 50 --duration 30 --out load.json
+    python loadgen.py --target serve --sensors 200 --post-ratio 0.5
+    python loadgen.py --url http://127.0.0.1:5000 --baseline load.json --threshold 0.15
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+import app
+import database
+from benchmarks import compare, percentile
+from synthetic import DISTRIBUTIONS, ZONES, generate_columns
+
+TARGETS = ("inprocess", "serve")
+
+# (operación, inicio relativo en s, latencia en s, ok)
+Sample = Tuple[str, float, float, bool]
+
+_FORM_FIELDS = {
+    "pm25": "PM2_5_24h", "pm10": "PM10_24h", "no2": "NO2_24h", "o3": "O3_8h",
+    "so2": "SO2_24h", "co": "CO_24h", "temp": "temp", "rh": "rh",
+}
+
+
+def sensor_forms(n: int, distribution: str = "lognormal", missing_rate: float = 0.0, seed: int = 0) -> List[Dict[str, str]]:
+    """`n` formularios del POST / con valores sintéticos ("" = faltante)."""
+    cols = generate_columns(n, ZONES, distribution, missing_rate, seed=seed)
+    forms = []
+    for i in range(n):
+        form = {"zona": cols["zona"][i], "evento_biomasa": str(cols["evento_biomasa"][i])}
+        for field, name in _FORM_FIELDS.items():
+            v = cols[name][i]
+            form[field] = "" if math.isnan(v) else repr(float(v))
+        forms.append(form)
+    return forms
+
+
+class _ClientDriver:
+    """Peticiones con el cliente de pruebas de Flask (un cliente por sensor)."""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method: str, form: Optional[Dict[str, str]] = None, key: Optional[str] = None) -> int:
+        res = self.client.open("/", method=method, data=form, headers={"Idempotency-Key": key} if key else None)
+        res.close()
+        return res.status_code
+
+    def close(self) -> None:
+        pass
+
+
+class _HttpDriver:
+    """Peticiones HTTP reales; http.client reconecta si el servidor cierra."""
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        self.path = parts.path.rstrip("/") + "/"
+
+    def request(self, method: str, form: Optional[Dict[str, str]] = None, key: Optional[str] = None) -> int:
+        body = urlencode(form) if form is not None else None
+        headers = {"Content-Type": "application/x-www-form-urlencoded"} if body is not None else {}
+        if key:
+            headers["Idempotency-Key"] = key
+        try:
+            self.conn.request(method, self.path, body=body, headers=headers)
+            res = self.conn.getresponse()
+            res.read()
+            return res.status
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            raise
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class _LocalApp:
+    """App con base y log del historial temporales mientras dura el bloque;
+    con serve=True además la sirve en un puerto libre de 127.0.0.1."""
+
+    def __init__(self, workdir: Path, serve: bool = False, config: Optional[Dict] = None):
+        self.workdir, self.serve, self.config = workdir, serve, config or {}
+        self.url = None
+
+    def __enter__(self):
+        self._saved = (database._DB_PATH, app.HISTORY_LOG, app._history_log, app._db_ready)
+        database._DB_PATH = self.workdir / "load.db"
+        app.HISTORY_LOG = self.workdir / "history_log"
+        app._history_log, app._db_ready = None, False
+        defaults = {"SEED_CSV": False, "WRITE_BEHIND_SPILL_PATH": self.workdir / "write_behind.spill"}
+        self.app = app.create_app(dict(defaults, **self.config))
+        self._server = None
+        if self.serve:
+            from werkzeug.serving import make_server
+
+            self._server = make_server("127.0.0.1", 0, self.app, threaded=True)
+            threading.Thread(target=self._server.serve_forever, name="loadgen-server", daemon=True).start()
+            self.url = f"http://127.0.0.1:{self._server.server_port}"
+        return self
+
+    def inserted(self) -> int:
+        """Lecturas guardadas en la base temporal (espera a la escritura diferida)."""
+        self.app.extensions["air_writer"].flush()
+        return sum(len(rows) for rows in database.iter_context_chunks())
+
+    def __exit__(self, *exc):
+        if self._server is not None:
+            self._server.shutdown()
+        self.app.extensions["air_writer"].close()
+        if app._history_log is not None:
+            app._history_log.close()
+        database.close_connections()
+        database._DB_PATH, app.HISTORY_LOG, app._history_log, app._db_ready = self._saved
+
+
+def _sensor(
+    driver: Callable[[], object],
+    forms: List[Dict[str, str]],
+    post_ratio: float,
+    follow: bool,
+    think: float,
+    t0: float,
+    deadline: float,
+    max_requests: Optional[int],
+    seed: int,
+    run_id: str,
+    out: List[Sample],
+) -> None:
+    rng = random.Random(seed)
+    client = driver()
+    clock = time.perf_counter
+    sent = 0
+
+    def timed(op: str, method: str, form=None, key=None) -> None:
+        start = clock()
+        try:
+            ok = client.request(method, form, key) < 400
+        except Exception:
+            ok = False
+        out.append((op, start - t0, clock() - start, ok))
+
+    try:
+        while clock() < deadline and (max_requests is None or sent < max_requests):
+            if rng.random() < post_ratio:
+                timed("post", "POST", forms[sent % len(forms)], f"loadgen-{run_id}-{seed}-{sent}")
+                if follow:
+                    timed("get", "GET")
+            else:
+                timed("get", "GET")
+            sent += 1
+            if think:
+                time.sleep(rng.expovariate(1 / think))
+    finally:
+        client.close()
+
+
+def _summarize(samples: List[Sample], seconds: float) -> Dict[str, float]:
+    lat = sorted(s[2] * 1e6 for s in samples)
+    errors = sum(1 for s in samples if not s[3])
+    return {
+        "ops": len(lat),
+        "throughput": len(lat) / seconds if seconds else 0.0,
+        "error_rate": errors / len(lat) if lat else 0.0,
+        "p50_us": percentile(lat, 50),
+        "p95_us": percentile(lat, 95),
+        "p99_us": percentile(lat, 99),
+        "max_us": lat[-1] if lat else 0.0,
+    }
+
+
+def _timeline(samples: List[Sample], elapsed: float, interval: float) -> List[Dict[str, float]]:
+    windows: Dict[int, List[Sample]] = {}
+    for s in samples:
+        windows.setdefault(int(s[1] // interval), []).append(s)
+    out = []
+    for w in range(int(math.ceil(elapsed / interval))):
+        seconds = min(interval, elapsed - w * interval)
+        out.append(dict(t=round(w * interval, 3), **_summarize(windows.get(w, []), seconds)))
+    return out
+
+
+def run(
+    sensors: int = 10,
+    duration: float = 10.0,
+    post_ratio: float = 0.5,
+    follow: bool = True,
+    think: float = 0.0,
+    target: str = "inprocess",
+    url: Optional[str] = None,
+    distribution: str = "lognormal",
+    missing_rate: float = 0.0,
+    seed: int = 0,
+    interval: float = 1.0,
+    max_requests: Optional[int] = None,
+    app_config: Optional[Dict] = None,
+    workdir: Optional[Path] = None,
+) -> Dict:
+    """Ejecuta la carga y devuelve el resultado serializable.
+
+    `think` es la pausa media (s, exponencial) entre envíos de cada sensor;
+    `max_requests` limita los envíos por sensor además de `duration`.
+    """
+    if url is None and target not in TARGETS:
+        raise ValueError(f"target debe ser uno de {TARGETS}")
+    forms = sensor_forms(max(sensors * 20, 100), distribution, missing_rate, seed)
+    run_id = uuid.uuid4().hex[:12]
+
+    def drive(make_driver) -> Tuple[List[Sample], float]:
+        outs: List[List[Sample]] = [[] for _ in range(sensors)]
+        t0 = time.perf_counter()
+        threads = [
+            threading.Thread(
+                target=_sensor,
+                args=(make_driver, forms[i::sensors] or forms, post_ratio, follow, think,
+                      t0, t0 + duration, max_requests, seed + i, run_id, outs[i]),
+                name=f"loadgen-{i}", daemon=True,
+            )
+            for i in range(sensors)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return [s for out in outs for s in out], time.perf_counter() - t0
+
+    inserted = None  # desconocido contra --url
+    if url is not None:
+        samples, elapsed = drive(lambda: _HttpDriver(url))
+    else:
+        with tempfile.TemporaryDirectory(dir=workdir) as tmp, \
+                _LocalApp(Path(tmp), serve=target == "serve", config=app_config) as local:
+            make = (lambda: _HttpDriver(local.url)) if local.url else (lambda: _ClientDriver(local.app))
+            samples, elapsed = drive(make)
+            inserted = local.inserted()
+
+    results = {"all": _summarize(samples, elapsed)}
+    for op in ("post", "get"):
+        results[op] = _summarize([s for s in samples if s[0] == op], elapsed)
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "target": url or target,
+            "sensors": sensors,
+            "duration": duration,
+            "elapsed": elapsed,
+            "post_ratio": post_ratio,
+            "follow": follow,
+            "think": think,
+            "distribution": distribution,
+            "missing_rate": missing_rate,
+            "seed": seed,
+            "app_config": app_config or {},
+        },
+        "results": results,
+        "writes": {"posts_ok": sum(1 for s in samples if s[0] == "post" and s[3]), "inserted": inserted},
+        "timeline": _timeline(samples, elapsed, interval),
+    }
+
+
+def format_report(result: Dict) -> str:
+    head = f"{'':<8}{'ops/s':>10}{'errores':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'máx ms':>9}"
+
+    def line(label: str, r: Dict[str, float]) -> str:
+        return (f"{label:<8}{r['throughput']:>10.1f}{r['error_rate']:>9.1%}{r['p50_us'] / 1e3:>9.1f}"
+                f"{r['p95_us'] / 1e3:>9.1f}{r['p99_us'] / 1e3:>9.1f}{r['max_us'] / 1e3:>9.1f}")
+
+    lines = [head] + [line(name, r) for name, r in result["results"].items()]
+    writes = result.get("writes")
+    if writes and writes["inserted"] is not None:
+        lines.append(f"filas insertadas: {writes['inserted']} de {writes['posts_ok']} POST correctos")
+    lines += ["", "por ventana (t = segundos desde el inicio)", head]
+    lines += [line(f"t={w['t']:g}", w) for w in result["timeline"]]
+    return "\n".join(lines)
+
+
+def check(result: Dict, baseline: Optional[Dict] = None, threshold: float = 0.10,
+          max_error_rate: Optional[float] = None) -> List[str]:
+    """Problemas de capacidad: regresiones frente a `baseline` (throughput
+    y p95, ver benchmarks.compare) y tasa de errores sobre el máximo."""
+    problems = compare(result, baseline, threshold) if baseline else []
+    if max_error_rate is not None:
+        for name, r in result["results"].items():
+            if r["error_rate"] > max_error_rate:
+                problems.append(f"{name}: {r['error_rate']:.1%} de errores > {max_error_rate:.1%}")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=TARGETS, default="inprocess")
+    parser.add_argument("--url", help="servidor ya iniciado; ignora --target")
+    parser.add_argument("--sensors", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10.0, help="segundos")
+    parser.add_argument("--post-ratio", type=float, default=0.5, help="fracción de envíos que son POST")
+    parser.add_argument("--no-follow", dest="follow", action="store_false",
+                        help="no seguir la redirección del POST con un GET /")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pausa media entre envíos de un sensor")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--missing-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--interval", type=float, default=1.0, help="segundos por ventana del informe")
+    parser.add_argument("--write-behind", action="store_true", help="inprocess/serve: create_app WRITE_BEHIND=True")
+    parser.add_argument("--out", type=Path, help="guarda el resultado en JSON")
+    parser.add_argument("--baseline", type=Path, help="JSON de referencia para comparar")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument("--max-error-rate", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    result = run(
+        sensors=args.sensors, duration=args.duration, post_ratio=args.post_ratio, follow=args.follow,
+        think=args.think_ms / 1000, target=args.target, url=args.url, distribution=args.distribution,
+        missing_rate=args.missing_rate, seed=args.seed, interval=args.interval,
+        app_config={"WRITE_BEHIND": True} if args.write_behind else None,
+    )
+    print(format_report(result))
+    if args.out:
+        args.out.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline else None
+    problems = check(result, baseline, args.threshold, args.max_error_rate)
+    for p in problems:
+        print(f"REGRESIÓN {p}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
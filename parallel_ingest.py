@@ -0,0 +1,193 @@
+"""Ingesta paralela de archivos CSV históricos grandes.
+
+Cada archivo se divide en rangos de bytes alineados a inicio de línea. Un
+pool de procesos lee, valida y evalúa cada rango (ingest.evaluate_rows) y
+devuelve lotes compactos (tuplas); el proceso principal es el único
+escritor: reconstruye los registros y los guarda con
+database.save_full_records en el mismo orden del archivo, de modo que la
+base resultante coincide fila por fila con una carga secuencial.
+
+Supone el formato de data/initial_data.csv: una fila por línea, sin saltos
+de línea dentro de campos entre comillas.
+"""
+import csv
+import io
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from acquisition_module import RowError
+from database import save_full_records
+from inference_engine import AirExpertEngine
+from ingest import evaluate_rows
+
+log = logging.getLogger(__name__)
+
+Range = Tuple[int, int]
+
+# Orden de los valores en cada fila compacta que viaja entre procesos.
+_MEDIDA = ("pm2_5", "pm10", "no2", "co", "o3", "so2")
+_CONDICION = ("temperatura", "humedad", "v_viento")
+_CONTEXTO = ("zona", "hora", "evento_biomasa", "quality_level")
+
+
+def read_header(path: Path) -> Tuple[List[str], int]:
+    """Devuelve (columnas, offset en bytes donde empiezan los datos)."""
+    with open(path, "rb") as f:
+        line = f.readline()
+        header = next(csv.reader([line.decode("utf-8")]), [])
+        return header, f.tell()
+
+
+def split_ranges(path: Path, block_bytes: int, data_start: int = 0) -> List[Range]:
+    """Divide [data_start, tamaño) en rangos de ~block_bytes que empiezan y
+    terminan en un límite de línea."""
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as f:
+        start = data_start
+        while start < size:
+            f.seek(min(start + block_bytes, size))
+            if f.tell() < size:
+                f.readline()
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+_engine: Optional[AirExpertEngine] = None
+
+
+def _init_worker(rules_path: Optional[Path]) -> None:
+    global _engine
+    _engine = AirExpertEngine(rules_path=rules_path, reload_interval=None)
+
+
+def _compact(record) -> tuple:
+    medida, condicion, contexto = record
+    return (
+        tuple(medida[k] for k in _MEDIDA)
+        + tuple(condicion[k] for k in _CONDICION)
+        + tuple(contexto[k] for k in _CONTEXTO)
+    )
+
+
+def _expand(row: tuple):
+    n, m = len(_MEDIDA), len(_MEDIDA) + len(_CONDICION)
+    return (
+        dict(zip(_MEDIDA, row[:n])),
+        dict(zip(_CONDICION, row[n:m])),
+        dict(zip(_CONTEXTO, row[m:])),
+    )
+
+
+def _process_range(path: Path, header: Sequence[str], span: Range, chunk_size: int):
+    """Trabajo de un proceso del pool: lee, valida y evalúa un rango.
+
+    Devuelve (filas leídas, filas compactas, errores con fila local, pid, segundos).
+    """
+    t0 = time.perf_counter()
+    if _engine is None:
+        _init_worker(None)
+    start, end = span
+    with open(path, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8")
+    reader = csv.DictReader(io.StringIO(text, newline=""), fieldnames=list(header))
+    rows = list(reader)
+    compact, errors = [], []
+    for i in range(0, len(rows), chunk_size):
+        records, errs = evaluate_rows(rows[i:i + chunk_size], _engine, offset=i)
+        compact.extend(_compact(r) for r in records)
+        errors.extend(errs)
+    return len(rows), compact, errors, os.getpid(), time.perf_counter() - t0
+
+
+@dataclass
+class IngestStats:
+    rows: int = 0
+    saved: int = 0
+    errors: List[RowError] = field(default_factory=list)
+    elapsed: float = 0.0
+    # pid → [filas, segundos de trabajo]
+    workers: Dict[int, List[float]] = field(default_factory=dict)
+
+    @property
+    def rate(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def worker_rates(self) -> Dict[int, float]:
+        """Filas por segundo de trabajo de cada proceso."""
+        return {pid: (n / s if s else 0.0) for pid, (n, s) in self.workers.items()}
+
+
+def _tasks(paths: Sequence[Path], block_bytes: int) -> Iterator[Tuple[Path, List[str], Range]]:
+    for path in paths:
+        header, data_start = read_header(path)
+        for span in split_ranges(path, block_bytes, data_start):
+            yield path, header, span
+
+
+def ingest_files(
+    paths: Sequence[Path],
+    workers: Optional[int] = None,
+    block_bytes: int = 8 << 20,
+    chunk_size: int = 5000,
+    rules_path: Optional[Path] = None,
+    on_progress: Optional[Callable[[IngestStats], None]] = None,
+) -> IngestStats:
+    """Carga los CSV de `paths` en SQLite evaluando en `workers` procesos.
+
+    Los resultados se guardan en el orden del archivo; los errores de
+    validación se informan con el índice de fila de datos de su archivo.
+    workers=0 procesa todo en el proceso actual.
+    """
+    paths = [Path(p) for p in paths]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    stats = IngestStats()
+    t0 = time.perf_counter()
+    file_rows: Dict[Path, int] = {}
+
+    def collect(path: Path, result) -> None:
+        nrows, compact, errors, pid, seconds = result
+        base = file_rows.get(path, 0)
+        file_rows[path] = base + nrows
+        stats.saved += save_full_records((_expand(r) for r in compact), chunk_size=chunk_size)
+        for e in errors:
+            e = RowError(e.row + base, e.field, e.value, e.type, e.message)
+            log.warning("%s fila %d: %s=%r %s", path, e.row, e.field, e.value, e.message)
+            stats.errors.append(e)
+        stats.rows += nrows
+        busy = stats.workers.setdefault(pid, [0, 0.0])
+        busy[0] += nrows
+        busy[1] += seconds
+        stats.elapsed = time.perf_counter() - t0
+        log.info("%s: %d filas (%.0f filas/s)", path, stats.rows, stats.rate)
+        if on_progress is not None:
+            on_progress(stats)
+
+    if workers <= 0:
+        _init_worker(rules_path)
+        for path, header, span in _tasks(paths, block_bytes):
+            collect(path, _process_range(path, header, span, chunk_size))
+        return stats
+
+    # Ventana acotada de rangos en vuelo: memoria constante y orden de escritura.
+    pending = deque()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(rules_path,)) as pool:
+        for path, header, span in _tasks(paths, block_bytes):
+            pending.append((path, pool.submit(_process_range, path, header, span, chunk_size)))
+            if len(pending) >= 2 * workers:
+                path_done, fut = pending.popleft()
+                collect(path_done, fut.result())
+        while pending:
+            path_done, fut = pending.popleft()
+            collect(path_done, fut.result())
+    return stats
@@ -0,0 +1,116 @@
+"""Reevaluación (backfill) de las lecturas guardadas con las reglas actuales.
+
+quality_level se fija al guardar cada lectura; si cambian air_rules.json o
+los tramos del AQI, las etiquetas antiguas quedan desactualizadas. rescore()
+recorre cada archivo de la base (la viva y los meses archivados) por id en
+bloques, los evalúa con engine.evaluate_batch y reescribe solo las
+etiquetas que cambiaron, moviendo también sus conteos en rollup_calidad.
+
+El avance se guarda en db_meta (clave CHECKPOINT_KEY) en la misma
+transacción que cada bloque, así que el trabajo se puede interrumpir y
+retomar. Si las reglas cambian entre dos ejecuciones, empieza de nuevo.
+
+Uso desde la terminal:
+
+    flask --app app rescore --chunk-size 5000
+"""
+import hashlib
+import json
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import database
+from inference_engine import LEVELS, AirExpertEngine
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_KEY = "rescore_checkpoint"
+
+# Columna de CONTEXT_COLUMNS que alimenta cada campo de Fact.
+_FACT_COLUMNS = {
+    "PM2_5_24h": "pm2_5", "PM10_24h": "pm10", "NO2_24h": "no2", "O3_8h": "o3",
+    "SO2_24h": "so2", "CO_24h": "co", "temp": "temperatura", "rh": "humedad",
+}
+_COL = {name: i for i, name in enumerate(database.CONTEXT_COLUMNS)}
+
+
+@dataclass
+class RescoreReport:
+    scanned: int = 0
+    # (nivel anterior, nivel nuevo) → lecturas
+    transitions: Dict[Tuple[Optional[str], str], int] = field(default_factory=dict)
+    resumed: bool = False
+
+    @property
+    def changed(self) -> int:
+        return sum(self.transitions.values())
+
+    def changed_by_level(self) -> Dict[str, int]:
+        """Etiquetas cambiadas por nivel nuevo."""
+        out: Dict[str, int] = {}
+        for (_, new), n in self.transitions.items():
+            out[new] = out.get(new, 0) + n
+        return out
+
+
+def rules_fingerprint(engine: AirExpertEngine) -> str:
+    """Huella de las reglas vigentes del motor."""
+    raw = json.dumps(engine.rules, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _labels(engine: AirExpertEngine, rows: List[tuple]) -> List[str]:
+    columns = {
+        fact: np.array([r[_COL[col]] for r in rows], dtype=float)
+        for fact, col in _FACT_COLUMNS.items()
+    }
+    return [LEVELS[i] for i in engine.evaluate_batch(columns).levels.tolist()]
+
+
+def rescore(
+    engine: Optional[AirExpertEngine] = None,
+    chunk_size: int = 5000,
+    restart: bool = False,
+    on_chunk: Optional[Callable[[RescoreReport], None]] = None,
+) -> RescoreReport:
+    """Reevalúa todas las lecturas guardadas y corrige las etiquetas que
+    cambiaron. Retoma desde el último bloque confirmado salvo restart=True.
+
+    Las reglas quedan fijas durante todo el trabajo (engine.pinned()): si
+    air_rules.json cambia a mitad, el resto se evalúa con las mismas y un
+    rescore posterior aplica las nuevas desde el principio."""
+    engine = (engine or AirExpertEngine(reload_interval=None)).pinned()
+    fingerprint = rules_fingerprint(engine)
+    saved = json.loads(database.get_meta(CHECKPOINT_KEY) or "{}")
+    report = RescoreReport()
+    if restart or saved.get("reglas") != fingerprint:
+        checkpoint = {"reglas": fingerprint}
+    else:
+        checkpoint = saved
+        report.resumed = len(saved) > 1
+
+    for path in database.database_files():
+        key = path.name
+        last_id = checkpoint.get(key, 0)
+        while True:
+            rows = database.fetch_readings_after(last_id, chunk_size, path)
+            if not rows:
+                break
+            changes = [
+                (r[0], r[_COL["zona"]], r[_COL["hora"]], r[_COL["quality_level"]], label)
+                for r, label in zip(rows, _labels(engine, rows))
+                if label != r[_COL["quality_level"]]
+            ]
+            last_id = checkpoint[key] = rows[-1][0]
+            database.update_quality_levels(changes, path, meta=(CHECKPOINT_KEY, json.dumps(checkpoint)))
+            report.scanned += len(rows)
+            for transition, n in Counter((old, new) for *_, old, new in changes).items():
+                report.transitions[transition] = report.transitions.get(transition, 0) + n
+            log.info("%s: hasta id %d, %d lecturas, %d etiquetas cambiadas", key, last_id, report.scanned, report.changed)
+            if on_chunk is not None:
+                on_chunk(report)
+    return report
@@ -0,0 +1,57 @@
+"""Política de retención de data/air_data.db.
+
+- archive_after_days: los meses completos anteriores a (ahora - N días) se
+  mueven a un archivo SQLite por mes (database.archive_month); las consultas
+  de database.py siguen viéndolos.
+- raw_retention_days: las filas crudas anteriores a (ahora - N días) se
+  borran y quedan solo sus agregados horarios/diarios (rollups).
+- Después se devuelve el espacio libre con PRAGMA incremental_vacuum.
+
+Uso desde la terminal:
+
+    flask --app app retention --archive-after-days 90 --raw-retention-days 730
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import database
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class RetentionPolicy:
+    archive_after_days: Optional[int] = 90
+    raw_retention_days: Optional[int] = None  # None: las filas crudas se conservan siempre
+    vacuum_pages: Optional[int] = None  # páginas a liberar por archivo; None = todas
+
+
+@dataclass
+class RetentionReport:
+    archived: Dict[str, int] = field(default_factory=dict)  # mes → filas movidas
+    downsampled: int = 0
+    freed_pages: int = 0
+
+
+def apply_retention(policy: RetentionPolicy = RetentionPolicy(), now: Optional[datetime] = None) -> RetentionReport:
+    """Aplica la política: archiva meses fríos, borra filas crudas antiguas
+    y libera espacio. Se puede ejecutar repetidamente (es idempotente)."""
+    now = now or datetime.now()
+    report = RetentionReport()
+
+    if policy.archive_after_days is not None:
+        limit = now - timedelta(days=policy.archive_after_days)
+        first_open_month = limit.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        for mes in database.unarchived_months(first_open_month):
+            report.archived[mes] = database.archive_month(mes)
+            log.info("Mes %s archivado: %d filas", mes, report.archived[mes])
+
+    if policy.raw_retention_days is not None:
+        cutoff = now - timedelta(days=policy.raw_retention_days)
+        report.downsampled = database.drop_raw_before(cutoff)
+        log.info("Filas crudas anteriores a %s borradas: %d", cutoff.date(), report.downsampled)
+
+    report.freed_pages = database.incremental_vacuum(policy.vacuum_pages)
+    return report
@@ -0,0 +1,112 @@
+"""Generador de lecturas sintéticas con el formato de data/initial_data.csv.
+
+Lo usan los benchmarks y el generador de carga para producir datos con
+distribuciones realistas (log-normal para contaminantes) o uniformes.
+"""
+import csv
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence
+
+import numpy as np
+
+ZONES = ("Centro", "Norte", "Sur", "Este", "Oeste")
+
+CSV_COLUMNS = [
+    "zona", "hora", "evento_biomasa",
+    "PM2_5_24h", "PM10_24h", "NO2_24h", "O3_8h", "SO2_24h", "CO_24h",
+    "temp", "rh",
+]
+
+# Mediana y dispersión (sigma del log) de cada contaminante, en µg/m³.
+_LOGNORMAL = {
+    "PM2_5_24h": (15.0, 0.8),
+    "PM10_24h": (30.0, 0.7),
+    "NO2_24h": (20.0, 0.6),
+    "O3_8h": (60.0, 0.5),
+    "SO2_24h": (10.0, 0.8),
+    "CO_24h": (800.0, 0.6),
+}
+_UNIFORM = {
+    "PM2_5_24h": (0.0, 150.0),
+    "PM10_24h": (0.0, 200.0),
+    "NO2_24h": (0.0, 100.0),
+    "O3_8h": (0.0, 200.0),
+    "SO2_24h": (0.0, 80.0),
+    "CO_24h": (0.0, 6000.0),
+}
+DISTRIBUTIONS = ("lognormal", "uniform")
+
+
+def generate_columns(
+    n: int,
+    zones: Sequence[str] = ZONES,
+    distribution: str = "lognormal",
+    missing_rate: float = 0.0,
+    biomass_rate: float = 0.1,
+    seed: Optional[int] = 0,
+) -> Dict[str, np.ndarray]:
+    """Genera `n` lecturas como columnas NumPy (NaN = valor faltante)."""
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"distribution debe ser una de {DISTRIBUTIONS}")
+    rng = np.random.default_rng(seed)
+    cols: Dict[str, np.ndarray] = {
+        "zona": np.asarray(zones, dtype=object)[rng.integers(0, len(zones), n)],
+        "evento_biomasa": (rng.random(n) < biomass_rate).astype(np.int64),
+    }
+    for name in _LOGNORMAL:
+        if distribution == "lognormal":
+            median, sigma = _LOGNORMAL[name]
+            values = rng.lognormal(np.log(median), sigma, n)
+        else:
+            values = rng.uniform(*_UNIFORM[name], n)
+        cols[name] = values.round(1)
+    cols["temp"] = rng.normal(20.0, 6.0, n).round(1)
+    cols["rh"] = rng.uniform(15.0, 95.0, n).round(1)
+    if missing_rate:
+        for name in list(_LOGNORMAL) + ["temp", "rh"]:
+            cols[name][rng.random(n) < missing_rate] = np.nan
+    return cols
+
+
+def generate_rows(
+    n: int,
+    zones: Sequence[str] = ZONES,
+    distribution: str = "lognormal",
+    missing_rate: float = 0.0,
+    seed: Optional[int] = 0,
+    start: Optional[datetime] = None,
+    step: timedelta = timedelta(minutes=1),
+    block: int = 10000,
+) -> Iterator[Dict[str, str]]:
+    """Genera `n` filas tipo CSV (valores como texto, "" = faltante) por bloques."""
+    start = start or datetime(2025, 1, 1)
+    rng = np.random.default_rng(seed)
+    done = 0
+    while done < n:
+        size = min(block, n - done)
+        cols = generate_columns(size, zones, distribution, missing_rate, seed=rng.integers(2**32))
+        for i in range(size):
+            row = {
+                "zona": cols["zona"][i],
+                "hora": (start + step * (done + i)).isoformat(timespec="seconds"),
+                "evento_biomasa": str(cols["evento_biomasa"][i]),
+            }
+            for name in CSV_COLUMNS[3:]:
+                v = cols[name][i]
+                row[name] = "" if np.isnan(v) else repr(float(v))
+            yield row
+        done += size
+
+
+def write_csv(path: Path, rows) -> int:
+    """Escribe filas de generate_rows en un CSV; devuelve cuántas escribió."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        w.writeheader()
+        for row in rows:
+            w.writerow(row)
+            count += 1
+    return count
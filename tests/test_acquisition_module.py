@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from pydantic import ValidationError
+from acquisition_module import SensorInput, SENSOR_FIELDS, parse_float_column, validate_columns
+
+
+def test_validate_columns_matches_pydantic():
+    rng = np.random.default_rng(11)
+    n = 400
+    text = {}
+    for name in SENSOR_FIELDS:
+        vals = rng.uniform(-20, 130, n).round(1).astype(str).astype(object)
+        vals[rng.random(n) < 0.1] = ""
+        vals[rng.random(n) < 0.02] = "nan"
+        vals[rng.random(n) < 0.02] = "abc"
+        text[name] = vals
+
+    values, present = {}, {}
+    for name in SENSOR_FIELDS:
+        values[name], present[name] = parse_float_column(text[name])
+    check = validate_columns(values, present)
+
+    bad_fields = {}
+    for e in check.errors:
+        bad_fields.setdefault(e.row, set()).add(e.field)
+    for i in range(n):
+        kwargs = {}
+        for name in SENSOR_FIELDS:
+            try:
+                kwargs[name] = float(text[name][i]) if text[name][i] != "" else None
+            except ValueError:
+                kwargs[name] = None
+        try:
+            SensorInput(**kwargs)
+            assert check.valid[i] and i not in bad_fields
+        except ValidationError as exc:
+            assert not check.valid[i]
+            assert bad_fields[i] == {err["loc"][0] for err in exc.errors()}
+
+
+def test_validate_columns_plain_arrays_treat_nan_as_missing():
+    check = validate_columns({"PM2_5_24h": [1.0, None, -1.0], "rh": np.array([50, 101, np.nan])})
+    assert check.valid.tolist() == [True, False, False]
+    assert [(e.row, e.field, e.type) for e in check.errors] == [
+        (1, "rh", "less_than_equal"), (2, "PM2_5_24h", "greater_than_equal"),
+    ]
+    assert np.isnan(check.columns["CO_24h"]).all()
+    with pytest.raises(ValueError):
+        validate_columns({"PM2_5_24h": [1.0], "rh": [1.0, 2.0]})
@@ -1,8 +1,24 @@
+import json
+import pytest
 import types
 import importlib
+from pathlib import Path
 from inference_engine import InferenceResult
 from unittest.mock import MagicMock, patch
 
+
+@pytest.fixture(autouse=True)
+def _isolated(tmp_path, monkeypatch):
+    """Base, log del historial y spill temporales; la app del módulo no siembra."""
+    import app as web
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "air_data.db")
+    monkeypatch.setattr(web, "_db_ready", False)
+    monkeypatch.setattr(web, "HISTORY_LOG", tmp_path / "history_log")
+    monkeypatch.setattr(web, "_history_log", None)
+    monkeypatch.setitem(web.DEFAULT_CONFIG, "WRITE_BEHIND_SPILL_PATH", tmp_path / "write_behind.spill")
+    monkeypatch.setitem(web.app.extensions, "air_seed", web.SeedTask(None))
+
 def test_index_get(monkeypatch):
     import app as web
     dummy_rows = [
@@ -31,11 +47,11 @@ def test_index_post_evaluates_and_saves(monkeypatch):
     def fake_save_full_record(m, c, x):
         called["save"] = True
         return (1, 1, 1)
-    def fake_append_to_csv(m, c, x, label):
+    def fake_append_to_history(m, c, x, label):
         called["csv"] = True
 
     monkeypatch.setattr(web, "save_full_record", fake_save_full_record)
-    monkeypatch.setattr(web, "append_to_csv", fake_append_to_csv)
+    monkeypatch.setattr(web, "append_to_history", fake_append_to_history)
     monkeypatch.setattr(web, "fetch_recent_context", lambda n=10: [])
 
     client = web.app.test_client()
@@ -69,7 +85,7 @@ def test_index_post_calls_engine_and_saves():
 
     with patch("app.engine", mock_engine), \
          patch("app.save_full_record", return_value=(1, 1, 1)) as mock_save, \
-         patch("app.append_to_csv") as mock_csv, \
+         patch("app.append_to_history") as mock_csv, \
          patch("app.fetch_recent_context", return_value=[]):
 
         import app as web
@@ -87,4 +103,324 @@ def test_index_post_calls_engine_and_saves():
         assert res.status_code in (302, 303)
         assert mock_engine.evaluate.called
         assert mock_save.called
-        assert mock_csv.called
\ No newline at end of file
+        assert mock_csv.called
+def test_load_csv_bulk_matches_row_by_row(tmp_path, monkeypatch):
+    import app as web
+    import database as db
+    csv_path = tmp_path / "in.csv"
+    csv_path.write_text(
+        "zona,hora,evento_biomasa,pm25,PM10_24h,NO2_24h,O3_8h,SO2_24h,CO_24h,temp,rh\n"
+        "Centro,2025-10-28 10:00,0,8,20,15,60,10,700,22,50\n"
+        "Sur,2025-10-28 12:00,1,40,48,27,110,35,1800,31,40\n"
+        "Norte,2025-10-28 13:00,0,90,60,35,95,25,2000,28,35\n",
+        encoding="utf-8",
+    )
+    results = []
+    for bulk in (False, True):
+        monkeypatch.setattr(db, "_DB_PATH", tmp_path / f"bulk_{bulk}.db")
+        db.init_db()
+        assert web.load_csv_to_db(csv_path, bulk=bulk, chunk_size=2) == 3
+        results.append([r[1:] for r in db.fetch_recent_context(10)])
+    assert results[0] == results[1]
+    assert [r[3] for r in results[1]] == ["Riesgo alto", "Riesgo moderado", "Buena"]
+
+def test_index_post_write_behind_defers_persistence(monkeypatch):
+    import app as web
+    from write_behind import WriteBehindQueue
+
+    persisted = []
+    writer = WriteBehindQueue(persisted.extend, batch_size=10, flush_interval=0.01)
+    monkeypatch.setattr(web, "save_full_record", lambda *a: pytest.fail("escritura síncrona"))
+    monkeypatch.setattr(web, "fetch_recent_context", lambda n=10: [])
+
+    flask_app = web.create_app({"SEED_CSV": False, "WRITE_BEHIND": True})
+    flask_app.extensions["air_writer"] = writer
+    client = flask_app.test_client()
+    for zona in ("Norte", "Sur"):
+        res = client.post("/", data={"zona": zona, "pm25": "40", "temp": "31"})
+        assert res.status_code in (302, 303)
+    writer.close()
+
+    assert [x["zona"] for _, _, x in persisted] == ["Norte", "Sur"]
+    assert all(x["quality_level"] == "Riesgo moderado" and x["hora"] for _, _, x in persisted)
+
+def test_api_contexto_returns_page_and_cursor(monkeypatch):
+    import app as web
+    captured = {}
+
+    def fake_query(**kwargs):
+        captured.update(kwargs)
+        return [(7, "Norte", "2025-10-01T10:00:00", 0, "Riesgo alto",
+                 80.0, 90.0, 30.0, 1.0, 50.0, 10.0, 25.0, 40.0, None)], ("2025-10-01T10:00:00", 7)
+    monkeypatch.setattr(web, "query_context", fake_query)
+
+    client = web.create_app({"SEED_CSV": False}).test_client()
+    res = client.get("/api/contexto?zona=Norte&quality_level=Riesgo alto&limit=1&cursor=2025-10-02T00:00:00|9")
+    body = res.get_json()
+    assert captured["cursor"] == ("2025-10-02T00:00:00", 9)
+    assert captured["quality_level"] == ["Riesgo alto"]
+    assert body["rows"][0]["zona"] == "Norte" and body["rows"][0]["pm2_5"] == 80.0
+    assert body["next_cursor"] == "2025-10-01T10:00:00|7"
+    assert client.get("/api/contexto?cursor=bad").status_code == 400
+
+def test_api_stats_reads_rollups(monkeypatch):
+    import app as web
+    def fake_rollups(periodo, **kw):
+        if periodo not in ("hora", "dia"):
+            raise ValueError("periodo")
+        return (
+            [("2025-10-01", "Norte", "pm2_5", 4, 100.0, 10.0, 40.0)],
+            [("2025-10-01", "Norte", "Buena", 3), ("2025-10-01", "Norte", "Moderada", 1)],
+        )
+    monkeypatch.setattr(web, "fetch_rollups", fake_rollups)
+    client = web.create_app({"SEED_CSV": False}).test_client()
+    body = client.get("/api/stats?periodo=dia&zona=Norte").get_json()
+    assert body["medidas"][0]["media"] == 25.0
+    assert sum(q["n"] for q in body["calidad"]) == 4
+    assert client.get("/api/stats?periodo=semana").status_code == 400
+
+def test_metrics_endpoint_reports_stages(monkeypatch):
+    import app as web
+    import metrics
+    monkeypatch.setattr(web, "save_full_record", lambda *a: (1, 1, 1))
+    monkeypatch.setattr(web, "append_to_history", lambda *a: None)
+    monkeypatch.setattr(web, "fetch_recent_context", lambda n=10: [])
+    client = web.create_app({"SEED_CSV": False}).test_client()
+    client.post("/", data={"zona": "Norte", "pm25": "12"})
+    client.get("/")
+
+    res = client.get("/metrics")
+    assert res.status_code == 200 and res.mimetype == "text/plain"
+    text = res.get_data(as_text=True)
+    for stage in ("validate", "evaluate", "save", "history", "fetch_history", "render"):
+        assert f'air_stage_seconds_count{{stage="{stage}"}}' in text
+    assert "air_db_connections" in text and "air_write_behind_pending 0" in text
+
+    metrics.set_enabled(False)
+    try:
+        assert client.get("/metrics").status_code == 404
+    finally:
+        metrics.set_enabled(True)
+
+def test_load_csv_bulk_skips_and_reports_invalid_rows(tmp_path, monkeypatch):
+    import app as web
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "invalid.db")
+    db.init_db()
+    csv_path = tmp_path / "in.csv"
+    csv_path.write_text(
+        "zona,pm2_5,rh,evento_biomasa\n"
+        "Centro,8,50,0\n"
+        "Sur,-3,50,0\n"
+        "Norte,12,140,x\n"
+        "Este,40,,1\n",
+        encoding="utf-8",
+    )
+    errors = []
+    assert web.load_csv_to_db(csv_path, bulk=True, errors=errors) == 2
+    assert [(e.row, e.field) for e in errors] == [(1, "PM2_5_24h"), (2, "rh")]
+    assert [r[1] for r in db.fetch_recent_context(10)] == ["Este", "Centro"]
+
+def test_create_app_defers_engine_and_seeds_in_background(tmp_path, monkeypatch):
+    import app as web
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "seed.db")
+    monkeypatch.setattr(web, "_db_ready", False)
+    csv_path = tmp_path / "seed.csv"
+    csv_path.write_text("zona,pm25,rh\nCentro,8,50\nSur,-1,50\nNorte,90,40\n", encoding="utf-8")
+
+    flask_app = web.create_app({"SEED_CSV_PATH": csv_path})
+    app_engine = flask_app.extensions["air_engine"]
+    assert not app_engine.loaded and not (tmp_path / "seed.db").exists()
+
+    client = flask_app.test_client()
+    client.get("/ready")
+    assert flask_app.extensions["air_seed"].wait(10)
+    body = client.get("/ready").get_json()
+    assert body == {"ready": True, "estado": "listo", "filas": 2, "filas_invalidas": 1, "error": None}
+    assert [r[1] for r in db.fetch_recent_context(10)] == ["Norte", "Centro"]
+    assert app_engine.loaded  # la carga inicial usa el motor de la app
+
+def test_post_retries_and_seed_reruns_do_not_duplicate(tmp_path, monkeypatch):
+    import app as web
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "idem.db")
+    monkeypatch.setattr(web, "_db_ready", False)
+    monkeypatch.setattr(web, "append_to_history", lambda *a: None)
+    csv_path = tmp_path / "seed.csv"
+    csv_path.write_text("zona,hora,pm25\nCentro,2025-10-01 10:00,8\nSur,2025-10-01 11:00,90\n", encoding="utf-8")
+
+    flask_app = web.create_app({"SEED_CSV_PATH": csv_path})
+    client = flask_app.test_client()
+    client.get("/ready")
+    assert flask_app.extensions["air_seed"].wait(10)
+    for _ in range(2):
+        client.post("/", data={"zona": "Norte", "pm25": "12"}, headers={"Idempotency-Key": "k-1"})
+    assert [r[1] for r in db.fetch_recent_context(10)] == ["Norte", "Sur", "Centro"]
+
+    assert web.load_csv_to_db(csv_path, bulk=True) == 0
+    assert len(db.fetch_recent_context(10)) == 3
+    monkeypatch.setattr(web, "load_csv_to_db", None)  # mismo archivo: no se vuelve a cargar
+    task = web.SeedTask(csv_path).start()
+    assert task.wait(10) and task.state == "listo"
+
+def test_ready_reports_seed_error(tmp_path, monkeypatch):
+    import app as web
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "empty.db")
+    monkeypatch.setattr(web, "_db_ready", False)
+    flask_app = web.create_app({"SEED_CSV_PATH": tmp_path})  # un directorio: open() falla
+
+    client = flask_app.test_client()
+    client.get("/ready")
+    assert flask_app.extensions["air_seed"].wait(10)
+    res = client.get("/ready")
+    assert res.status_code == 503
+    assert res.get_json()["estado"] == "error" and "IsADirectoryError" in res.get_json()["error"]
+
+def test_index_history_cache_and_conditional_get(tmp_path, monkeypatch):
+    import app as web
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "cache.db")
+    monkeypatch.setattr(web, "_db_ready", False)
+    flask_app = web.create_app({"SEED_CSV": False})
+    calls = []
+    monkeypatch.setattr(web, "fetch_recent_context", lambda n=10: calls.append(n) or db.fetch_recent_context(n))
+
+    client = flask_app.test_client()
+    first = client.get("/")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and len(calls) == 1
+
+    assert client.get("/").status_code == 200 and len(calls) == 1  # fragmento cacheado
+    res = client.get("/", headers={"If-None-Match": etag})
+    assert res.status_code == 304 and res.headers["ETag"] == etag and len(calls) == 1
+
+    db.save_full_record(
+        {"pm2_5": 5.0, "pm10": None, "no2": None, "co": None, "o3": None, "so2": None},
+        {"temperatura": 20.0, "humedad": None, "v_viento": None},
+        {"zona": "Oeste", "quality_level": "Buena"},
+    )
+    res = client.get("/", headers={"If-None-Match": etag})
+    assert res.status_code == 200 and res.headers["ETag"] != etag and len(calls) == 2
+    assert "Oeste" in res.get_data(as_text=True)
+
+def test_index_post_publishes_to_live_stream(tmp_path, monkeypatch):
+    import app as web
+    monkeypatch.setattr(web, "_save_sync", lambda *args: None)
+    monkeypatch.setattr(web.engine, "evaluate", lambda _fact: InferenceResult(
+        label="Riesgo alto", color="red", explanation="x", recommendations=[], alerts=["PM2.5"], aqi_value=180
+    ))
+    flask_app = web.create_app({"SEED_CSV": False, "STREAM_KEEPALIVE": 0.01})
+    client = flask_app.test_client()
+    assert client.get("/api/stream?min_level=Otra").status_code == 400
+
+    res = client.get("/api/stream?zona=Sur&min_level=Moderada")
+    assert res.mimetype == "text/event-stream"
+    body = res.response
+    assert next(body) == b": conectado\n\n"
+    client.post("/", data={"zona": "Sur", "pm25": "150"})
+    event = next(body).decode()
+    assert "\nevent: evaluacion\n" in event
+    data = json.loads(event.split("data: ", 1)[1])
+    assert data["zona"] == "Sur" and data["quality_level"] == "Riesgo alto" and data["alerts"] == ["PM2.5"]
+    assert data["medidas"]["pm2_5"] == 150.0
+    res.close()
+    assert len(flask_app.extensions["air_stream"]) == 0
+
+def test_index_history_cache_sees_writes_from_other_connections(tmp_path, monkeypatch):
+    import sqlite3
+    import app as web
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "shared.db")
+    monkeypatch.setattr(web, "_db_ready", False)
+    client = web.create_app({"SEED_CSV": False}).test_client()
+    etag = client.get("/").headers["ETag"]
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 304
+
+    # Otro proceso (otra conexión, sin pasar por write_version) escribe.
+    other = sqlite3.connect(tmp_path / "shared.db")
+    other.execute("INSERT INTO contexto (zona, hora, quality_level) VALUES ('Lejos', '2025-10-01T10:00:00', 'Buena')")
+    other.commit()
+    other.close()
+    res = client.get("/", headers={"If-None-Match": etag})
+    assert res.status_code == 200 and res.headers["ETag"] != etag
+    assert "Lejos" in res.get_data(as_text=True)
+
+def test_second_app_does_not_reconfigure_the_first(tmp_path, monkeypatch):
+    import app as web
+    import database as db
+    import metrics
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "apps.db")
+    monkeypatch.setattr(web, "_db_ready", False)
+    first = web.create_app({"SEED_CSV": False, "ENGINE_CACHE_SIZE": 64, "WRITE_BEHIND_BATCH_SIZE": 7})
+    second = web.create_app({"SEED_CSV": False, "METRICS": False, "ENGINE_CACHE_SIZE": 0})
+    assert first.extensions["air_writer"].batch_size == 7
+    assert second.extensions["air_writer"].batch_size == web.DEFAULT_CONFIG["WRITE_BEHIND_BATCH_SIZE"]
+
+    assert metrics.enabled()
+    assert first.test_client().get("/metrics").status_code == 200
+    assert second.test_client().get("/metrics").status_code == 404
+    with first.app_context():
+        assert web.engine.get() is first.extensions["air_engine"].get()
+        assert web.engine.get() is not second.extensions["air_engine"].get()
+        assert web.engine.cache_info().maxsize == 64
+
+    gauge = metrics.REGISTRY._metrics["air_stream_subscribers"]
+    before = gauge.fn()
+    first.extensions["air_stream"].subscribe()
+    second.extensions["air_stream"].subscribe()
+    assert gauge.fn() == before + 2
+
+def test_seed_does_not_reload_a_database_created_before_the_fingerprint(tmp_path, monkeypatch):
+    import shutil
+    import app as web
+    import database as db
+    # data/air_data.db viene de la versión sin migraciones ni huella.
+    shutil.copy(Path("data/air_data.db"), tmp_path / "old.db")
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "old.db")
+    monkeypatch.setattr(web, "_db_ready", False)
+    before = len(db.fetch_recent_context(100))
+
+    flask_app = web.create_app({"SEED_CSV_PATH": web.CSV_IN})
+    client = flask_app.test_client()
+    client.get("/ready")
+    assert flask_app.extensions["air_seed"].wait(10)
+    assert client.get("/ready").get_json()["filas"] == 0
+    assert len(db.fetch_recent_context(100)) == before
+    assert db.get_meta("seed_csv") is not None
+
+def test_reloading_a_csv_without_hora_adds_no_rows(tmp_path, monkeypatch):
+    import app as web
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "nohora.db")
+    db.init_db()
+    csv_path = tmp_path / "in.csv"
+    csv_path.write_text("zona,pm25\nCentro,8\nCentro,8\nSur,-1\nNorte,12\n", encoding="utf-8")
+
+    assert web.load_csv_to_db(csv_path, bulk=True, chunk_size=2) == 3
+    assert web.load_csv_to_db(csv_path, bulk=True) == 0
+    assert len(db.fetch_recent_context(10)) == 3
+
+def test_write_behind_apps_persist_to_their_own_database(tmp_path, monkeypatch):
+    import app as web
+    import database as db
+    apps = {}
+    for name in ("a", "b"):
+        monkeypatch.setattr(db, "_DB_PATH", tmp_path / f"{name}.db")
+        db.init_db()
+        apps[name] = web.create_app({
+            "SEED_CSV": False, "WRITE_BEHIND": True, "WRITE_BEHIND_FLUSH_MS": 1,
+            "WRITE_BEHIND_SPILL_PATH": tmp_path / f"{name}.spill",
+        })
+    monkeypatch.setattr(web, "_db_ready", True)
+
+    apps["a"].test_client().post("/", data={"zona": "Norte", "pm25": "12"})
+    apps["b"].test_client().post("/", data={"zona": "Sur", "pm25": "12"})
+    apps["a"].test_client().post("/", data={"zona": "Este", "pm25": "12"})
+    for flask_app in apps.values():
+        flask_app.extensions["air_writer"].close()
+
+    for name, zonas in (("a", ["Este", "Norte"]), ("b", ["Sur"])):
+        monkeypatch.setattr(db, "_DB_PATH", tmp_path / f"{name}.db")
+        assert [r[1] for r in db.fetch_recent_context(10)] == zonas
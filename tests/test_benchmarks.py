@@ -0,0 +1,36 @@
+import json
+from synthetic import generate_columns, generate_rows
+import benchmarks
+
+
+def test_synthetic_rows_are_deterministic_and_configurable():
+    rows = list(generate_rows(25, zones=("A", "B"), distribution="uniform", missing_rate=0.2, seed=3))
+    assert rows == list(generate_rows(25, zones=("A", "B"), distribution="uniform", missing_rate=0.2, seed=3))
+    assert {r["zona"] for r in rows} <= {"A", "B"}
+    assert any(r["PM2_5_24h"] == "" for r in rows)
+    assert rows[1]["hora"] > rows[0]["hora"]
+    cols = generate_columns(1000, seed=1)
+    assert (cols["rh"] >= 0).all() and (cols["rh"] <= 100).all() and (cols["CO_24h"] > 0).all()
+
+
+def test_run_reports_every_hot_path(tmp_path):
+    out = benchmarks.run(rows=40, load_repeats=1, workdir=tmp_path)
+    assert set(out["results"]) == {
+        "SensorInput", "validate_columns", "evaluate", "save_full_record", "fetch_recent_context",
+        "load_csv_to_db", "load_csv_to_db_bulk",
+    }
+    for r in out["results"].values():
+        assert r["throughput"] > 0 and r["p50_us"] <= r["p95_us"] <= r["p99_us"]
+    json.dumps(out)
+
+
+def test_compare_flags_regressions_over_threshold(tmp_path):
+    base = {"results": {"evaluate": {"throughput": 1000.0, "p95_us": 10.0}}}
+    ok = {"results": {"evaluate": {"throughput": 950.0, "p95_us": 10.5}}}
+    slow = {"results": {"evaluate": {"throughput": 800.0, "p95_us": 14.0}}}
+    assert benchmarks.compare(ok, base, threshold=0.10) == []
+    assert len(benchmarks.compare(slow, base, threshold=0.10)) == 2
+
+    (tmp_path / "cur.json").write_text(json.dumps(slow))
+    (tmp_path / "base.json").write_text(json.dumps(base))
+    assert benchmarks.main(["compare", str(tmp_path / "cur.json"), str(tmp_path / "base.json")]) == 1
@@ -0,0 +1,20 @@
+import hashlib
+
+from bloom import BloomFilter
+
+
+def _keys(start, n):
+    return [hashlib.blake2b(str(i).encode(), digest_size=16).digest() for i in range(start, start + n)]
+
+def test_no_false_negatives_and_bounded_false_positives():
+    bf = BloomFilter(10_000, error_rate=0.01)
+    added = _keys(0, 10_000)
+    bf.add_many(added)
+    assert bf.contains_many(added).all() and bf.full
+    assert added[0] in bf
+    assert bf.contains_many(_keys(10_000, 20_000)).mean() < 0.02
+
+def test_empty_filter_rejects_everything():
+    bf = BloomFilter(100)
+    assert not bf.contains_many(_keys(0, 1000)).any()
+    assert len(bf.contains_many([])) == 0
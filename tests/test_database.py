@@ -1,8 +1,11 @@
 from datetime import datetime
 from pathlib import Path
 import importlib
+import pytest
 from unittest.mock import MagicMock, patch
 
+from bloom import BloomFilter
+
 def test_save_and_fetch_roundtrip(tmp_path):
     import database as db
     importlib.reload(db)                
@@ -72,3 +75,278 @@ def test_fetch_recent_context_returns_rows():
         assert rows[0][1] == "Centro" 
         assert rows[0][4] == "Buena"   
 
+
+def test_save_full_records_bulk_links_rows(tmp_path, monkeypatch):
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "bulk.db")
+    db.init_db()
+    db.save_full_record(
+        {"pm2_5": 1, "pm10": 1, "no2": 1, "co": 1, "o3": 1, "so2": 1},
+        {"temperatura": 20, "humedad": 50, "v_viento": None},
+        {"zona": "Sur", "quality_level": "Buena"},
+    )
+
+    records = [
+        (
+            {"pm2_5": float(i), "pm10": 2.0, "no2": 3.0, "co": 4.0, "o3": 5.0, "so2": 6.0},
+            {"temperatura": 20.0 + i, "humedad": 40.0, "v_viento": None},
+            {"zona": f"Z{i}", "hora": f"2025-10-28T1{i}:00:00", "evento_biomasa": 0, "quality_level": "Buena"},
+        )
+        for i in range(5)
+    ]
+    totals = []
+    assert db.save_full_records(iter(records), chunk_size=2, on_chunk=totals.append) == 5
+    assert totals == [2, 4, 5]
+
+    rows = db.fetch_recent_context(5)
+    assert [r[1] for r in rows] == ["Z4", "Z3", "Z2", "Z1", "Z0"]
+    for r in rows:
+        i = int(r[1][1:])
+        assert r[2] == f"2025-10-28T1{i}:00:00"
+        assert r[5] == float(i)
+        assert r[11] == 20.0 + i
+
+def test_pooled_connection_reused_per_thread(tmp_path, monkeypatch):
+    import threading
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "pool.db")
+    db.init_db()
+
+    with db._conn() as c1:
+        pass
+    with db._conn() as c2:
+        assert c2 is c1
+        assert c2.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(db._get_conn()))
+    t.start()
+    t.join()
+    assert other[0] is not c1
+
+    db.configure(synchronous="full")
+    try:
+        with db._conn() as c3:
+            assert c3 is not c1
+            assert c3.execute("PRAGMA synchronous").fetchone()[0] == 2
+    finally:
+        db.configure(synchronous="normal")
+
+def test_reader_not_blocked_by_open_write_transaction(tmp_path, monkeypatch):
+    import threading
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "wal.db")
+    db.init_db()
+    medida = {"pm2_5": 5, "pm10": 5, "no2": 5, "co": 5, "o3": 5, "so2": 5}
+    condicion = {"temperatura": 20, "humedad": 40, "v_viento": None}
+    db.save_full_record(medida, condicion, {"zona": "Centro", "quality_level": "Buena"})
+
+    with db._conn() as writer:
+        writer.execute("BEGIN IMMEDIATE")
+        writer.execute("INSERT INTO condiciones (temperatura) VALUES (1)")
+        seen = []
+        t = threading.Thread(target=lambda: seen.append(len(db.fetch_recent_context(5))))
+        t.start()
+        t.join(timeout=2)
+        assert seen == [1]
+
+def _seed_zones(db):
+    medida = {"pm2_5": 10, "pm10": 10, "no2": 10, "co": 10, "o3": 10, "so2": 10}
+    condicion = {"temperatura": 20, "humedad": 40, "v_viento": None}
+    records = []
+    for day in range(1, 8):
+        for zona, minute, level in (("Norte", "00", "Riesgo alto"), ("Norte", "30", "Buena"), ("Sur", "00", "Riesgo alto")):
+            records.append((medida, condicion, {
+                "zona": zona, "hora": f"2025-10-0{day} 1{day}:{minute}", "quality_level": level,
+            }))
+    db.save_full_records(records)
+
+def test_query_context_filters_and_paginates(tmp_path, monkeypatch):
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "query.db")
+    db.init_db()
+    _seed_zones(db)
+
+    seen, cursor = [], None
+    while True:
+        rows, cursor = db.query_context(
+            zona="Norte", quality_level="Riesgo alto",
+            since="2025-10-02", until="2025-10-07", cursor=cursor, limit=2,
+        )
+        seen.extend(rows)
+        if cursor is None:
+            break
+    assert [r[2] for r in seen] == [f"2025-10-0{d}T1{d}:00:00" for d in (6, 5, 4, 3, 2)]
+    assert {(r[1], r[4]) for r in seen} == {("Norte", "Riesgo alto")}
+
+def test_init_db_migrates_indexes_used_by_queries(tmp_path, monkeypatch):
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "old.db")
+    with db._conn() as c:
+        c.execute("CREATE TABLE contexto (id INTEGER PRIMARY KEY AUTOINCREMENT, zona TEXT, hora DATETIME, "
+                  "evento_biomasa INTEGER NOT NULL DEFAULT 0, quality_level TEXT, medida_id INTEGER, condicion_id INTEGER)")
+    db.init_db()
+    db.init_db()
+    with db._conn() as c:
+        assert c.execute("PRAGMA user_version").fetchone()[0] == len(db._MIGRATIONS)
+        plan = " ".join(r[-1] for r in c.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM contexto ctx WHERE ctx.zona = ? AND ctx.quality_level IN (?) "
+            "AND ctx.hora >= ? ORDER BY ctx.hora DESC, ctx.id DESC", ("Norte", "Riesgo alto", "2025")))
+    assert "idx_contexto_zona_quality_hora" in plan
+    assert "SCAN" not in plan.replace("SCAN ctx USING INDEX", "")
+
+def test_rollups_incremental_match_rebuild(tmp_path, monkeypatch):
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "rollups.db")
+    db.init_db()
+    condicion = {"temperatura": 20, "humedad": 40, "v_viento": None}
+    db.save_full_record({"pm2_5": 10, "pm10": None, "no2": 1, "co": 1, "o3": 1, "so2": 1}, condicion,
+                        {"zona": "Norte", "hora": "2025-10-01 10:15", "quality_level": "Moderada"})
+    db.save_full_records([
+        ({"pm2_5": v, "pm10": 5, "no2": 1, "co": 1, "o3": 1, "so2": 1}, condicion,
+         {"zona": z, "hora": h, "quality_level": q})
+        for v, z, h, q in [
+            (30, "Norte", "2025-10-01 10:45", "Buena"),
+            (5, "Norte", "2025-10-01 11:05", "Buena"),
+            (70, None, "2025-10-02 09:00", "Riesgo alto"),
+        ]
+    ], chunk_size=2)
+
+    incremental = db.fetch_rollups("hora"), db.fetch_rollups("dia")
+    db.rebuild_rollups()
+    assert (db.fetch_rollups("hora"), db.fetch_rollups("dia")) == incremental
+
+    metrics, quality = db.fetch_rollups("hora", zona="Norte", since="2025-10-01T10:00", until="2025-10-01T11:00")
+    assert ("2025-10-01T10", "Norte", "pm2_5", 2, 40.0, 10.0, 30.0) in metrics
+    assert not any(m[2] == "pm10" and m[3] != 1 for m in metrics)
+    assert sorted(quality) == [("2025-10-01T10", "Norte", "Buena", 1), ("2025-10-01T10", "Norte", "Moderada", 1)]
+
+    metrics, quality = db.fetch_rollups("dia", since="2025-10-02")
+    assert {m[1] for m in metrics} == {""} and quality == [("2025-10-02", "", "Riesgo alto", 1)]
+
+def _layout_snapshot(db):
+    return (
+        db.fetch_recent_context(100),
+        db.query_context(zona="Norte", since="2025-10-03", limit=4),
+        [r for chunk in db.iter_context_chunks(chunk_size=5) for r in chunk],
+        [r[:1] + r[2:] for r in db.fetch_last_measurements(5)],
+        db.fetch_rollups("hora"),
+    )
+
+def test_wide_layout_serves_the_same_results(tmp_path, monkeypatch):
+    import database as db
+    condicion = {"temperatura": 21, "humedad": None, "v_viento": 3}
+    extra = ({"pm2_5": 33, "pm10": None, "no2": 1, "co": 1, "o3": 1, "so2": 1}, condicion,
+             {"zona": None, "hora": "2025-10-04 08:30", "quality_level": "Moderada"})
+    snapshots = []
+    for name, layout, without_rowid in (("n", None, False), ("w", db.WIDE, False), ("wr", db.WIDE, True)):
+        monkeypatch.setattr(db, "_DB_PATH", tmp_path / f"{name}.db")
+        db.init_db(layout=layout, without_rowid=without_rowid)
+        _seed_zones(db)
+        ids = db.save_full_record(*extra)
+        snapshots.append(_layout_snapshot(db))
+        assert db.storage_layout() == (layout or db.NORMALIZED)
+    assert snapshots[0] == snapshots[1] == snapshots[2]
+    assert ids == (22, 22, 22)
+    with db._conn() as c:
+        assert c.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'contexto'").fetchone()[0] == 0
+        plan = " ".join(r[-1] for r in c.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM lecturas WHERE zona = ? AND hora >= ? ORDER BY hora", ("Norte", "2025")))
+    assert "COVERING INDEX idx_lecturas_zona_hora" in plan
+
+def test_migrate_layout_round_trip_with_archives(tmp_path, monkeypatch):
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "mig.db")
+    db.init_db()
+    _seed_zones(db)
+    db.archive_month("2025-10")
+    db.save_full_record({"pm2_5": 1, "pm10": 1, "no2": 1, "co": 1, "o3": 1, "so2": 1},
+                        {"temperatura": 1, "humedad": 1, "v_viento": None},
+                        {"zona": "Este", "hora": "2025-11-02 10:00", "quality_level": "Buena"})
+    before = _layout_snapshot(db)
+
+    assert db.migrate_layout(db.WIDE, without_rowid=True) == 2
+    assert db.storage_layout() == db.WIDE and _layout_snapshot(db) == before
+    assert db.save_full_record({"pm2_5": 2}, {}, {"zona": "Este", "hora": "2025-11-03"})[0] == 23
+    db.rebuild_rollups()
+    assert db.migrate_layout(db.WIDE, without_rowid=True) == 0
+
+    assert db.migrate_layout(db.NORMALIZED) == 2
+    assert db.storage_layout() == db.NORMALIZED
+    assert _layout_snapshot(db)[2][1:] == before[2]
+    assert db.fetch_recent_context(1)[0][:3] == (23, "Este", "2025-11-03T00:00:00")
+
+@pytest.mark.parametrize("layout", ["normalized", "wide"])
+def test_saves_are_idempotent(tmp_path, monkeypatch, layout):
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "idem.db")
+    db.init_db(layout=layout)
+    _seed_zones(db)
+    medida = {"pm2_5": 5, "pm10": 5, "no2": 5, "co": 5, "o3": 5, "so2": 5}
+    condicion = {"temperatura": 20, "humedad": 40, "v_viento": None}
+    record = (medida, condicion, {"zona": "Este", "hora": "2025-11-02 10:00", "quality_level": "Buena"})
+
+    ids = db.save_full_record(*record)
+    assert db.save_full_record(*record) == ids
+    # Reintentos con la misma clave del cliente, aunque cambie el contenido.
+    keyed = db.save_full_record(medida, condicion, {"zona": "Este", "idempotency_key": "abc"})
+    assert db.save_full_record(dict(medida, pm2_5=6), condicion, {"idempotency_key": "abc"}) == keyed
+
+    db.archive_month("2025-10")
+    new = (medida, condicion, {"zona": "Sur", "hora": "2025-11-03 10:00"})
+    assert db.save_full_records([record, new, new]) == 1
+    _seed_zones(db)  # ya archivadas: no vuelven
+    assert len(db.fetch_recent_context(100)) == 24
+
+    # Filtro sin las claves (guardadas por otro proceso): la tabla las detecta.
+    monkeypatch.setitem(db._seen, str(tmp_path / "idem.db"), BloomFilter(10))
+    assert db.save_full_record(*record) == ids
+    assert db.save_full_records([new]) == 0
+    assert len(db.fetch_recent_context(100)) == 24
+
+def test_records_without_hora_or_key_are_never_merged(tmp_path, monkeypatch):
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "nohora.db")
+    db.init_db()
+    medida = {"pm2_5": 5, "pm10": 5, "no2": 5, "co": 5, "o3": 5, "so2": 5}
+    condicion = {"temperatura": 20, "humedad": 40, "v_viento": None}
+
+    assert db.save_full_record(medida, condicion, {"zona": "Este"}) != db.save_full_record(medida, condicion, {"zona": "Este"})
+    assert db.save_full_records([(medida, condicion, {"zona": "Este"})] * 2) == 2
+    assert len(db.fetch_recent_context(10)) == 4
+    with db._conn() as c:
+        assert c.execute("SELECT COUNT(*) FROM claves_idempotencia").fetchone()[0] == 0
+
+def test_chunk_that_keeps_conflicting_is_not_counted(tmp_path, monkeypatch):
+    import sqlite3
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "conflict.db")
+    db.init_db()
+
+    def conflict(cur, chunk):
+        raise sqlite3.IntegrityError("UNIQUE constraint failed")
+
+    monkeypatch.setattr(db, "_insert_chunk", conflict)
+    record = ({"pm2_5": 5}, {}, {"zona": "Este", "hora": "2025-11-02 10:00"})
+    with pytest.raises(sqlite3.IntegrityError):
+        db.save_full_records([record])
+    with db._conn() as c:
+        assert db.idempotency_key(*record) not in db._seen_keys(c)
+    assert db.fetch_recent_context(10) == []
+
+def test_migration_backfills_idempotency_keys(tmp_path, monkeypatch):
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "old.db")
+    db.init_db()
+    _seed_zones(db)
+    with db._conn() as c:
+        c.execute("DELETE FROM claves_idempotencia")
+        c.execute("PRAGMA user_version = 3")
+        c.commit()
+    db._seen.clear()
+
+    db.init_db()
+    with db._conn() as c:
+        assert c.execute("SELECT COUNT(*) FROM claves_idempotencia").fetchone()[0] == 21
+    _seed_zones(db)
+    assert len(db.fetch_recent_context(100)) == 21
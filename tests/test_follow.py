@@ -0,0 +1,56 @@
+import os
+
+from inference_engine import AirExpertEngine
+
+
+def _setup(tmp_path, monkeypatch):
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "follow.db")
+    db.init_db()
+    return db, AirExpertEngine(reload_interval=None)
+
+def _zonas(db):
+    return [r[1] for r in db.fetch_recent_context(100)][::-1]
+
+def test_follow_ingests_only_appended_complete_lines(tmp_path, monkeypatch):
+    from follow import follow_once
+    db, engine = _setup(tmp_path, monkeypatch)
+    feed = tmp_path / "feed.csv"
+    feed.write_text("zona,hora,pm25\nCentro,2025-10-01 10:00,8\nSur,2025-10-01 11:", encoding="utf-8")
+
+    stats = follow_once(feed, engine)
+    assert (stats.rows, stats.saved) == (1, 1)
+    with open(feed, "a", encoding="utf-8") as f:
+        f.write("00,90\nNorte,,-5\n\nEste,,12\n")
+    stats = follow_once(feed, engine, chunk_size=2)
+    assert (stats.rows, stats.saved) == (3, 2)
+    assert stats.errors[0].field == "PM2_5_24h" and stats.errors[0].row == feed.read_bytes().index(b"Norte")
+    assert _zonas(db) == ["Centro", "Sur", "Este"]
+    assert follow_once(feed, engine).rows == 0
+
+    # Se perdió el punto de control tras guardar: las filas no se duplican.
+    with db._conn() as c:
+        c.execute("DELETE FROM seguimiento_csv")
+    assert follow_once(feed, engine).saved == 0
+    cp = db.get_follow_checkpoint(str(feed.resolve()))
+    assert cp.posicion == os.path.getsize(feed) and cp.cabecera == "zona,hora,pm25"
+
+def test_follow_handles_truncation_and_rotation(tmp_path, monkeypatch):
+    from follow import follow_once
+    db, engine = _setup(tmp_path, monkeypatch)
+    feed = tmp_path / "feed.csv"
+    feed.write_text("zona,pm25\nCentro,8\nSur,9\n", encoding="utf-8")
+    follow_once(feed, engine)
+
+    feed.write_text("zona,pm25\nNorte,10\n", encoding="utf-8")  # truncado y reescrito
+    stats = follow_once(feed, engine)
+    assert (stats.truncations, stats.saved) == (1, 1)
+
+    with open(feed, "a", encoding="utf-8") as f:
+        f.write("Este,11\n")
+    feed.rename(tmp_path / "feed.csv.1")
+    feed.write_text("zona,pm25\nOeste,12\n", encoding="utf-8")
+    stats = follow_once(feed, engine)
+    assert (stats.rotations, stats.saved) == (1, 2)
+    assert _zonas(db) == ["Centro", "Sur", "Norte", "Este", "Oeste"]
+    assert db.get_follow_checkpoint(str(feed.resolve())).generacion == 2
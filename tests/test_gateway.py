@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+
+from inference_engine import AirExpertEngine
+
+
+def test_tcp_lines_are_evaluated_saved_and_answered_in_order(tmp_path, monkeypatch):
+    import app as web
+    import database as db
+    import history_log
+    from gateway import Gateway
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "gw.db")
+    monkeypatch.setattr(web, "HISTORY_LOG", tmp_path / "history_log")
+    monkeypatch.setattr(web, "_history_log", None)
+    db.init_db()
+
+    async def scenario():
+        gateway = await Gateway(AirExpertEngine(reload_interval=None), max_delay=0.01).start(port=0)
+        reader, writer = await asyncio.open_connection("127.0.0.1", gateway.tcp_port)
+        writer.write(
+            b'{"zona": "Centro", "pm25": 8, "temp": 22, "idempotency_key": "s1-1"}\n'
+            b'zona="San Miguel" pm25=90 rh=40\n'
+            b"zona=Sur pm25=-3\n"
+            b"esto no es una lectura\n"
+            b'{"zona": "Centro", "pm25": 8, "temp": 22, "idempotency_key": "s1-1"}\n'
+        )
+        await writer.drain()
+        replies = [await asyncio.wait_for(reader.readline(), 5) for _ in range(5)]
+        writer.close()
+        await gateway.close()
+        return gateway.stats, replies
+
+    stats, replies = asyncio.run(scenario())
+    assert json.loads(replies[0]) == {"ok": True, "quality_level": "Buena"}
+    assert replies[1].startswith(b"ok ") and replies[2].startswith(b"error PM2_5_24h")
+    assert replies[3].startswith(b"error formato") and replies[4] == replies[0]
+    assert (stats.lines, stats.saved, stats.invalid, stats.connections) == (5, 3, 2, 0)
+    assert [r[1] for r in db.fetch_recent_context(10)] == ["San Miguel", "Centro"]
+    web.get_history_log().close()
+    zonas = history_log.zone_names(tmp_path / "history_log")
+    assert sorted(zonas[s["zona"]] for seg in history_log.read_segments(tmp_path / "history_log") for s in seg) == [
+        "Centro", "San Miguel"]
+
+def test_udp_datagrams_are_dropped_when_the_queue_is_full(tmp_path):
+    from gateway import Gateway
+    saved, release = [], threading.Event()
+
+    def slow_save(records):
+        release.wait(5)
+        saved.extend(records)
+
+    async def scenario():
+        gateway = Gateway(AirExpertEngine(reload_interval=None), batch_size=1, max_delay=0,
+                          max_pending=2, save=slow_save)
+        await gateway.start(port=0, udp_port=0)
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=("127.0.0.1", gateway.udp_port))
+        for i in range(10):
+            transport.sendto(f"zona=Z{i} pm25=10\n".encode())
+            await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.sleep(0.05)
+        transport.close()
+        await gateway.close()
+        return gateway.stats
+
+    stats = asyncio.run(scenario())
+    assert stats.lines == 10 and stats.dropped > 0
+    assert stats.saved == len(saved) == 10 - stats.dropped
+
+def test_batches_are_evaluated_off_the_event_loop(monkeypatch):
+    import gateway
+    threads, evaluate_rows = [], gateway.evaluate_rows
+
+    def evaluate(rows, engine):
+        threads.append(threading.current_thread().name)
+        return evaluate_rows(rows, engine)
+
+    monkeypatch.setattr(gateway, "evaluate_rows", evaluate)
+
+    async def scenario():
+        gw = await gateway.Gateway(AirExpertEngine(reload_interval=None), max_delay=0,
+                                   save=lambda records: None).start(port=0)
+        reader, writer = await asyncio.open_connection("127.0.0.1", gw.tcp_port)
+        writer.write(b"zona=Centro pm25=8\n")
+        await writer.drain()
+        await asyncio.wait_for(reader.readline(), 5)
+        writer.close()
+        await gw.close()
+
+    asyncio.run(scenario())
+    assert threads and all(name.startswith("air-gateway-eval") for name in threads)
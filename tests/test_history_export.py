@@ -0,0 +1,69 @@
+import csv
+import gzip
+import io
+import pytest
+
+
+@pytest.fixture
+def seeded_db(tmp_path, monkeypatch):
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "export.db")
+    db.init_db()
+    records = [
+        (
+            {"pm2_5": 10.0 + i, "pm10": None, "no2": 3.0, "co": 4.0, "o3": 5.0, "so2": 6.0},
+            {"temperatura": 20.0, "humedad": 40.0 + i, "v_viento": None},
+            {"zona": None if i == 3 else f"Z{i % 3}", "hora": f"2025-10-28T10:{i:02d}:00",
+             "evento_biomasa": i % 2, "quality_level": "Buena"},
+        )
+        for i in range(7)
+    ]
+    db.save_full_records(records)
+    return db
+
+
+def test_csv_and_gzip_exports_match_table(seeded_db, tmp_path):
+    from history_export import export_history
+    expected = seeded_db.fetch_recent_context(100)
+
+    assert export_history(tmp_path / "out.csv", chunk_size=3) == 7
+    assert export_history(tmp_path / "out.csv.gz", chunk_size=3) == 7
+
+    plain = (tmp_path / "out.csv").read_bytes().decode("utf-8")
+    assert gzip.decompress((tmp_path / "out.csv.gz").read_bytes()).decode("utf-8") == plain
+    rows = list(csv.reader(io.StringIO(plain)))
+    assert rows[0][:3] == ["id", "zona", "hora"]
+    assert [int(r[0]) for r in rows[1:]] == [r[0] for r in expected]
+
+
+def test_npz_and_arrow_exports_are_columnar(seeded_db, tmp_path):
+    import numpy as np
+    from history_export import export_history, load_npz
+
+    assert export_history(tmp_path / "out.npz", chunk_size=2, limit=5) == 5
+    cols = load_npz(tmp_path / "out.npz")
+    assert cols["id"].tolist() == [7, 6, 5, 4, 3]
+    assert cols["zona"].tolist() == ["Z0", "Z2", "Z1", "", "Z2"]
+    assert np.isnan(cols["pm10"]).all()
+    assert cols["humedad"].tolist() == [46.0, 45.0, 44.0, 43.0, 42.0]
+
+    pa = pytest.importorskip("pyarrow")
+    export_history(tmp_path / "out.arrow", chunk_size=3)
+    with pa.ipc.open_stream((tmp_path / "out.arrow").read_bytes()) as reader:
+        table = reader.read_all()
+    assert table.num_rows == 7
+    assert table.column("pm2_5").to_pylist()[0] == 16.0
+
+
+def test_export_endpoint_streams_download(seeded_db):
+    import app as web
+    client = web.create_app({"SEED_CSV": False}).test_client()
+    res = client.get("/export?format=csv.gz")
+    assert res.status_code == 200
+    assert res.is_streamed
+    assert "historial.csv.gz" in res.headers["Content-Disposition"]
+    assert len(gzip.decompress(res.data).decode().splitlines()) == 8
+    assert client.get("/export?format=xml").status_code == 400
+    for bad in ("limit=-1", "limit=x", "chunk=0", "chunk=-5"):
+        assert client.get(f"/export?format=csv&{bad}").status_code == 400
+    assert len(client.get("/export?format=csv&limit=3&chunk=2").data.decode().splitlines()) == 4
@@ -0,0 +1,83 @@
+import csv
+
+import numpy as np
+import pytest
+
+import history_log as hl
+
+
+def _row(i, zona="Centro", level="Buena"):
+    return {
+        "timestamp": f"2024-03-01T10:00:{i:02d}", "zona": zona, "evento_biomasa": i % 2,
+        "quality_level": level, "pm2_5": 10.5 + i, "pm10": 20.0, "no2": None, "o3": 30.25,
+        "so2": 5.0, "co": 0.1, "temp": 22.0, "rh": 40.0, "v_viento": None,
+    }
+
+
+def test_append_rotates_segments_and_maps_records(tmp_path):
+    log = hl.HistoryLog(tmp_path, segment_records=3)
+    log.append([_row(0), _row(1, "Norte", "Riesgo alto")])
+    log.append([_row(i, None, None) for i in range(2, 7)])
+    log.close()
+
+    assert [p.name for p in hl.segments(tmp_path)] == [f"seg-00000{n}.airlog" for n in (1, 2, 3)]
+    segs = list(hl.read_segments(tmp_path))
+    assert [len(s) for s in segs] == [3, 3, 1]
+    assert isinstance(segs[0], np.memmap)
+    data = np.concatenate(segs)
+    assert data.dtype == hl.RECORD and data.dtype.itemsize == 84
+    assert data["pm2_5"].tolist() == [10.5 + i for i in range(7)]
+    assert np.isnan(data["no2"]).all()
+    assert hl.zone_names(tmp_path)[data["zona"]].tolist() == ["Centro", "Norte"] + [None] * 5
+    assert data["quality_level"].tolist() == [0, 3] + [-1] * 5
+    assert str(data["timestamp"][6]) == "2024-03-01T10:00:06"
+
+
+def test_reopen_drops_torn_record_and_converts_to_csv(tmp_path):
+    log = hl.HistoryLog(tmp_path)
+    log.append([_row(0), _row(1, "Sur", "Moderada")])
+    log.close()
+    seg = hl.segments(tmp_path)[0]
+    with open(seg, "ab") as f:
+        f.write(b"\x01" * 10)  # escritura interrumpida
+
+    log = hl.HistoryLog(tmp_path)
+    log.append([_row(2, None, None)])
+    log.close()
+    assert len(hl.read_segment(seg)) == 3
+
+    out = tmp_path / "history.csv"
+    assert hl.to_csv(tmp_path, out) == 3
+    with open(out, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == hl.CSV_HEADERS
+    assert rows[1] == ["2024-03-01T10:00:00", "Centro", "0", "Buena", "10.5", "20.0", "", "30.25", "5.0", "0.1", "22.0", "40.0", ""]
+    assert rows[2][1:4] == ["Sur", "1", "Moderada"]
+    assert rows[3][1:4] == ["", "0", ""]
+
+def test_writers_of_the_same_directory_share_zones_and_segments(tmp_path):
+    a = hl.HistoryLog(tmp_path, segment_records=2)
+    b = hl.HistoryLog(tmp_path, segment_records=2)  # como otro proceso
+    a.append([_row(0, "Centro")])
+    b.append([_row(1, "Norte"), _row(2, "Centro")])
+    a.append([_row(3, "Sur")])
+    b.append([_row(4, "Norte")])
+    a.close()
+    b.close()
+
+    assert len(hl.segments(tmp_path)) == 3
+    data = np.concatenate(list(hl.read_segments(tmp_path)))
+    assert data["pm2_5"].tolist() == [10.5 + i for i in range(5)]
+    assert hl.zone_names(tmp_path)[data["zona"]].tolist() == ["Centro", "Norte", "Centro", "Sur", "Norte"]
+
+
+def test_values_that_do_not_fit_the_record_are_rejected(tmp_path, monkeypatch):
+    log = hl.HistoryLog(tmp_path)
+    bad = dict(_row(1), evento_biomasa=300)
+    with pytest.raises(ValueError, match="evento_biomasa"):
+        log.append([_row(0), bad])
+    monkeypatch.setattr(hl, "MAX_ZONES", 1)
+    with pytest.raises(ValueError, match="zonas"):
+        log.append([_row(0, "Centro"), _row(1, "Norte")])
+    log.close()
+    assert sum(len(s) for s in hl.read_segments(tmp_path)) == 0
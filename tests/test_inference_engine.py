@@ -38,4 +38,98 @@ def test_aqi_riesgo_moderado_y_alto():
         res1 = eng.evaluate(Fact(PM2_5_24h=40))
         res2 = eng.evaluate(Fact(PM2_5_24h=80))
         assert res1.label == "Riesgo moderado"
-        assert res2.label == "Riesgo alto"
\ No newline at end of file
+        assert res2.label == "Riesgo alto"
+
+def test_evaluate_batch_matches_scalar():
+    import numpy as np
+    with patch("builtins.open", mock_open(read_data=json.dumps(MOCK_RULES))):
+        eng = AirExpertEngine()
+    rng = np.random.default_rng(7)
+    n = 500
+    pm25 = rng.uniform(0, 200, n).round(1)
+    pm25[:12] = [0, 9, 9.05, 9.1, 35.4, 35.45, 35.5, 55.4, 55.5, 125.4, 125.5, 12.1]
+    cols = {
+        "PM2_5_24h": [None if i % 17 == 0 else v for i, v in enumerate(pm25)],
+        "PM10_24h": rng.uniform(0, 100, n),
+        "NO2_24h": rng.uniform(0, 50, n),
+        "CO_24h": rng.uniform(0, 6000, n),
+        "temp": rng.uniform(10, 40, n),
+    }
+    batch = eng.evaluate_batch(cols)
+    assert len(batch) == n
+    for i in range(n):
+        fact = Fact(**{k: (None if v[i] is None else float(v[i])) for k, v in cols.items()})
+        res = eng.evaluate(fact)
+        assert batch.labels[i] == res.label
+        assert batch.colors[i] == res.color
+        expected_aqi = -1 if res.aqi_value is None else res.aqi_value
+        assert batch.aqi_values[i] == expected_aqi
+        assert bin(int(batch.alert_mask[i])).count("1") == len(res.alerts)
+
+def test_rules_compiled_and_hot_reloaded(tmp_path):
+    import os
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps(MOCK_RULES), encoding="utf-8")
+    eng = AirExpertEngine(rules_path=rules_path, reload_interval=0)
+    assert eng.compiled.alert_fields[0] == "PM2_5_24h"
+    assert eng.compiled.recommendations[0] == ("Actividades sin restricciones.",)
+    assert eng.evaluate(Fact(NO2_24h=30)).alerts
+
+    changed = dict(MOCK_RULES, umbrales_OMS=dict(MOCK_RULES["umbrales_OMS"], NO2_24h=50),
+                   breakpoints_AQI_PM2_5=[[0, 20, 0, 50], [20.1, 40, 51, 100]])
+    rules_path.write_text(json.dumps(changed), encoding="utf-8")
+    st = os.stat(rules_path)
+    os.utime(rules_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    res = eng.evaluate(Fact(PM2_5_24h=15, NO2_24h=30))
+    assert res.alerts == () and res.label == "Buena"
+
+    rules_path.write_text("{ roto", encoding="utf-8")
+    os.utime(rules_path, ns=(st.st_atime_ns, st.st_mtime_ns + 2 * 10**9))
+    assert eng.reload_if_changed() is False
+    assert eng.evaluate(Fact(PM2_5_24h=15)).label == "Buena"
+    assert eng.evaluate(Fact(PM2_5_24h=45)).aqi_value == 201
+
+def test_evaluation_cache_hits_and_invalidation(tmp_path):
+    import dataclasses
+    import os
+    import pytest
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps(MOCK_RULES), encoding="utf-8")
+    eng = AirExpertEngine(rules_path=rules_path, reload_interval=0, cache_size=2, cache_precision=1)
+
+    first = eng.evaluate(Fact(PM2_5_24h=20.04, NO2_24h=30))
+    again = eng.evaluate(Fact(PM2_5_24h=19.96, NO2_24h=30.0))
+    assert again is first
+    assert first == AirExpertEngine(rules_path=rules_path).evaluate(Fact(PM2_5_24h=20.0, NO2_24h=30.0))
+    assert eng.cache_info().hits == 1 and eng.cache_info().misses == 1
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        first.label = "otra"
+
+    eng.evaluate(Fact(PM2_5_24h=1))
+    eng.evaluate(Fact(PM2_5_24h=2))
+    assert eng.cache_info().currsize == 2
+
+    rules_path.write_text(json.dumps(dict(MOCK_RULES, umbrales_OMS={"NO2_24h": 50})), encoding="utf-8")
+    st = os.stat(rules_path)
+    os.utime(rules_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    res = eng.evaluate(Fact(PM2_5_24h=20.04, NO2_24h=30))
+    assert res.alerts == () and res is not first
+    assert eng.cache_info().currsize == 1
+
+def test_result_is_compact_and_renders_text_lazily():
+    from inference_engine import InferenceResult
+    with patch("builtins.open", mock_open(read_data=json.dumps(MOCK_RULES))):
+        eng = AirExpertEngine()
+    fact = Fact(PM2_5_24h=40, NO2_24h=30, temp=33)
+    res = eng.evaluate(fact)
+    assert not hasattr(res, "__dict__")
+    assert (res.label, res.level, res.aqi_value) == ("Riesgo moderado", 2, 112) and res._text is None
+    assert res.alert_mask == int(eng.evaluate_batch({k: [v] for k, v in vars(fact).items() if v}).alert_mask[0])
+
+    assert res.explanation == (
+        "AQI PM2.5 = 112 basado en concentración de 40 µg/m³. | "
+        "PM2_5_24h supera el umbral OMS (40 > 15). | NO2_24h supera el umbral OMS (30 > 25)."
+    )
+    assert res.alerts[-1] == "Condiciones calurosas con alta concentración de partículas."
+    assert res.recommendations == ("Evitar ejercicio intenso.", "Evite actividades al aire libre prolongadas.")
+    assert res == InferenceResult(res.label, res.color, res.explanation, res.recommendations, res.alerts, 112)
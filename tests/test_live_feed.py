@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from live_feed import BroadcastHub, HubFull
+
+
+def _event(zona, level):
+    return {"zona": zona, "quality_level": level}
+
+
+def test_publish_filters_by_zone_and_minimum_level():
+    hub = BroadcastHub()
+    todos = hub.subscribe()
+    norte = hub.subscribe(zona="Norte")
+    riesgo = hub.subscribe(min_level="Riesgo moderado")
+
+    assert hub.publish(_event("Norte", "Buena")) == 2
+    assert hub.publish(_event("Sur", "Riesgo alto")) == 2
+
+    def zonas(sub):
+        out = []
+        while (msg := sub.get(0)) is not None:
+            out.append(json.loads(msg.split("data: ", 1)[1])["zona"])
+        return out
+
+    assert zonas(todos) == ["Norte", "Sur"]
+    assert zonas(norte) == ["Norte"]
+    assert zonas(riesgo) == ["Sur"]
+    with pytest.raises(ValueError):
+        hub.subscribe(min_level="Pésima")
+
+
+def test_slow_subscriber_is_dropped_without_blocking_others():
+    hub = BroadcastHub(max_subscribers=2, max_queue=2)
+    slow, fast = hub.subscribe(), hub.subscribe()
+    with pytest.raises(HubFull):
+        hub.subscribe()
+
+    body = hub.stream(fast, keepalive=0.01)
+    assert next(body) == ": conectado\n\n"
+    for i in range(3):
+        hub.publish(_event("Centro", "Buena"))
+        assert next(body).startswith(f"id: {i + 1}\n")
+
+    assert slow.dropped and len(hub) == 1
+    assert list(hub.stream(slow, keepalive=0.01))[-1].startswith("event: descartado")
+    assert next(body) == ": keepalive\n\n"
+    body.close()
+    assert len(hub) == 0
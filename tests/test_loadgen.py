@@ -0,0 +1,33 @@
+import json
+
+import database
+import loadgen
+
+
+def test_inprocess_run_reports_totals_and_timeline(tmp_path):
+    saved = database._DB_PATH
+    out = loadgen.run(sensors=3, duration=30, post_ratio=0.5, max_requests=10, interval=0.05, workdir=tmp_path)
+    assert database._DB_PATH == saved
+
+    res = out["results"]
+    posts = res["post"]["ops"]
+    assert 0 < posts < 30 and res["get"]["ops"] == 30  # cada POST sigue la redirección con un GET
+    assert res["all"]["ops"] == 30 + posts and res["all"]["error_rate"] == 0.0
+    assert res["all"]["p50_us"] <= res["all"]["p95_us"] <= res["all"]["p99_us"] <= res["all"]["max_us"]
+    assert sum(w["ops"] for w in out["timeline"]) == res["all"]["ops"]
+    assert out["writes"] == {"posts_ok": posts, "inserted": posts}
+    assert loadgen.check(out, out, max_error_rate=0.0) == []
+    json.dumps(out)
+
+
+def test_serve_target_and_capacity_checks(tmp_path):
+    out = loadgen.run(sensors=2, duration=30, post_ratio=1.0, follow=False, max_requests=5,
+                      target="serve", workdir=tmp_path)
+    assert out["results"]["post"]["ops"] == 10 and out["results"]["get"]["ops"] == 0
+    assert out["results"]["all"]["error_rate"] == 0.0
+    assert out["writes"]["inserted"] == 10
+
+    failing = {"results": {"all": dict(out["results"]["all"], error_rate=0.2)}}
+    faster = {"results": {"all": dict(out["results"]["all"], throughput=out["results"]["all"]["throughput"] * 2)}}
+    assert len(loadgen.check(failing, max_error_rate=0.01)) == 1
+    assert len(loadgen.check(out, faster, threshold=0.10)) == 1
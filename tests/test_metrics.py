@@ -0,0 +1,34 @@
+import metrics
+
+
+def test_histogram_and_counter_exposition():
+    reg = metrics.Registry()
+    h = reg.histogram("t_seconds", "tiempo", buckets=(0.1, 1.0))
+    c = reg.counter("t_total", "conteo")
+    reg.gauge("t_gauge", "gauge", lambda: 3)
+    h.observe(0.05, stage="a")
+    h.observe(0.5, stage="a")
+    h.observe(5.0, stage="a")
+    c.inc(level="Buena")
+    c.inc(2, level="Buena")
+
+    text = reg.render()
+    assert 't_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 't_seconds_bucket{stage="a",le="1.0"} 2' in text
+    assert 't_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 't_seconds_count{stage="a"} 3' in text
+    assert 't_total{level="Buena"} 3' in text
+    assert "# TYPE t_gauge gauge\nt_gauge 3" in text
+
+
+def test_disabled_metrics_are_noops():
+    metrics.set_enabled(False)
+    try:
+        before = metrics.STAGE_SECONDS.count(stage="off")
+        ctx = metrics.stage("off")
+        assert ctx is metrics.stage("otra")
+        with ctx:
+            pass
+        assert metrics.STAGE_SECONDS.count(stage="off") == before
+    finally:
+        metrics.set_enabled(True)
@@ -0,0 +1,55 @@
+import database as db
+from synthetic import generate_rows, write_csv
+from parallel_ingest import ingest_files, split_ranges, read_header
+
+
+def _dump():
+    with db._conn() as c:
+        return c.execute(
+            "SELECT x.*, m.id, m.pm2_5, m.pm10, m.no2, m.co, m.o3, m.so2, k.* FROM contexto x JOIN medidas m ON m.id = x.medida_id "
+            "JOIN condiciones k ON k.id = x.condicion_id ORDER BY x.id"
+        ).fetchall()
+
+
+def _write_archive(path, n, seed):
+    rows = list(generate_rows(n, missing_rate=0.05, seed=seed))
+    rows[7]["PM2_5_24h"] = "-4"
+    rows[n - 3]["rh"] = "130"
+    write_csv(path, rows)
+
+
+def test_split_ranges_cover_file_on_line_boundaries(tmp_path):
+    path = tmp_path / "a.csv"
+    _write_archive(path, 200, seed=1)
+    header, start = read_header(path)
+    assert header[:3] == ["zona", "hora", "evento_biomasa"]
+    ranges = split_ranges(path, 700, start)
+    data = path.read_bytes()
+    assert ranges[0][0] == start and ranges[-1][1] == len(data)
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert all(data[s - 1:s] == b"\n" for s, _ in ranges)
+
+
+def test_parallel_ingest_matches_sequential_load(tmp_path, monkeypatch):
+    import app as web
+    paths = [tmp_path / "a.csv", tmp_path / "b.csv"]
+    _write_archive(paths[0], 300, seed=2)
+    _write_archive(paths[1], 120, seed=3)
+
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "seq.db")
+    db.init_db()
+    seq_errors = []
+    for p in paths:
+        web.load_csv_to_db(p, bulk=True, chunk_size=50, errors=seq_errors)
+    expected = _dump()
+
+    for workers in (0, 2):
+        monkeypatch.setattr(db, "_DB_PATH", tmp_path / f"par{workers}.db")
+        db.init_db()
+        seen = []
+        stats = ingest_files(paths, workers=workers, block_bytes=2048, chunk_size=50,
+                             on_progress=lambda s: seen.append(s.rows))
+        assert _dump() == expected
+        assert stats.rows == 420 and stats.saved == len(expected) == 416
+        assert [(e.row, e.field) for e in stats.errors] == [(e.row, e.field) for e in seq_errors]
+        assert seen[-1] == 420 and sum(n for n, _ in stats.workers.values()) == 420
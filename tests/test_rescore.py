@@ -0,0 +1,134 @@
+import json
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+import database as db
+from inference_engine import AirExpertEngine, Fact
+from rescore import CHECKPOINT_KEY, rescore
+from retention import RetentionPolicy, apply_retention
+
+
+def _seed(n=200):
+    start = datetime(2025, 1, 1)
+    db.save_full_records([
+        (
+            {"pm2_5": float(i % 90), "pm10": 20.0, "no2": None, "co": 1.0, "o3": 30.0, "so2": 2.0},
+            {"temperatura": 20.0, "humedad": 40.0, "v_viento": None},
+            {"zona": ("Norte", "Sur")[i % 2], "hora": start + timedelta(hours=13 * i),
+             "evento_biomasa": 0, "quality_level": "Buena"},  # etiquetas desactualizadas
+        )
+        for i in range(n)
+    ], chunk_size=64)
+
+
+def _expected(engine):
+    rows = [r for chunk in db.iter_context_chunks() for r in chunk]
+    return {r[0]: engine.evaluate(Fact(PM2_5_24h=r[5], PM10_24h=r[6], NO2_24h=r[7], CO_24h=r[8],
+                                       O3_8h=r[9], SO2_24h=r[10], temp=r[11], rh=r[12])).label
+            for r in rows}
+
+
+@pytest.mark.parametrize("layout", ["normalized", "wide"])
+def test_rescore_fixes_labels_and_rollups_across_archives(tmp_path, monkeypatch, layout):
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "live.db")
+    db.init_db(layout=layout)
+    _seed()
+    apply_retention(RetentionPolicy(archive_after_days=30), now=datetime(2025, 3, 20))
+    assert db.archived_partitions()
+    engine = AirExpertEngine(reload_interval=None)
+    expected = _expected(engine)
+
+    report = rescore(engine, chunk_size=37)
+    assert report.scanned == 200
+    assert report.changed == sum(label != "Buena" for label in expected.values()) > 0
+    assert all(old == "Buena" for old, _ in report.transitions)
+    assert {r[0]: r[4] for chunk in db.iter_context_chunks() for r in chunk} == expected
+
+    rollups = db.fetch_rollups("dia")
+    db.rebuild_rollups()
+    assert db.fetch_rollups("dia") == rollups
+    assert rescore(engine).scanned == 0
+
+
+def test_rescore_resumes_from_checkpoint_and_restarts_on_new_rules(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "live.db")
+    db.init_db()
+    _seed()
+    engine = AirExpertEngine(reload_interval=None)
+
+    def interrupt(report):
+        if report.scanned >= 100:
+            raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        rescore(engine, chunk_size=50, on_chunk=interrupt)
+    assert json.loads(db.get_meta(CHECKPOINT_KEY))["live.db"] == 100
+
+    report = rescore(engine, chunk_size=50)
+    assert report.resumed and report.scanned == 100
+    assert {r[0]: r[4] for chunk in db.iter_context_chunks() for r in chunk} == _expected(engine)
+
+    rules = json.loads(Path("data/air_rules.json").read_text(encoding="utf-8"))
+    rules["breakpoints_AQI_PM2_5"][0][1] = 6.0  # "Buena" termina antes
+    rules["breakpoints_AQI_PM2_5"][1][0] = 6.1
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps(rules), encoding="utf-8")
+    stricter = AirExpertEngine(rules_path=rules_path, reload_interval=None)
+
+    report = rescore(stricter, chunk_size=50)
+    assert not report.resumed and report.scanned == 200
+    assert set(report.transitions) == {("Buena", "Moderada")}
+    assert {r[0]: r[4] for chunk in db.iter_context_chunks() for r in chunk} == _expected(stricter)
+
+
+def test_rescore_keeps_the_same_rules_when_the_file_changes_midway(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "live.db")
+    db.init_db()
+    _seed()
+    rules = json.loads(Path("data/air_rules.json").read_text(encoding="utf-8"))
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps(rules), encoding="utf-8")
+    engine = AirExpertEngine(rules_path=rules_path, reload_interval=0)
+    expected = _expected(engine)
+
+    def edit_rules(report):
+        if report.scanned == 50:
+            rules["breakpoints_AQI_PM2_5"][0][1] = 6.0
+            rules["breakpoints_AQI_PM2_5"][1][0] = 6.1
+            rules_path.write_text(json.dumps(rules), encoding="utf-8")
+            mtime = rules_path.stat().st_mtime_ns + 10**9
+            os.utime(rules_path, ns=(mtime, mtime))
+    rescore(engine, chunk_size=50, on_chunk=edit_rules)
+    assert {r[0]: r[4] for chunk in db.iter_context_chunks() for r in chunk} == expected
+    assert engine.reload_interval == 0  # el motor compartido sigue recargando
+
+    report = rescore(engine, chunk_size=50)
+    assert not report.resumed and report.scanned == 200
+    assert set(report.transitions) == {("Buena", "Moderada")}
+
+
+def test_reloading_a_file_after_new_rules_and_rescore_adds_no_rows(tmp_path, monkeypatch):
+    import app as web
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "live.db")
+    db.init_db()
+    csv_path = tmp_path / "feed.csv"
+    csv_path.write_text(
+        "zona,hora,pm25,temp\n" + "".join(f"Z{i % 3},2025-10-01 {i:02d}:00,{i + 4},20\n" for i in range(12)),
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(web, "engine", AirExpertEngine(reload_interval=None))
+    assert web.load_csv_to_db(csv_path, bulk=True) == 12
+
+    rules = json.loads(Path("data/air_rules.json").read_text(encoding="utf-8"))
+    rules["breakpoints_AQI_PM2_5"][0][1] = 6.0
+    rules["breakpoints_AQI_PM2_5"][1][0] = 6.1
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps(rules), encoding="utf-8")
+    stricter = AirExpertEngine(rules_path=rules_path, reload_interval=None)
+    monkeypatch.setattr(web, "engine", stricter)
+    assert web.load_csv_to_db(csv_path, bulk=True) == 0  # etiquetas distintas, mismas lecturas
+    assert rescore(stricter).changed > 0
+    assert web.load_csv_to_db(csv_path, bulk=True) == 0
+    assert len(db.fetch_recent_context(100)) == 12
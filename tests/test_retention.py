@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import database as db
+from retention import RetentionPolicy, apply_retention
+
+
+def _seed(n=240):
+    start = datetime(2025, 1, 1)
+    records = []
+    for i in range(n):
+        hora = start + timedelta(hours=13 * i)  # ~4.3 meses
+        records.append((
+            {"pm2_5": float(i % 50), "pm10": 20.0, "no2": None, "co": 1.0, "o3": 30.0, "so2": 2.0},
+            {"temperatura": 20.0, "humedad": 40.0, "v_viento": None},
+            {"zona": ("Norte", "Sur", "Centro")[i % 3], "hora": hora,
+             "evento_biomasa": 0, "quality_level": ("Buena", "Moderada")[i % 2]},
+        ))
+    # una lectura tardía de enero que llega al final
+    records.append((records[5][0], records[5][1], dict(records[5][2], zona="Este")))
+    db.save_full_records(records, chunk_size=64)
+    return len(records)
+
+
+def _snapshot():
+    pages, cursor = [], None
+    while True:
+        rows, cursor = db.query_context(zona="Norte", since="2025-01-20", limit=17, cursor=cursor)
+        pages.append(rows)
+        if cursor is None:
+            break
+    return {
+        "recent": db.fetch_recent_context(30),
+        "all": [r for chunk in db.iter_context_chunks(chunk_size=50) for r in chunk],
+        "limited": [r for chunk in db.iter_context_chunks(chunk_size=7, limit=20) for r in chunk],
+        "pages": pages,
+        "until": db.query_context(until="2025-02-15", limit=5)[0],
+        "measurements": db.fetch_last_measurements(300),
+        "rollups": db.fetch_rollups("hora"),
+    }
+
+
+def test_archived_months_stay_visible_to_queries(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "live.db")
+    db.init_db()
+    total = _seed()
+    before = _snapshot()
+
+    report = apply_retention(RetentionPolicy(archive_after_days=30), now=datetime(2025, 4, 20))
+    assert sorted(report.archived) == ["2025-01", "2025-02"]
+    assert sum(report.archived.values()) == len(before["all"]) - len(db.query_context(since="2025-03-01", limit=1000)[0])
+    assert (tmp_path / "live_archive" / "2025-01.db").exists()
+    with db._conn() as c:
+        assert c.execute("SELECT COUNT(*) FROM contexto WHERE hora < '2025-03'").fetchone()[0] == 0
+
+    assert _snapshot() == before
+    db.rebuild_rollups()
+    assert db.fetch_rollups("hora") == before["rollups"]
+    assert apply_retention(RetentionPolicy(archive_after_days=30), now=datetime(2025, 4, 20)).archived == {}
+    assert len(before["all"]) == total
+
+
+def test_downsampling_keeps_rollups_and_frees_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "live.db")
+    db.init_db()
+    _seed()
+    rollups = db.fetch_rollups("dia")
+    with db._conn() as c:
+        assert c.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+    policy = RetentionPolicy(archive_after_days=60, raw_retention_days=70)
+    report = apply_retention(policy, now=datetime(2025, 5, 1, 15))
+    assert report.downsampled > 0 and report.freed_pages > 0
+    assert [p.mes for p in db.archived_partitions()] == ["2025-02"]
+    assert not (tmp_path / "live_archive" / "2025-01.db").exists()
+    oldest = [r[2] for chunk in db.iter_context_chunks() for r in chunk]
+    assert min(oldest) >= "2025-02-20T00:00:00"
+
+    assert db.fetch_rollups("dia") == rollups
+    db.rebuild_rollups()
+    assert db.fetch_rollups("dia") == rollups
@@ -0,0 +1,92 @@
+import queue
+import threading
+import pytest
+from write_behind import WriteBehindQueue
+
+
+def test_batches_by_size_and_flushes_on_close():
+    batches = []
+    wb = WriteBehindQueue(batches.append, batch_size=3, flush_interval=5)
+    for i in range(7):
+        wb.submit(i)
+    wb.close()
+    assert [len(b) for b in batches[:2]] == [3, 3]
+    assert sum(batches, []) == list(range(7))
+    assert wb.written == 7 and not wb.running
+
+
+def test_flush_interval_commits_partial_batch():
+    batches = []
+    wb = WriteBehindQueue(batches.append, batch_size=100, flush_interval=0.01).start()
+    wb.submit("a")
+    wb.submit("b")
+    wb.flush()
+    assert sum(batches, []) == ["a", "b"]
+    wb.close()
+
+
+def test_full_queue_applies_backpressure():
+    gate = threading.Event()
+    wb = WriteBehindQueue(lambda batch: gate.wait(), max_size=1, batch_size=1, flush_interval=0)
+    wb.submit(1)
+    wb.submit(2, timeout=1)
+    with pytest.raises(queue.Full):
+        wb.submit(3, timeout=0.05)
+    gate.set()
+    wb.close()
+    assert wb.written == 2
+
+
+def test_failed_batch_is_counted_and_writer_keeps_running():
+    calls = []
+
+    def persist(batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            raise RuntimeError("disk full")
+
+    wb = WriteBehindQueue(persist, batch_size=1, flush_interval=0, retries=0)
+    wb.submit("x")
+    wb.submit("y")
+    wb.close()
+    assert wb.failed == 1 and wb.written == 1
+
+
+def test_failed_batch_is_retried_and_reaches_the_database(tmp_path, monkeypatch):
+    import database as db
+    monkeypatch.setattr(db, "_DB_PATH", tmp_path / "wb.db")
+    db.init_db()
+    calls = []
+
+    def persist(records):
+        calls.append(len(records))
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        db.save_full_records(records)
+
+    wb = WriteBehindQueue(persist, batch_size=10, flush_interval=0.01, retry_backoff=0)
+    for zona in ("Centro", "Sur"):
+        wb.submit(({"pm2_5": 8.0}, {}, {"zona": zona, "quality_level": "Buena"}))
+    wb.close()
+    assert calls == [2, 2] and (wb.retried, wb.written, wb.failed) == (1, 2, 0)
+    assert sorted(r[1] for r in db.fetch_recent_context(10)) == ["Centro", "Sur"]
+
+
+def test_exhausted_batches_are_spilled_and_replayed_on_start(tmp_path):
+    spill = tmp_path / "wb.spill"
+
+    def broken(batch):
+        raise OSError("disk full")
+
+    wb = WriteBehindQueue(broken, batch_size=2, flush_interval=5, retries=1,
+                          retry_backoff=0, spill_path=spill)
+    for i in range(3):
+        wb.submit(i)
+    wb.close()
+    assert (wb.retried, wb.spilled, wb.failed) == (2, 3, 0)
+
+    batches = []
+    wb = WriteBehindQueue(batches.append, spill_path=spill).start()
+    wb.submit(3)
+    wb.close()
+    assert batches == [[0, 1], [2], [3]] and not spill.exists()
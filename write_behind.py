@@ -0,0 +1,183 @@
+import logging
+import os
+import pickle
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator, List, Optional, Union
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Cola acotada en memoria con un hilo escritor que persiste por lotes.
+
+    - persist: función que recibe una lista de registros y los guarda
+    - max_size: capacidad de la cola; al llenarse submit() espera (backpressure)
+    - batch_size: el escritor confirma cada `batch_size` registros...
+    - flush_interval: ...o cada `flush_interval` segundos, lo que ocurra antes
+    - retries: reintentos de un lote cuyo persist() falla, esperando
+      `retry_backoff` segundos y el doble en cada reintento
+    - spill_path: archivo donde se anexan (pickle) los lotes que agotan los
+      reintentos; start() los vuelve a persistir antes que lo nuevo. Sin
+      archivo esos lotes se pierden y se cuentan en `failed`.
+
+    persist() puede recibir dos veces el mismo lote (un reintento tras un
+    fallo a medias), así que debe ser idempotente.
+    """
+
+    def __init__(
+        self,
+        persist: Callable[[List[Any]], None],
+        max_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.05,
+        retries: int = 3,
+        retry_backoff: float = 0.1,
+        spill_path: Optional[Union[str, Path]] = None,
+    ):
+        self.persist = persist
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.spill_path = Path(spill_path) if spill_path is not None else None
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.retried = 0
+        self.spilled = 0
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "WriteBehindQueue":
+        with self._lock:
+            if not self.running:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, record: Any, timeout: Optional[float] = None) -> None:
+        """Encola un registro. Si la cola está llena espera hasta `timeout`
+        segundos (None = sin límite) y luego lanza queue.Full."""
+        if not self.running:
+            self.start()
+        self._queue.put(record, timeout=timeout)
+
+    def flush(self) -> None:
+        """Bloquea hasta que todo lo encolado haya sido persistido."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Persiste lo pendiente y detiene el hilo escritor."""
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        self._replay()
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch: List[Any]) -> None:
+        delay = self.retry_backoff
+        for attempt in range(self.retries + 1):
+            try:
+                self.persist(batch)
+            except Exception:
+                if attempt == self.retries:
+                    log.exception("No se pudo persistir un lote de %d registros", len(batch))
+                    break
+                log.warning("Falló persistir un lote de %d registros; reintento en %.2f s",
+                            len(batch), delay, exc_info=True)
+                self.retried += 1
+                time.sleep(delay)
+                delay *= 2
+            else:
+                self.written += len(batch)
+                self.batches += 1
+                return
+        self._spill(batch)
+
+    def _spill(self, batch: List[Any]) -> None:
+        if self.spill_path is not None:
+            try:
+                with open(self.spill_path, "ab") as f:
+                    pickle.dump(batch, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception:
+                log.exception("No se pudo guardar el lote en %s", self.spill_path)
+            else:
+                self.spilled += len(batch)
+                log.warning("Lote de %d registros guardado en %s", len(batch), self.spill_path)
+                return
+        self.failed += len(batch)
+
+    def _replay(self) -> None:
+        """Vuelve a persistir los lotes de spill_path. Se leen desde una copia
+        renombrada para que los que fallen otra vez vayan a un archivo nuevo."""
+        if self.spill_path is None:
+            return
+        replay = self.spill_path.with_name(self.spill_path.name + ".replay")
+        if not replay.exists():
+            try:
+                os.replace(self.spill_path, replay)
+            except FileNotFoundError:
+                return
+        try:
+            for batch in _read_spill(replay):
+                self._write(batch)
+            replay.unlink()
+        except Exception:
+            log.exception("No se pudo releer %s", replay)
+
+
+def _read_spill(path: Path) -> Iterator[List[Any]]:
+    """Lotes de un archivo de spill; un último lote a medio escribir se ignora."""
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+            except pickle.UnpicklingError:
+                log.warning("%s: lote incompleto al final, se descarta", path)
+                return